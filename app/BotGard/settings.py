@@ -142,6 +142,48 @@ else:
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # rendered list cells, keys contain a version stamp so entries are never stale,
+    # the oldest third is dropped when MAX_ENTRIES is reached
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'botgard-fragments',
+        'TIMEOUT': 7 * 24 * 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 50000)),
+            'CULL_FREQUENCY': 3,
+        },
+    },
+}
+FRAGMENT_CACHE = 'fragments'
+
+# worker processes for rendering the PDF checklists of many locations, see individuals/checklists.py
+CHECKLIST_PDF_PROCESSES = int(os.environ.get('CHECKLIST_PDF_PROCESSES', os.cpu_count() or 1))
+# the same for the admin action, the pool is started inside a web worker
+CHECKLIST_PDF_ADMIN_PROCESSES = int(os.environ.get('CHECKLIST_PDF_ADMIN_PROCESSES', 2))
+
+# Backend of the Territory and Department statistics, see individuals/stats.py
+#   "columns": num_* columns maintained on each outplanting change
+#   "matview": PostgreSQL materialized view, "columns" on other databases
+OUTPLANTING_STATS_BACKEND = os.environ.get('OUTPLANTING_STATS_BACKEND', 'columns')
+# refresh of the materialized view after outplanting changes:
+#   "debounce": in a background thread, at most once per OUTPLANTING_STATS_REFRESH_DELAY seconds
+#   "commit": after each commit
+#   "schedule": only by ./manage.py botgard_refresh_outplanting_stats, e.g. from cron
+OUTPLANTING_STATS_REFRESH = os.environ.get('OUTPLANTING_STATS_REFRESH', 'debounce')
+OUTPLANTING_STATS_REFRESH_DELAY = float(os.environ.get('OUTPLANTING_STATS_REFRESH_DELAY', 60))
+
+# update the names of Species and Individuals after a genus or species rename in a worker thread,
+# otherwise right after the commit in the same request
+GENERATED_FIELDS_BACKGROUND = os.environ.get('GENERATED_FIELDS_BACKGROUND') != "False"
+
+# create the changelist thumbnail of a new PlantImage in a worker thread,
+# otherwise right after the commit in the same request
+THUMBNAILS_BACKGROUND = os.environ.get('THUMBNAILS_BACKGROUND') != "False"
+
 
 # Password validation
 
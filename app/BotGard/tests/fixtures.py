@@ -82,6 +82,7 @@ def create_test_fixtures():
     from botman.models import BotanicGarden
     from species.models import Family, Species
     from individuals.models import Department, Territory, Individual, Outplanting, Seed
+    from individuals.calc import flush_outplanting_recalc
     from labels.models import LabelDefinition
     from tickets.models import BasicTicket, LaserGravurTicket
     UserModel = get_user_model()
@@ -204,6 +205,8 @@ def create_test_fixtures():
             date=None,
             plant_died=None,
         )
+    # test cases run inside a transaction that never commits
+    flush_outplanting_recalc()
 
     log("creating LabelDefinition")
     for data in LABELS:
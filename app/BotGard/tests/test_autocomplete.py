@@ -0,0 +1,139 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.urls import reverse
+
+from config_app.models import VersionToken
+from individuals.models import Individual
+from species.models import Family, Species
+from ajax.autocomplete import AutoModelField
+from ajax.views import get_model_fieldvalues
+from tickets.admin import Etikett_IndividualForm
+
+from .fixtures import create_test_fixtures
+
+
+class TestAutocomplete(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def setUp(self):
+        caches[settings.FRAGMENT_CACHE].clear()
+
+    def test_model_fieldvalues(self):
+        species = Species.objects.get(species="Species 2")
+        # one query per keystroke
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                {"state": "many", "items": ["Genus 1", "Genus 2"]},
+                get_model_fieldvalues(Family, "genus", "genus")
+            )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                {"state": "one", "items": [species.full_name_generated], "fk": species.pk},
+                get_model_fieldvalues(Species, "full_name_generated", "gen sp 2 cunn")
+            )
+        # exact match first, then starting with the first term, then containing the terms
+        for genus in ("Abcd", "Bcd", "Bcde"):
+            Family.objects.create(family="Family 3", genus=genus)
+        self.assertEqual(["Bcd", "Bcde", "Abcd"], get_model_fieldvalues(Family, "genus", "bcd")["items"])
+        self.assertEqual(
+            {"state": "one", "items": ["Bcd", "Bcde", "Abcd"]}, get_model_fieldvalues(Family, "genus", "Bcd")
+        )
+        # values of all rows of the related model
+        self.assertEqual(
+            ["Family 1", "Family 2", "Family 3"],
+            get_model_fieldvalues(Individual, "species__family__family", "fam")["items"]
+        )
+        self.assertEqual({"state": "none", "items": []}, get_model_fieldvalues(Individual, "source_date", "x"))
+        self.assertEqual({"state": "none", "items": []}, get_model_fieldvalues(Individual, "nofield", "x"))
+
+    def test_view(self):
+        self.assertTrue(self.client.login(username="User1", password="the-secret"))
+        url = reverse("ajax:model_json")
+        response = self.client.get(url, {"id": "species-family-genus", "term": "genus 2"})
+        self.assertEqual({"state": "one", "items": ["Genus 2"], "fk": Family.objects.get(genus="Genus 2").pk},
+                         response.json())
+        response = self.client.get(url, {"id": "species-family-genus", "term": " "})
+        self.assertEqual({"state": "empty"}, response.json())
+
+    def test_response_cache(self):
+        self.assertTrue(self.client.login(username="User1", password="the-secret"))
+        url = reverse("ajax:model_json")
+        params = {"id": "species-family-genus", "term": " genus  2"}
+        response = self.client.get(url, params)
+        etag = response["ETag"]
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertEqual(["Genus 2"], response.json()["items"])
+
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        with mock.patch("ajax.views.get_model_fieldvalues") as get_values:
+            self.assertEqual(["Genus 2"], self.client.get(url, params).json()["items"])
+        get_values.assert_not_called()
+
+        # a saved row of the model invalidates the responses
+        with self.captureOnCommitCallbacks(execute=True):
+            Family.objects.create(family="Family 3", genus="Genus 22")
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+        self.assertEqual(["Genus 2", "Genus 22"], response.json()["items"])
+
+        # a change handled by another process
+        etag = response["ETag"]
+        VersionToken.objects.filter(name="autocomplete:species.Family").update(version=1)
+        self.assertNotEqual(etag, self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)["ETag"])
+
+        response = self.client.get(
+            reverse("ajax:choices_json"), {"id": "individuals-individual-found_country", "term": "ital"}
+        )
+        self.assertEqual(["IT (Italy)"], response.json()["items"])
+        self.assertTrue(response["ETag"])
+
+    def test_batched_foreign_keys(self):
+        request = SimpleNamespace()
+        with mock.patch("ajax.autocomplete.get_current_request", lambda: request):
+            self.check_batched_foreign_keys()
+
+    def check_batched_foreign_keys(self):
+        individuals = list(Individual.objects.order_by("pk"))
+        # the forms of a formset share the lookups of the request
+        forms = [
+            Etikett_IndividualForm(prefix="form-%s" % i, initial={"individual": individual.pk})
+            for i, individual in enumerate(individuals)
+        ]
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [individual.id_name_generated for individual in individuals],
+                [form["individual"].value() for form in forms]
+            )
+
+        forms = [
+            Etikett_IndividualForm({"form-%s-individual" % i: individual.id_name_generated}, prefix="form-%s" % i)
+            for i, individual in enumerate(individuals)
+        ]
+        with self.assertNumQueries(1):
+            self.assertEqual(individuals, [
+                form.fields["individual"].clean(form.data[form.add_prefix("individual")]) for form in forms
+            ])
+        # fallback to a contained text
+        field = forms[0].fields["individual"]
+        self.assertEqual(individuals[1], field.clean("(Genus 1 Species 2"))
+        with self.assertRaises(ValidationError):
+            field.clean("Genus")
+
+    def test_autocomplete_fields(self):
+        self.assertEqual(
+            [("individual", AutoModelField), ("LaserGravur", AutoModelField)],
+            Etikett_IndividualForm.get_autocomplete_fields()
+        )
+        self.assertIs(
+            Etikett_IndividualForm.get_autocomplete_fields(), Etikett_IndividualForm.get_autocomplete_fields()
+        )
@@ -0,0 +1,47 @@
+from django.test import TestCase
+
+from individuals.models import Individual
+from tools.query_benchmark import create_synthetic_data, run_benchmark, compare, full_scans
+
+from .fixtures import create_test_fixtures
+
+
+class TestBenchmark(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def test_full_scans(self):
+        self.assertEqual({"individuals_individual"}, full_scans(
+            "3 0 0 SCAN individuals_individual\n5 0 0 SEARCH species_species USING INTEGER PRIMARY KEY (rowid=?)"
+        ))
+        self.assertEqual(set(), full_scans("SCAN individuals_individual USING INDEX individual_seed_accession_idx"))
+        self.assertEqual({"species_family"}, full_scans("Limit\n  ->  Seq Scan on species_family"))
+
+    def test_benchmark(self):
+        num_individuals = Individual.objects.count()
+        self.assertEqual(300, create_synthetic_data(300)[0])
+        self.assertEqual(num_individuals + 300, Individual.objects.count())
+
+        results = run_benchmark(repeat=1)
+        self.assertIn("seed changelist", results)
+        self.assertEqual(100, results["individual changelist"]["rows"])
+        self.assertTrue(results["territory checklist"]["rows"])
+        for result in results.values():
+            self.assertTrue(result["plan"])
+        # one query per keystroke of the model autocomplete
+        self.assertEqual(1, results["species autocomplete keystrokes"]["queries"])
+        # the statistics backends, only "columns" on SQLite
+        self.assertEqual(13, results["territory statistics (columns)"]["rows"])
+        self.assertTrue(results["outplanting change (columns)"]["queries"])
+        self.assertNotIn("territory statistics (matview)", results)
+        self.assertEqual(num_individuals + 300, Individual.objects.count())
+
+        self.assertEqual([], compare(results, results))
+        baseline = {name: dict(result, full_scans=[], ms=result["ms"] / 10) for name, result in results.items()}
+        messages = compare(results, baseline, min_ms=0)
+        self.assertTrue(any("table scan" in message for message in messages))
+        self.assertTrue(any("was" in message for message in messages))
+        baseline["species autocomplete keystrokes"]["queries"] = 0
+        self.assertIn("species autocomplete keystrokes: 1 queries, was 0", compare(results, baseline))
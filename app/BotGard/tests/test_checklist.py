@@ -0,0 +1,78 @@
+import io
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from individuals.models import Territory, Department
+from individuals.checklists import collect_checklists, build_checklists_zip, build_checklists_pdf
+
+from .fixtures import create_test_fixtures
+
+
+class TestChecklist(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def setUp(self):
+        self.assertTrue(
+            self.client.login(username="User1", password="the-secret"),
+            "failed to log in"
+        )
+
+    def get_content(self, url):
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_territory_html(self):
+        territory = Territory.objects.get(code="T1")
+        content = self.get_content(reverse("individuals:checklist_territory", args=(territory.pk,)))
+        self.assertIn("T1-D1", content)
+        self.assertIn("Genus 1 Species 1", content)
+        self.assertIn(reverse("admin:individuals_individual_change", args=(1,)), content)
+        self.assertIn("</table>", content)
+
+    def test_department_csv(self):
+        department = Department.objects.get(code="D1")
+        content = self.get_content(reverse("individuals:checklist_department", args=(department.pk,)) + "?csv=1")
+        lines = content.splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertTrue(lines[1].startswith('"T1-D1","1000","Family 1 Genus 1 Species 1'))
+        self.assertTrue(lines[2].startswith('"T1-D1","1001","Family 2 Genus 1 Species 2'))
+
+    def test_collect(self):
+        territories, departments = list(Territory.objects.all()), list(Department.objects.all())
+        with self.assertNumQueries(1):
+            checklists = collect_checklists(territories, departments)
+        self.assertEqual(["T1", "T2", "T3", "T1-D1", "T2-D2", "T3-D3", "T3-D4"], [c.code for c in checklists])
+        self.assertEqual([2, 1, 0, 2, 1, 0, 0], [len(c.rows) for c in checklists])
+
+    def test_zip(self):
+        checklists = collect_checklists(Territory.objects.all())
+        archive = zipfile.ZipFile(io.BytesIO(build_checklists_zip(checklists, processes=2)))
+        self.assertEqual(
+            ["00-contents.pdf", "territory-T1.pdf", "territory-T2.pdf", "territory-T3.pdf"], archive.namelist()
+        )
+        for name in archive.namelist():
+            self.assertTrue(archive.read(name).startswith(b"%PDF"))
+
+    def test_merged_pdf(self):
+        self.assertTrue(build_checklists_pdf(collect_checklists(departments=Department.objects.all())).startswith(b"%PDF"))
+
+    def test_admin_action(self):
+        # the admin starts a small pool, the command all CHECKLIST_PDF_PROCESSES
+        with self.settings(CHECKLIST_PDF_PROCESSES=16, CHECKLIST_PDF_ADMIN_PROCESSES=2), \
+                mock.patch("individuals.checklists.ProcessPoolExecutor", wraps=ProcessPoolExecutor) as pool:
+            response = self.client.post(reverse("admin:individuals_territory_changelist"), {
+                "action": "checklists_zip_action",
+                "_selected_action": list(Territory.objects.values_list("pk", flat=True)),
+            })
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("application/zip", response["Content-Type"])
+        pool.assert_called_once_with(max_workers=2)
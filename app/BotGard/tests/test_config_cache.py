@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import translation
+
+import config_app
+from config_app.models import KeyValue, VersionToken
+
+
+class TestConfigCache(TestCase):
+
+    def setUp(self):
+        config_app.invalidate_values()
+
+    def test_cache(self):
+        KeyValue.objects.create(key="sidebar_shortcuts", type="j", value_json=[{"url": "/"}])
+        KeyValue.objects.create(key="test_text", type="t", value_de="Hallo", value_en="Hello")
+        config_app.load_values()
+        # only the version is checked
+        with self.assertNumQueries(1):
+            self.assertEqual([{"url": "/"}], config_app.get_value("sidebar_shortcuts"))
+        with self.assertNumQueries(1):
+            with translation.override("de"):
+                self.assertEqual(
+                    {"test_text": "Hallo", "sidebar_shortcuts": [{"url": "/"}]},
+                    config_app.get_values("test_text", "sidebar_shortcuts")
+                )
+        # the cached objects are not modified by the callers
+        config_app.get_value("sidebar_shortcuts").append("x")
+        self.assertEqual([{"url": "/"}], config_app.get_value("sidebar_shortcuts"))
+
+        # changes of this process
+        KeyValue.objects.filter(key="test_text").delete()
+        with self.assertRaises(KeyError):
+            config_app.get_value("test_text")
+        kv = KeyValue.objects.get(key="sidebar_shortcuts")
+        kv.value_json = []
+        kv.save()
+        self.assertEqual([], config_app.get_value("sidebar_shortcuts"))
+
+        # changes of another process
+        KeyValue.objects.filter(key="sidebar_shortcuts").update(value_json=[1])
+        VersionToken.objects.filter(name=config_app.VERSION_NAME).update(version=1)
+        self.assertEqual([1], config_app.get_value("sidebar_shortcuts"))
+
+    def test_request(self):
+        self.assertIsInstance(config_app.get_value("sidebar_shortcuts"), list)
+        request = SimpleNamespace()
+        with mock.patch("config_app.versions.get_current_request", lambda: request):
+            # one version check per request
+            with self.assertNumQueries(1):
+                config_app.get_value("sidebar_shortcuts")
+                config_app.get_value("sidebar_shortcuts")
+            KeyValue.objects.create(key="sidebar_shortcuts", type="j", value_json=[])
+            self.assertEqual([], config_app.get_value("sidebar_shortcuts"))
+            with self.assertNumQueries(0):
+                config_app.get_value("sidebar_shortcuts")
@@ -0,0 +1,100 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from botman.models import BotanicGarden, PropagationJob
+from individuals.models import Department, Individual, Territory
+from individuals.models.territory import update_full_codes
+from species.models import Family, Species
+from tools import generated_fields
+
+from .fixtures import create_test_fixtures
+
+
+class TestGeneratedFields(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    @override_settings(GENERATED_FIELDS_BACKGROUND=False)
+    def test_genus_rename(self):
+        family = Family.objects.get(family="Family 2", genus="Genus 1")
+        family.genus = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            # previous values for the registry, affected departments, save, job
+            with self.assertNumQueries(4):
+                family.save()
+            # dependent rows are updated after the commit
+            self.assertIn("Genus 1", Species.objects.get(species="Species 2").full_name_generated)
+            job = family._generated_job
+            self.assertEqual(("p", ["genus"]), (job.status, job.fields))
+
+        job.refresh_from_db()
+        # full name and search text of the species and of its individual
+        self.assertEqual(("d", 4, 4), (job.status, job.num_done, job.num_total))
+        # a job only runs once
+        self.assertFalse(job.run())
+        species = Species.objects.get(species="Species 2")
+        self.assertTrue(species.full_name_generated.startswith("Renamed Species 2"))
+        self.assertEqual(species.full_name(), species.full_name_generated)
+        self.assertIn("Renamed Species 2", Individual.objects.get(accession_number=1001).id_name_generated)
+        self.assertIn("Genus 1 Species 1", Individual.objects.get(accession_number=1000).id_name_generated)
+
+    def test_territory_code(self):
+        territory = Territory.objects.get(code="T1")
+        with self.captureOnCommitCallbacks(execute=True):
+            territory.code = "X1"
+            territory.save()
+        self.assertEqual("X1-D1", Department.objects.get(code="D1").full_code)
+        self.assertEqual("X1-D1", Individual.objects.get(accession_number=1000).departments_generated)
+
+    def test_full_code_template(self):
+        from config_app.models import KeyValue
+        # department full codes with one query, individuals with outplantings in them
+        with self.captureOnCommitCallbacks(execute=True):
+            KeyValue.objects.create(key="department_full_code", type="j", value_json=["department", "/", "territory"])
+        for department in Department.objects.all():
+            self.assertEqual(department._get_full_code(), department.full_code)
+        self.assertEqual("D1/T1", Department.objects.get(code="D1").full_code)
+        self.assertEqual("D1/T1", Individual.objects.get(accession_number=1000).departments_generated)
+        # the template and the departments to change
+        with self.assertNumQueries(2):
+            self.assertEqual(0, update_full_codes())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            KeyValue.objects.filter(key="department_full_code").delete()
+        self.assertEqual("T1-D1", Department.objects.get(code="D1").full_code)
+        self.assertEqual("T1-D1", Individual.objects.get(accession_number=1000).departments_generated)
+
+    def test_garden_code(self):
+        garden = BotanicGarden.objects.get(name="Garden 1")
+        garden.code = "NEW"
+        garden.save()
+        for individual in Individual.objects.filter(ipen_garden_code=garden):
+            self.assertEqual(individual.get_ipen(), individual.ipen_generated)
+            self.assertIn("-NEW-", individual.ipen_generated)
+
+    def test_update_all(self):
+        Species.objects.update(full_name_generated="")
+        Individual.objects.update(id_name_generated="")
+        self.assertEqual(3, generated_fields.update_all(Species))
+        self.assertEqual(3, generated_fields.update_all(Individual))
+        self.assertEqual(0, generated_fields.update_all(Individual))
+
+    def test_background_job(self):
+        species = Species.objects.get(species="Species 2")
+        species.species = "Renamed"
+        with mock.patch("tools.postpone._queue") as queue:
+            with self.captureOnCommitCallbacks(execute=True):
+                species.save()
+        job = PropagationJob.objects.get()
+        self.assertEqual(1, queue.put.call_count)
+        self.assertEqual("p", job.status)
+
+        func, args, kwargs = queue.put.call_args[0][0]
+        with mock.patch("botman.models.connection"):
+            func(*args, **kwargs)
+        job.refresh_from_db()
+        self.assertEqual("d", job.status)
+        self.assertIn("Renamed", Individual.objects.get(accession_number=1001).id_name_generated)
@@ -0,0 +1,83 @@
+import io
+import shutil
+import tempfile
+
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from individuals.models import Individual
+from plantimages.models import PlantImage
+
+from .fixtures import create_test_fixtures
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_image(individual, name="plant.png", comment=""):
+    data = io.BytesIO()
+    Image.new("RGB", (120, 80), "green").save(data, "PNG")
+    return PlantImage.objects.create(
+        individual=individual, comment=comment, image=SimpleUploadedFile(name, data.getvalue()),
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAILS_BACKGROUND=False)
+class TestImages(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_first_image(self):
+        individual = Individual.objects.get(accession_number=1000)
+        self.assertEqual("", individual.image_decorator())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = create_image(individual, comment="first")
+        with self.captureOnCommitCallbacks(execute=True):
+            create_image(individual, comment="second")
+
+        individual.refresh_from_db()
+        image = individual.first_image_generated
+        self.assertEqual(first.pk, image["pk"])
+        self.assertEqual(first.image.name, image["image"])
+        self.assertTrue(image["thumbnail"])
+
+        # rendering reads the stored values only
+        with self.assertNumQueries(0):
+            html = individual.image_decorator()
+        self.assertIn('src="/media/%s"' % image["thumbnail"], html)
+        self.assertIn('title="first"', html)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        individual.refresh_from_db()
+        self.assertEqual("second", individual.first_image_generated["comment"])
+
+    def test_background(self):
+        from unittest import mock
+
+        individual = Individual.objects.get(accession_number=1000)
+        with self.settings(THUMBNAILS_BACKGROUND=True), mock.patch("tools.postpone._queue") as queue:
+            with self.captureOnCommitCallbacks(execute=True):
+                create_image(individual, name="background.png")
+        self.assertEqual(1, queue.put.call_count)
+
+        # not yet generated, the list shows a plain link
+        individual.refresh_from_db()
+        self.assertEqual("", individual.first_image_generated["thumbnail"])
+        self.assertNotIn("<img", individual.image_decorator())
+
+        func, args, kwargs = queue.put.call_args[0][0]
+        with mock.patch("plantimages.models.connection"):
+            func(*args, **kwargs)
+        individual.refresh_from_db()
+        self.assertTrue(individual.first_image_generated["thumbnail"])
+        self.assertIn("<img", individual.image_decorator())
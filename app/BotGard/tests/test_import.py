@@ -0,0 +1,127 @@
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+
+from config_app.models import KeyValue
+from individuals.models import Individual, Outplanting, Department, Territory
+from individuals.importer import import_individuals, read_rows, IndividualImporter
+from labels.csv_to_xls import convert_csv_to_xls
+
+from .fixtures import create_test_fixtures
+
+
+CSV = """species;ipen_garden_code;ipen_country;ipen_transfer_restricted;ipen_accession_number;found_country;\
+accession_number;department;outplanting_date;seed_available
+Genus 1 Species 1;Garden 1;DE;0;A-1;AU;5000;T3-D3;2020-05-01;x
+genus 1   species 2;Garden 2;it;1;A-2;IT;;;;
+Unknown species;Garden 1;DE;0;A-3;AU;;;;
+Genus 2 Species 3;Garden 9;XYZ;0;A-4;AU;;;;
+"""
+
+
+class TestImport(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def import_csv(self, dry_run=False, batch_size=2):
+        return import_individuals(BytesIO(CSV.encode("utf-8")), "import.csv", dry_run=dry_run, batch_size=batch_size)
+
+    def test_dry_run(self):
+        num_individuals = Individual.objects.count()
+        result = self.import_csv(dry_run=True)
+        self.assertEqual((4, 2, 1), (result.num_rows, result.num_individuals, result.num_outplantings))
+        self.assertEqual(num_individuals, Individual.objects.count())
+        self.assertEqual(0, Department.objects.get(code="D3").num_outplantings)
+
+        rows = {row_number for row_number, error in result.errors}
+        self.assertEqual({4, 5}, rows)
+        self.assertIn((4, "species: 'Unknown species' not found"), result.errors)
+        self.assertIn((5, "ipen_garden_code: 'Garden 9' not found"), result.errors)
+        self.assertEqual(1, len([row for row, error in result.errors if row == 5 and "ipen_country" in error]))
+
+    def test_import(self):
+        result = self.import_csv()
+        self.assertEqual(2, result.num_individuals)
+
+        individual = Individual.objects.get(accession_number=5000)
+        self.assertTrue(individual.seed_available)
+        self.assertIsNotNone(individual.order_number)
+        self.assertEqual(individual.get_ipen(), individual.ipen_generated)
+        self.assertEqual(individual.get_id_name(), individual.id_name_generated)
+        self.assertEqual("T3-D3", individual.departments_generated)
+        self.assertEqual(1, Territory.objects.get(code="T3").num_outplantings)
+        self.assertEqual(1, Department.objects.get(code="D3").num_species)
+        self.assertCountEqual(
+            [], [v for l in (Territory, Department) for o in l.objects.all() for v in o.verify_outplanting_fields()]
+        )
+
+        # accession and order number allocated
+        individual = Individual.objects.get(ipen_accession_number="A-2")
+        self.assertIsNotNone(individual.accession_number)
+        self.assertIn("Species 2", individual.id_name_generated)
+        self.assertEqual(1, Outplanting.objects.filter(individual__ipen_accession_number="A-1").count())
+
+    def test_duplicate_order_number(self):
+        order_number = Individual.objects.get(accession_number=1000).order_number
+        csv = "species,ipen_garden_code,ipen_country,ipen_transfer_restricted,ipen_accession_number," \
+              "found_country,order_number\n"
+        csv += "Genus 1 Species 1,Garden 1,DE,0,B-1,AU,%s\n" % order_number
+        csv += "Genus 1 Species 1,Garden 1,DE,0,B-2,AU,\n"
+        result = import_individuals(SimpleUploadedFile("import.csv", csv.encode("utf-8")), "import.csv")
+        self.assertEqual([(2, "order_number: %s already exists" % order_number)], result.errors)
+        self.assertEqual(1, result.num_individuals)
+
+    def test_duplicate_accession_number(self):
+        KeyValue.objects.create(key="accession_generation", type="j", value_json={"method": "incremental", "min": 1})
+        csv = "species,ipen_garden_code,ipen_country,ipen_transfer_restricted,ipen_accession_number," \
+              "found_country,accession_number\n"
+        for i, accession_number in enumerate(("", "1003", "1000", "1003")):
+            csv += "Genus 1 Species 1,Garden 1,DE,0,C-%s,AU,%s\n" % (i, accession_number)
+        result = import_individuals(BytesIO(csv.encode("utf-8")), "import.csv", batch_size=1)
+        self.assertEqual([
+            (4, "accession_number: 1000 already exists"),
+            (5, "accession_number: 1003 is used twice in the file"),
+        ], result.errors)
+        # the number of the later batch is not handed out to the first row
+        self.assertEqual(1004, Individual.objects.get(ipen_accession_number="C-0").accession_number)
+        self.assertEqual(1003, Individual.objects.get(ipen_accession_number="C-1").accession_number)
+
+    def test_search(self):
+        self.import_csv()
+        self.assertTrue(self.client.login(username="User1", password="the-secret"))
+        response = self.client.get(reverse("admin:individuals_individual_changelist"), {"q": "A-2 species"})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            ["A-2"], [individual.ipen_accession_number for individual in response.context["cl"].result_list]
+        )
+
+    def test_streaming(self):
+        num_individuals = Individual.objects.count()
+        written = []
+
+        def rows():
+            for row_number, values in read_rows(BytesIO(CSV.encode("utf-8")), "import.csv"):
+                written.append(Individual.objects.count() - num_individuals)
+                yield row_number, values
+
+        result = IndividualImporter(batch_size=1).run(rows())
+        self.assertEqual(2, result.num_individuals)
+        # the rows are read while the earlier batches are written
+        self.assertEqual([0, 1, 2, 2], written)
+
+    def test_xls(self):
+        rows = [line.split(";") for line in CSV.splitlines()]
+        xls = convert_csv_to_xls(rows)
+        result = import_individuals(BytesIO(xls), "import.xls")
+        self.assertEqual(2, result.num_individuals)
+        self.assertEqual(1, Individual.objects.filter(accession_number=5000).count())
+
+    def test_duplicate_ipen(self):
+        self.import_csv()
+        result = self.import_csv()
+        self.assertEqual(0, result.num_individuals)
+        self.assertEqual([2, 3], [row for row, error in result.errors if "already exists" in error])
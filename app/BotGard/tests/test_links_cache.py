@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase
+
+from individuals.models import Department, Territory, Individual, Outplanting
+from individuals.models.individual import prefetch_links_html
+
+from .fixtures import create_test_fixtures
+
+
+class TestLinksCache(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def setUp(self):
+        caches[settings.FRAGMENT_CACHE].clear()
+
+    def get_links(self, accession_number=1000):
+        individual = Individual.objects.get(accession_number=accession_number)
+        return individual.departments_decorator(), individual.territories_decorator()
+
+    def test_page(self):
+        individuals = list(Individual.objects.order_by("pk"))
+        with self.assertNumQueries(1):
+            prefetch_links_html(individuals)
+        expected = [(i.departments_decorator(), i.territories_decorator()) for i in individuals]
+        self.assertIn("T1-D1", expected[0][0])
+
+        individuals = list(Individual.objects.order_by("pk"))
+        with self.assertNumQueries(0):
+            prefetch_links_html(individuals)
+            self.assertEqual(expected, [(i.departments_decorator(), i.territories_decorator()) for i in individuals])
+
+    def test_invalidation(self):
+        self.assertNotIn("T3-D3", self.get_links()[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Outplanting.objects.create(
+                department=Department.objects.get(code="D3"),
+                individual=Individual.objects.get(accession_number=1000),
+            )
+        self.assertIn("T3-D3", self.get_links()[0])
+
+        department = Department.objects.get(code="D3")
+        department.name = "Renamed department"
+        department.save()
+        self.assertIn("Renamed department", self.get_links()[0])
+
+        territory = Territory.objects.get(code="T3")
+        territory.name = "Renamed territory"
+        territory.save()
+        self.assertIn("Renamed territory", self.get_links()[1])
+        # other individuals are not affected
+        self.assertNotIn("Renamed", "".join(self.get_links(1001)))
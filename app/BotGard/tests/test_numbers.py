@@ -0,0 +1,116 @@
+import datetime
+
+from django.test import TestCase
+
+from config_app.models import KeyValue
+from individuals.models import Individual, NumberReservation, reserve_numbers, release_numbers
+from species.models import Species
+from individuals.numbers import allocate_numbers, get_new_order_number
+
+from .fixtures import create_test_fixtures
+
+
+class TestNumbers(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def set_method(self, fieldname, **method):
+        KeyValue.objects.update_or_create(
+            key="%s_generation" % ("accession" if fieldname == "accession_number" else fieldname),
+            defaults={"type": "j", "value_json": method},
+        )
+
+    def test_incremental_tight(self):
+        self.set_method("order_number", method="incremental_tight", min=1)
+        # fixtures use 0, 1, 2
+        self.assertEqual([3, 4, 5], reserve_numbers("order_number", 3))
+        self.assertEqual(3, NumberReservation.objects.count())
+
+        # gaps are filled
+        Individual.objects.filter(order_number=1).delete()
+        self.assertEqual(1, get_new_order_number())
+        release_numbers("order_number", [4])
+        self.assertEqual([4, 6], allocate_numbers("order_number", 2))
+
+        # expired reservations are free again
+        NumberReservation.objects.filter(number=3).update(expires=datetime.datetime(2000, 1, 1))
+        self.assertEqual([3], allocate_numbers("order_number"))
+
+    def test_incremental(self):
+        self.set_method("accession_number", method="incremental", min=1)
+        self.assertEqual([1003, 1004], allocate_numbers("accession_number", 2))
+        Individual.objects.create(
+            accession_number=1010, species=Species.objects.first(), seed_in_stock=False, seed_available=False,
+            ipen_garden_code=Individual.objects.first().ipen_garden_code,
+        )
+        # used numbers above the watermark are skipped
+        self.assertEqual(list(range(1005, 1010)) + [1011], allocate_numbers("accession_number", 6))
+
+    def test_random_range(self):
+        self.set_method("accession_number", method="random_range", min=1000, max=1999999)
+        numbers = reserve_numbers("accession_number", 100)
+        self.assertEqual(100, len(set(numbers)))
+        self.assertTrue(all(1000 <= n <= 1999999 for n in numbers))
+
+    def test_allocate_on_save(self):
+        self.set_method("order_number", method="incremental_tight", min=1000)
+        individual = Individual(
+            species=Species.objects.first(), seed_in_stock=False, seed_available=False,
+            ipen_garden_code=Individual.objects.first().ipen_garden_code,
+        )
+        self.assertIsNone(individual.order_number)
+        individual.save()
+        self.assertEqual(1000, individual.order_number)
+        self.assertIsNotNone(individual.accession_number)
+        # no reservation for numbers saved right away
+        self.assertFalse(NumberReservation.objects.exists())
+
+    def test_concurrent_forms(self):
+        from individuals.models import IndividualForm
+        self.set_method("accession_number", method="incremental", min=1)
+        self.set_method("order_number", method="incremental_tight", min=1)
+        # two curators open the add form at the same time
+        first, second = IndividualForm(), IndividualForm()
+        self.assertEqual((1003, 3), (first.initial["accession_number"], first.initial["order_number"]))
+        self.assertEqual((1004, 4), (second.initial["accession_number"], second.initial["order_number"]))
+        self.assertEqual(4, NumberReservation.objects.count())
+
+        # the same form shown again keeps its numbers
+        again = IndividualForm(initial={"number_token": first.initial["number_token"]})
+        self.assertEqual(1003, again.initial["accession_number"])
+        self.assertEqual(4, NumberReservation.objects.count())
+
+        # the second one is saved with another order number, the reserved one is given back
+        data = {
+            name: field.value() for name, field in ((name, second[name]) for name in second.fields)
+            if field.value() is not None
+        }
+        data.update({
+            "species": second.fields["species"].prepare_value(Species.objects.first()),
+            "ipen_garden_code": second.fields["ipen_garden_code"].prepare_value(
+                Individual.objects.first().ipen_garden_code
+            ),
+            "ipen_country": "DE", "ipen_transfer_restricted": "0", "found_country": "DE", "order_number": 10,
+        })
+        form = IndividualForm(data)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual({1003, 3}, set(NumberReservation.objects.values_list("number", flat=True)))
+        self.assertEqual([4], allocate_numbers("order_number"))
+
+        # abandoned forms expire and their numbers are handed out again
+        NumberReservation.objects.update(expires=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual([3], allocate_numbers("order_number"))
+        # "incremental" does not go back below the saved 1004
+        self.assertEqual([1005], allocate_numbers("accession_number"))
+
+    def test_release_on_save(self):
+        self.set_method("order_number", method="incremental_tight", min=1000)
+        number = reserve_numbers("order_number", 1)[0]
+        Individual.objects.create(
+            species=Species.objects.first(), seed_in_stock=False, seed_available=False, order_number=number,
+            ipen_garden_code=Individual.objects.first().ipen_garden_code,
+        )
+        self.assertFalse(NumberReservation.objects.exists())
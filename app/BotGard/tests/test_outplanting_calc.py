@@ -0,0 +1,251 @@
+import datetime
+from unittest import mock
+
+from django.db import connection, transaction, IntegrityError
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from individuals.models import Department, Territory, Individual, Outplanting, OutplantingTally, prefetch_outplantings
+from species.models import Family, Species
+from individuals.models.territory import CalcOutplantingsMixin
+from individuals.calc import (
+    calc_individuals_outplantings, deferred_outplanting_recalc, flush_outplanting_recalc, OUTPLANTING_FIELDS,
+)
+
+from .fixtures import create_test_fixtures
+
+
+class TestOutplantingCalc(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def get_values(self):
+        return {
+            values[0]: values[1:]
+            for values in Individual.objects.order_by("pk").values_list("pk", *OUTPLANTING_FIELDS)
+        }
+
+    def test_bulk_equals_single(self):
+        Outplanting.objects.create(
+            department=Department.objects.get(code="D3"),
+            individual=Individual.objects.get(accession_number=1000),
+            plant_died=datetime.date(2020, 1, 1),
+        )
+        for individual in Individual.objects.all():
+            individual.calc_outplantings()
+        expected = self.get_values()
+
+        Individual.objects.update(
+            outplantings_generated=[], alive_outplantings_generated=[],
+            departments_generated="", territories_generated="", is_alive_generated=False,
+        )
+        self.assertEqual(3, calc_individuals_outplantings())
+        self.assertEqual(expected, self.get_values())
+
+        # nothing changed, nothing written
+        self.assertEqual(0, calc_individuals_outplantings())
+
+        individual = Individual.objects.get(accession_number=1000)
+        self.assertEqual("T1-D1 T3-D3", individual.departments_generated)
+        self.assertEqual("(T1) (T3)", individual.territories_generated)
+        self.assertEqual(2, len(individual.outplantings_generated))
+        self.assertEqual(1, len(individual.alive_outplantings_generated))
+
+    def test_subset_query_count(self):
+        Individual.objects.update(departments_generated="", is_alive_generated=False)
+        qset = Individual.objects.filter(accession_number__in=[1000, 1001])
+        # outplanting projection, current values, bulk_update
+        with self.assertNumQueries(3):
+            self.assertEqual(2, calc_individuals_outplantings(qset))
+        self.assertFalse(Individual.objects.get(accession_number=1002).is_alive_generated)
+
+    def test_prefetch_outplantings(self):
+        individuals = list(Individual.objects.order_by("pk"))
+        with self.assertNumQueries(1):
+            prefetch_outplantings(individuals)
+        with self.assertNumQueries(0):
+            html = [i._get_departments_html() + i._get_territories_html() for i in individuals]
+        self.assertIn("T1-D1", html[0])
+        self.assertIn("T2", html[2])
+
+    def test_coalesced_recalc(self):
+        individual = Individual.objects.get(accession_number=1000)
+        department = Department.objects.get(code="D3")
+        original = CalcOutplantingsMixin.calc_outplanting_fields
+        with mock.patch.object(
+                CalcOutplantingsMixin, "calc_outplanting_fields", autospec=True, side_effect=original) as calc:
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(10):
+                    Outplanting.objects.create(department=department, individual=individual)
+            # counters are maintained incrementally, no recount
+            self.assertEqual(0, calc.call_count)
+
+        department.refresh_from_db()
+        self.assertEqual(10, department.num_outplantings)
+        self.assertEqual(10, Territory.objects.get(code="T3").num_outplantings)
+        individual.refresh_from_db()
+        self.assertEqual(11, len(individual.outplantings_generated))
+        self.assertEqual("T1-D1 T3-D3", individual.departments_generated)
+
+    def test_move_and_delete(self):
+        outplanting = Outplanting.objects.get(individual__accession_number=1002)
+        with self.captureOnCommitCallbacks(execute=True):
+            outplanting.department = Department.objects.get(code="D4")
+            outplanting.save()
+        self.assertEqual(0, Department.objects.get(code="D2").num_outplantings)
+        self.assertEqual(0, Territory.objects.get(code="T2").num_outplantings)
+        self.assertEqual(1, Territory.objects.get(code="T3").num_outplantings)
+        self.assertEqual("(T3)", Individual.objects.get(accession_number=1002).territories_generated)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Individual.objects.get(accession_number=1002).delete()
+        self.assertEqual(0, Department.objects.get(code="D4").num_outplantings)
+        self.assertEqual(0, Territory.objects.get(code="T3").num_individuals)
+
+    def test_stored_state_from_db(self):
+        # loaded instances know their stored values, only new instances read them
+        instances = (
+            (Outplanting.objects.get(individual__accession_number=1002), "_loaded_state"),
+            (Individual.objects.get(accession_number=1002), "_loaded_species"),
+            (Species.objects.get(species="Species 3"), "_loaded_family"),
+            (Family.objects.get(family="Family 2", genus="Genus 2"), "_loaded_genus"),
+        )
+        for instance, attr in instances:
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as loaded:
+                    instance.save()
+            delattr(instance, attr)
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as not_loaded:
+                    instance.save()
+            select = 'SELECT "%s".' % instance._meta.db_table
+            count = [sum(query["sql"].startswith(select) for query in queries) for queries in (loaded, not_loaded)]
+            self.assertEqual(count[0] + 1, count[1], type(instance).__name__)
+
+        # the stored state follows the saved values
+        outplanting = instances[0][0]
+        outplanting.department = Department.objects.get(code="D4")
+        with self.captureOnCommitCallbacks(execute=True):
+            outplanting.save()
+        self.assertEqual(Department.objects.get(code="D4").pk, outplanting._loaded_location[0])
+        self.assertEqual(0, Department.objects.get(code="D2").num_outplantings)
+
+    def test_deferred_context_manager(self):
+        department = Department.objects.get(code="D3")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with deferred_outplanting_recalc():
+                for individual in Individual.objects.all():
+                    Outplanting.objects.create(department=department, individual=individual)
+        # one flush registered when the block exits
+        self.assertEqual(1, len(callbacks))
+        department.refresh_from_db()
+        self.assertEqual(3, department.num_individuals)
+        self.assertEqual(3, department.num_species_alive)
+
+    def test_flush_scheduled_once(self):
+        department = Department.objects.get(code="D3")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for individual in Individual.objects.all():
+                Outplanting.objects.create(department=department, individual=individual)
+        self.assertEqual(1, len(callbacks))
+
+        # the callback of a rolled back savepoint is registered again
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    Outplanting.objects.filter(department=department).first().delete()
+                    raise ValueError
+            except ValueError:
+                pass
+            Outplanting.objects.filter(department=department).last().delete()
+        self.assertEqual(1, len(callbacks))
+        department.refresh_from_db()
+        self.assertEqual(2, department.num_individuals)
+
+    def assertCountersValid(self):
+        for location in list(Territory.objects.all()) + list(Department.objects.all()):
+            self.assertEqual({}, location.verify_outplanting_fields(), location)
+
+    def test_incremental_counters(self):
+        individual = Individual.objects.get(accession_number=1001)
+        d3, d4 = Department.objects.get(code="D3"), Department.objects.get(code="D4")
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Outplanting.objects.create(department=d3, individual=individual)
+            Outplanting.objects.create(department=d4, individual=individual)
+        territory = Territory.objects.get(code="T3")
+        self.assertEqual((2, 1, 1), (territory.num_outplantings, territory.num_individuals, territory.num_species))
+        self.assertCountersValid()
+
+        # death
+        with self.captureOnCommitCallbacks(execute=True):
+            first.plant_died = datetime.date(2020, 1, 1)
+            first.save()
+        territory.refresh_from_db()
+        self.assertEqual((1, 1), (territory.num_outplantings_alive, territory.num_individuals_alive))
+        self.assertEqual(0, Department.objects.get(code="D3").num_individuals_alive)
+        self.assertCountersValid()
+
+        # move, with an instance not loaded from the database
+        with self.captureOnCommitCallbacks(execute=True):
+            Outplanting(pk=first.pk, department=Department.objects.get(code="D1"), individual=individual).save()
+        self.assertEqual(1, Territory.objects.get(code="T3").num_outplantings)
+        self.assertCountersValid()
+
+        # species change of the individual
+        with self.captureOnCommitCallbacks(execute=True):
+            individual.species = Species.objects.get(species="Species 1")
+            individual.save()
+        self.assertEqual(1, Department.objects.get(code="D1").num_species)
+        self.assertCountersValid()
+
+        # delete
+        with self.captureOnCommitCallbacks(execute=True):
+            Outplanting.objects.filter(department=d4).delete()
+        self.assertFalse(OutplantingTally.objects.filter(department=d4).exists())
+        self.assertEqual(0, Territory.objects.get(code="T3").num_genera)
+        self.assertCountersValid()
+
+    def test_repair(self):
+        Department.objects.filter(code="D1").update(num_individuals=5)
+        department = Department.objects.get(code="D1")
+        self.assertEqual({"num_individuals": (5, 2)}, department.verify_outplanting_fields())
+        department.rebuild_outplanting_tallies()
+        self.assertCountersValid()
+
+    def test_rolled_back_change(self):
+        department = Department.objects.get(code="D3")
+        try:
+            with transaction.atomic():
+                Outplanting.objects.create(department=department, individual=Individual.objects.first())
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        # the recorded pair is stale but recounting it changes nothing
+        flush_outplanting_recalc()
+        self.assertEqual(0, Department.objects.get(code="D3").num_outplantings)
+        self.assertCountersValid()
+
+    def test_unique_tallies(self):
+        tally = OutplantingTally.objects.filter(department__isnull=False).first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OutplantingTally.objects.create(
+                department=tally.department, kind=tally.kind, key=tally.key, alive=tally.alive, count=1
+            )
+        tally = OutplantingTally.objects.filter(territory__isnull=False).first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OutplantingTally.objects.create(
+                territory=tally.territory, kind=tally.kind, key=tally.key, alive=tally.alive, count=1
+            )
+
+    def test_switch_back_from_matview(self):
+        from individuals.stats import mark_columns_stale, columns_stale
+        # outplantings changed while the materialized view was used
+        Department.objects.filter(code="D1").update(num_individuals=5)
+        mark_columns_stale()
+        self.assertTrue(columns_stale())
+        with self.captureOnCommitCallbacks(execute=True):
+            Outplanting.objects.create(department=Department.objects.get(code="D3"), individual=Individual.objects.first())
+        self.assertFalse(columns_stale())
+        self.assertCountersValid()
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import caches
+from django.test import TestCase
+from django.utils import timezone
+
+from config_tables.query_plan import QueryPlan
+from individuals.models import Individual, Outplanting, Territory, Seed, SeedCatalog
+
+from .fixtures import create_test_fixtures
+
+
+class TestQueryPlan(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def setUp(self):
+        caches[settings.FRAGMENT_CACHE].clear()
+
+    def get_plan(self, model, list_display):
+        return admin.site._registry[model].get_list_query_plan(list_display)
+
+    def test_select_related(self):
+        plan = QueryPlan(Outplanting, ["individual_link_decorator", "territory_decorator", "family_single"])
+        self.assertEqual(
+            ["individual", "department__territory", "individual__species__family"],
+            plan.select_related,
+        )
+        qset = plan.apply(Outplanting.objects.all())
+        with self.assertNumQueries(1):
+            for o in qset:
+                o.individual_link_decorator(), o.territory_decorator(), o.family_single()
+
+    def test_prefetch_and_defer(self):
+        plan = self.get_plan(Individual, ["species_link_decorator", "departments_decorator", "territories_decorator"])
+        self.assertEqual(0, len(plan.prefetch_related))
+        self.assertEqual(1, len(plan.prefetch))
+        self.assertEqual(["found_text", "comment"], plan.deferred_fields)
+        # individuals, outplantings of the links that are not cached
+        for num_queries in (2, 1):
+            qset = plan.apply(Individual.objects.all())
+            with self.assertNumQueries(num_queries):
+                plan.prefetch_results(qset)
+                for i in qset:
+                    i.species_link_decorator(), i.departments_decorator(), i.territories_decorator()
+
+        plan = self.get_plan(Individual, ["comment"])
+        self.assertEqual(["found_text"], plan.deferred_fields)
+
+    def test_annotate(self):
+        qset = self.get_plan(Territory, ["num_departments"]).apply(Territory.objects.order_by("code"))
+        with self.assertNumQueries(1):
+            self.assertEqual([1, 1, 2], [t.num_departments() for t in qset])
+
+    def test_catalog_membership(self):
+        seeds = list(Seed.objects.order_by("pk"))
+        self.assertIn("Create new catalog", seeds[0].seed_add_to_latest_catalog_decorator())
+
+        catalog = SeedCatalog.objects.create(release_date=timezone.now().date(), title="Catalog")
+        catalog.seed.add(seeds[0])
+
+        plan = self.get_plan(Seed, ["seed_add_to_latest_catalog_decorator"])
+        qset = plan.apply(Seed.objects.order_by("pk"))
+        # seeds, latest catalog, members of the page
+        with self.assertNumQueries(3):
+            plan.prefetch_results(qset)
+            links = [seed.seed_add_to_latest_catalog_decorator() for seed in qset]
+        self.assertIn("/remove/%s/from/%s/" % (seeds[0].pk, catalog.pk), links[0])
+        self.assertTrue(all("toCurrent" in link for link in links[1:]))
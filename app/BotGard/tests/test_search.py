@@ -0,0 +1,55 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from individuals.models import Individual
+from species.models import Family, Species
+from tools.search import search_queryset
+
+from .fixtures import create_test_fixtures
+
+
+class TestSearch(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def test_search_text(self):
+        species = Species.objects.get(species="Species 2")
+        self.assertEqual("Genus 1 Species 2 Family 2", species.search_text_generated)
+        individual = Individual.objects.get(accession_number=1001)
+        self.assertIn(individual.ipen_generated, individual.search_text_generated)
+        self.assertIn("Garden 2", individual.search_text_generated)
+        self.assertTrue(individual.search_text_generated.endswith(species.search_text_generated))
+
+    def test_search_queryset(self):
+        self.assertEqual(
+            ["Species 2"],
+            list(search_queryset(Species.objects.all(), "genus 1 family 2").values_list("species", flat=True))
+        )
+        self.assertEqual(
+            [1001],
+            list(search_queryset(Individual.objects.all(), '"garden 2"').values_list("accession_number", flat=True))
+        )
+        self.assertEqual(3, search_queryset(Individual.objects.all(), "   ").count())
+
+    @override_settings(GENERATED_FIELDS_BACKGROUND=False)
+    def test_family_rename(self):
+        family = Family.objects.get(family="Family 2", genus="Genus 1")
+        family.family = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            family.save()
+        self.assertIn("Renamed", Species.objects.get(species="Species 2").search_text_generated)
+        self.assertEqual(
+            [1001],
+            list(search_queryset(Individual.objects.all(), "renamed").values_list("accession_number", flat=True))
+        )
+
+    def test_changelist(self):
+        self.assertTrue(self.client.login(username="User1", password="the-secret"))
+        response = self.client.get(reverse("admin:individuals_individual_changelist"), {"q": '"Genus 1"'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, response.context["cl"].result_count)
+        response = self.client.get(reverse("admin:species_species_changelist"), {"q": '"Family 2"'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, response.context["cl"].result_count)
@@ -0,0 +1,97 @@
+import datetime
+
+from django.test import TestCase
+
+from individuals.models import Individual, Outplanting, Territory, Department, OutplantingSnapshot
+from individuals.snapshots import snapshot_series, rebuild_all_snapshots, get_snapshot
+
+from .fixtures import create_test_fixtures
+
+
+def counts(outplantings, individuals, species, genera):
+    return {
+        "num_outplantings": outplantings, "num_individuals": individuals,
+        "num_species": species, "num_genera": genera,
+    }
+
+
+class TestSnapshots(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def test_series(self):
+        d = datetime.date
+        series = snapshot_series([
+            (1, 10, "Genus", d(2020, 1, 1), None, None),
+            (1, 10, "Genus", None, d(2020, 5, 1), d(2021, 1, 1)),
+            (2, 11, "Genus", d(2020, 5, 1), None, d(2021, 1, 1)),
+            # died before it was planted
+            (3, 12, "Other", d(2022, 1, 1), None, d(2021, 1, 1)),
+        ])
+        self.assertEqual([
+            (d(2020, 1, 1), counts(1, 1, 1, 1)),
+            (d(2020, 5, 1), counts(3, 2, 2, 1)),
+            (d(2021, 1, 1), counts(1, 1, 1, 1)),
+        ], series)
+
+    def test_incremental(self):
+        territory = Territory.objects.get(code="T1")
+        department = Department.objects.get(code="D1")
+        # fixture outplantings have no dates
+        self.assertEqual(counts(2, 2, 2, 1), get_snapshot(territory, datetime.date(1900, 1, 1)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            outplanting = Outplanting.objects.create(
+                department=department, individual=Individual.objects.get(accession_number=1002),
+                date=datetime.date(2020, 3, 1),
+            )
+        with self.assertNumQueries(1):
+            self.assertEqual(counts(2, 2, 2, 1), territory.get_outplanting_snapshot(datetime.date(2020, 1, 1)))
+        self.assertEqual(counts(3, 3, 3, 2), get_snapshot(territory, datetime.date(2020, 3, 1)))
+        self.assertEqual(counts(3, 3, 3, 2), get_snapshot(department, datetime.date(2024, 1, 1)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            outplanting.plant_died = datetime.date(2021, 6, 1)
+            outplanting.save()
+        self.assertEqual(counts(3, 3, 3, 2), get_snapshot(territory, datetime.date(2021, 5, 31)))
+        self.assertEqual(counts(2, 2, 2, 1), get_snapshot(territory, datetime.date(2021, 6, 1)))
+
+        stored = set(OutplantingSnapshot.objects.values_list("department", "territory", "date", "num_outplantings"))
+        rebuild_all_snapshots()
+        self.assertEqual(
+            stored, set(OutplantingSnapshot.objects.values_list("department", "territory", "date", "num_outplantings"))
+        )
+
+    def test_apply_changes(self):
+        values = ("department", "territory", "date", *counts(0, 0, 0, 0))
+        d1, d3 = Department.objects.get(code="D1"), Department.objects.get(code="D3")
+        individual = Individual.objects.get(accession_number=1001)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Outplanting.objects.create(department=d1, individual=individual, date=datetime.date(2020, 3, 1))
+            second = Outplanting.objects.create(
+                department=d1, individual=individual, seeded_date=datetime.date(2019, 1, 1),
+                plant_died=datetime.date(2022, 1, 1),
+            )
+        # the series of the other locations are not rewritten
+        other = set(OutplantingSnapshot.objects.exclude(department=d1).exclude(territory=d1.territory).exclude(
+            department=d3).exclude(territory=d3.territory).values_list("pk", flat=True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.department = d3
+            first.date = datetime.date(2018, 1, 1)
+            first.save()
+            second.plant_died = datetime.date(2019, 6, 1)
+            second.save()
+            second.plant_died = datetime.date(2023, 1, 1)
+            second.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Outplanting.objects.filter(pk=first.pk).delete()
+
+        self.assertEqual(other, set(OutplantingSnapshot.objects.exclude(department=d1).exclude(
+            territory=d1.territory).exclude(department=d3).exclude(territory=d3.territory).values_list("pk", flat=True)))
+        self.assertEqual(counts(3, 2, 2, 1), get_snapshot(d1, datetime.date(2022, 6, 1)))
+        stored = set(OutplantingSnapshot.objects.values_list(*values))
+        rebuild_all_snapshots()
+        self.assertEqual(stored, set(OutplantingSnapshot.objects.values_list(*values)))
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase
+
+from config_app.models import VersionToken
+from species.models import Family, Species
+from species.prefix_index import species_index, SpeciesPrefixIndex, VERSION_NAME
+
+from .fixtures import create_test_fixtures
+
+
+class TestSpeciesIndex(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def setUp(self):
+        species_index.clear()
+
+    def expected(self, *names):
+        return [
+            (species.pk, species.full_name())
+            for species in (Species.objects.get(species=name) for name in names)
+        ]
+
+    def test_search(self):
+        expected = self.expected("Species 1", "Species 2")
+        species_index.build()
+        request = SimpleNamespace()
+        # the version token is read once per request
+        with mock.patch("config_app.versions.get_current_request", lambda: request), self.assertNumQueries(1):
+            self.assertEqual(expected, species_index.search("genus 1"))
+            self.assertEqual(expected[1:], species_index.search("gen 1 species 2"))
+            self.assertEqual(expected[:1], species_index.search("genus", limit=1))
+            self.assertEqual([], species_index.search("species"))
+            self.assertEqual([], species_index.search(" "))
+
+    def test_changes(self):
+        self.assertEqual(3, len(species_index.search("genus")))
+        family = Family.objects.get(family="Family 2", genus="Genus 2")
+        with self.captureOnCommitCallbacks(execute=True):
+            family.genus = "Other"
+            family.save()
+            Species.objects.create(family=family, species="new", variety="var", species_author="Author")
+            Species.objects.get(species="Species 1").delete()
+        expected = self.expected("Species 2", "new", "Species 3")
+        # only the version token is read
+        with self.assertNumQueries(2):
+            self.assertEqual(expected[:1], species_index.search("genus"))
+            self.assertEqual(expected[1:], species_index.search("other"))
+        self.assertEqual("Other new var. var Author", expected[1][1])
+
+    def test_other_process(self):
+        self.assertEqual(3, len(species_index.search("genus")))
+        # another process changed a species
+        Species.objects.filter(species="Species 1").update(species="Changed")
+        VersionToken.objects.update_or_create(name=VERSION_NAME, defaults={"version": 1})
+        self.assertEqual(self.expected("Changed"), species_index.search("genus 1 ch"))
+
+    def test_two_processes(self):
+        other = SpeciesPrefixIndex()
+        self.assertEqual(3, len(species_index.search("genus")))
+        self.assertEqual(3, len(other.search("genus")))
+        # the other process renames a species, this one another
+        Species.objects.filter(species="Species 1").update(species="First")
+        other.refresh(species=Species.objects.filter(species="First").values_list("pk", flat=True))
+        Species.objects.filter(species="Species 2").update(species="Second")
+        species_index.refresh(species=Species.objects.filter(species="Second").values_list("pk", flat=True))
+        self.assertEqual(self.expected("First"), species_index.search("genus 1 fi"))
+        self.assertEqual(self.expected("Second"), other.search("genus 1 se"))
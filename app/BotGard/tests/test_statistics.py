@@ -0,0 +1,61 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+
+from config_app.models import VersionToken
+from botman.statistics import render_dashboard, AliveTaxaChart, SeedAvailabilityChart, AccessionsChart
+from individuals.models import Individual, Outplanting
+
+from .fixtures import create_test_fixtures
+
+
+class TestStatistics(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_test_fixtures()
+
+    def setUp(self):
+        caches[settings.FRAGMENT_CACHE].clear()
+        self.client.login(username="User1", password="the-secret")
+
+    def test_dashboard(self):
+        url = reverse("botman:statistics")
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, "<svg", count=4)
+
+        # the charts come from the cache, the shared versions are read with one query
+        with self.assertNumQueries(1):
+            self.assertEqual(4, len(render_dashboard()))
+
+    def test_invalidation(self):
+        chart = AliveTaxaChart()
+        version = chart.get_version()
+        self.assertEqual([("T1", 2, 2, 1), ("T2", 1, 1, 1)], chart.get_data(version))
+
+        seeds = SeedAvailabilityChart()
+        seeds_version = seeds.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Outplanting.objects.filter(individual__accession_number=1002).get().delete()
+        self.assertNotEqual(version, chart.get_version())
+        self.assertEqual([("T1", 2, 2, 1)], chart.get_data(chart.get_version()))
+        # the seed chart does not depend on outplantings, but the recalc touched the individuals
+        self.assertNotEqual(seeds_version, seeds.get_version())
+
+        accessions = AccessionsChart()
+        version = accessions.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            individual = Individual.objects.get(accession_number=1000)
+            individual.source_date = datetime.date(2020, 5, 1)
+            individual.save()
+        self.assertNotEqual(version, accessions.get_version())
+        self.assertEqual(([2020], [("Garden 1", [1])]), accessions.get_data(accessions.get_version()))
+
+        # a change handled by another process
+        version = chart.get_version()
+        VersionToken.objects.filter(name="statistics:%s" % chart.name).update(version=1)
+        self.assertNotEqual(version, chart.get_version())
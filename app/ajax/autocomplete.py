@@ -8,6 +8,71 @@ from django.utils.safestring import mark_safe
 from django.utils.html import format_html
 from django.urls import reverse
 
+from tools.global_request import get_current_request
+
+
+class AutoFieldResolver:
+    """
+    Resolves the foreign keys of autocomplete fields with one query per related model.
+    The forms register the pks and texts of their fields when they are created,
+    the first lookup of a model then reads all registered values of that model.
+    All forms of a request share one resolver, e.g. the rows of an inline formset.
+    """
+    def __init__(self):
+        # model -> set of registered pks, model -> {pk: instance or None}
+        self._pks = {}
+        self._by_pk = {}
+        # (model, fieldname) -> set of registered texts, (model, fieldname) -> {text: list of instances}
+        self._values = {}
+        self._by_value = {}
+
+    def add_pk(self, model, pk):
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return
+        if pk not in self._by_pk.get(model, {}):
+            self._pks.setdefault(model, set()).add(pk)
+
+    def get_by_pk(self, model, pk):
+        """Returns the instance or None, raises TypeError or ValueError if pk is not a number"""
+        pk = int(pk)
+        loaded = self._by_pk.setdefault(model, {})
+        if pk not in loaded:
+            pks = self._pks.pop(model, set()) | {pk}
+            # e.g. Species.__str__ reads the family
+            select_related = getattr(model.__str__, "select_related", ())
+            found = {obj.pk: obj for obj in model.objects.filter(pk__in=pks).select_related(*select_related)}
+            for i in pks:
+                loaded[i] = found.get(i)
+        return loaded[pk]
+
+    def add_value(self, model, fieldname, value):
+        if value and value not in self._by_value.get((model, fieldname), {}):
+            self._values.setdefault((model, fieldname), set()).add(value)
+
+    def get_exact(self, model, fieldname, value):
+        """Returns the list of instances whose field equals the text"""
+        key = (model, fieldname)
+        loaded = self._by_value.setdefault(key, {})
+        if value not in loaded:
+            values = self._values.pop(key, set()) | {value}
+            for i in values:
+                loaded[i] = []
+            for obj in model.objects.filter(**{"%s__in" % fieldname: values}):
+                loaded.setdefault("%s" % getattr(obj, fieldname), []).append(obj)
+        return loaded[value]
+
+
+def get_autofield_resolver():
+    """Returns the AutoFieldResolver of the current request, a new one outside of requests"""
+    request = get_current_request()
+    if request is None:
+        return AutoFieldResolver()
+    if not hasattr(request, "_autofield_resolver"):
+        request._autofield_resolver = AutoFieldResolver()
+    return request._autofield_resolver
+
 
 class AutoFieldMixin:
     """
@@ -47,6 +112,21 @@ class AutoFieldMixin:
         elif hasattr(field, "choices") and field.choices:
             self.af_is_choices = True
 
+        # set by AutoCompleteForm, see autofield_resolver()
+        self.af_resolver = None
+
+    def autofield_resolver(self):
+        if self.af_resolver is None:
+            self.af_resolver = AutoFieldResolver()
+        return self.af_resolver
+
+    def autofield_register(self, value, is_pk):
+        """Register the initial pk or the submitted text for the batched lookup"""
+        if self.af_is_foreign:
+            if is_pk:
+                self.autofield_resolver().add_pk(self.af_model, value)
+            elif isinstance(value, str):
+                self.autofield_resolver().add_value(self.af_model, self.af_fieldname, value.strip())
 
     def autofield_widget_attrs(self, widget):
         meta = self.af_model._meta
@@ -73,19 +153,18 @@ class AutoFieldMixin:
                         return c[1]
                 return value
         try:
-            id = int(value)
-            o = self.af_model.objects.get(pk=id)
-            return "%s" % o
-        except (TypeError, ValueError, self.af_model.DoesNotExist):
+            o = self.autofield_resolver().get_by_pk(self.af_model, value)
+        except (TypeError, ValueError):
             return value
+        return value if o is None else "%s" % o
 
-    def _get_qset(self, value):
-        filter = { "%s__exact" % self.af_fieldname: value}
-        qset = self.af_model.objects.filter(**filter)
-        if not qset.exists():
+    def _get_instances(self, value):
+        """Returns the instances with the exact text, or up to two that contain it"""
+        instances = self.autofield_resolver().get_exact(self.af_model, self.af_fieldname, value)
+        if not instances:
             filter = { "%s__icontains" % self.af_fieldname: value}
-            qset = self.af_model.objects.filter(**filter)
-        return qset
+            instances = list(self.af_model.objects.filter(**filter)[:2])
+        return instances
 
     def autofield_to_python(self, value):
         if not self.af_is_foreign:
@@ -101,17 +180,16 @@ class AutoFieldMixin:
                     }, code = "invalid")
         if not value:
             return None
-        qset = self._get_qset(value)
-        #print("to_python", filter, qset)
-        if not qset.exists():
+        instances = self._get_instances(value)
+        if not instances:
             raise forms.ValidationError(
                 _('"%(value)s" is not an instance of the %(model)s model') % {
                     "value": value, "model": self.af_model._meta.verbose_name}, code='invalid')
-        if qset.count() > 1:
+        if len(instances) > 1:
             raise forms.ValidationError(
                 _('"%(value)s" is not a unique identifier for the %(model)s model') % {
                     "value": value, "model": self.af_model._meta.verbose_name}, code='invalid')
-        return qset[0]
+        return instances[0]
 
     def autofield_queryset(self):
         qset = self.af_model.objects.all()
@@ -122,8 +200,8 @@ class AutoFieldMixin:
             return None
         if not value:
             return None
-        qset = self._get_qset(value)
-        return qset[0] if qset.exists() and qset.count() == 1 else None
+        instances = self._get_instances(value)
+        return instances[0] if len(instances) == 1 else None
 
 
 class AutoCharField(AutoFieldMixin, forms.CharField):
@@ -244,17 +322,34 @@ def AutoCompleteForm(model_class, widgets: Optional[dict] = None):
 
         def __init__(self, *args, **kwargs):
             super(Form, self).__init__(*args, **kwargs)
-            for key in self.fields:
-                if hasattr(self, "exclude_autocomplete"):
-                    if key in self.exclude_autocomplete:
+            resolver = get_autofield_resolver()
+            for key, field_class in self.get_autocomplete_fields():
+                if key not in self.fields:
+                    continue
+                field = field_class(model_class, key, **field_attrs(self.fields[key]))
+                field.af_resolver = resolver
+                if self.is_bound:
+                    field.autofield_register(self.data.get(self.add_prefix(key)), is_pk=False)
+                else:
+                    field.autofield_register(self.initial.get(key), is_pk=True)
+                self.fields[key] = field
+
+        @classmethod
+        def get_autocomplete_fields(cls):
+            """Returns list of (field name, autocomplete field class), computed once per form class"""
+            if "_autocomplete_fields" not in cls.__dict__:
+                exclude = getattr(cls, "exclude_autocomplete", ())
+                fields = []
+                for key, field in cls.base_fields.items():
+                    if key in exclude:
                         continue
-                field = self.fields[key]
-                attrs = field_attrs(field)
-                if isinstance(field, forms.CharField):
-                    self.fields[key] = AutoCharField(model_class, key, **attrs)
-                elif isinstance(field, forms.ModelChoiceField):
-                    self.fields[key] = AutoModelField(model_class, key, **attrs)
-                elif isinstance(field, forms.ChoiceField) and len(field.choices) > 30:
-                    self.fields[key] = AutoCharField(model_class, key, **attrs)
+                    if isinstance(field, forms.CharField):
+                        fields.append((key, AutoCharField))
+                    elif isinstance(field, forms.ModelChoiceField):
+                        fields.append((key, AutoModelField))
+                    elif isinstance(field, forms.ChoiceField) and len(field.choices) > 30:
+                        fields.append((key, AutoCharField))
+                cls._autocomplete_fields = fields
+            return cls._autocomplete_fields
 
     return Form
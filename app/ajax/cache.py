@@ -0,0 +1,76 @@
+"""
+Response cache of the autocomplete endpoints
+
+Curators type the same prefixes all day, so the JSON responses of
+ajax:model_json and ajax:choices_json are cached in the fragment cache,
+keyed by the autocomplete id, the normalized term and a generation token
+of the model the values are read from. The token is shared by all worker
+processes (see config_app/versions.py) and replaced after a row of the
+model was saved or deleted (see the receivers in ajax/models.py),
+older entries are never read again and expire.
+
+The responses carry an ETag and `Cache-Control: private, no-cache`,
+the browser revalidates with If-None-Match and gets a 304 while the
+generation of the model did not change.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag, parse_etags
+
+from config_app.versions import get_version, get_versions, bump_version
+
+
+# seconds an unused response is kept
+CACHE_TIMEOUT = 24 * 3600
+
+
+def _cache():
+    return caches[settings.FRAGMENT_CACHE]
+
+
+def _version_name(model_label):
+    return "autocomplete:%s" % model_label
+
+
+def get_generation(model_label):
+    return get_version(_version_name(model_label))
+
+
+def bump_generation(model_label):
+    """Invalidate the cached responses of a model in all processes, e.g. "species.Family" """
+    bump_version(_version_name(model_label))
+
+
+def normalize_term(term):
+    """Strips and collapses the whitespace, the case is significant for exact matches"""
+    return " ".join((term or "").split())
+
+
+def cached_json_response(request, key, model_labels, compute):
+    """
+    :param key: tuple identifying the response, e.g. ("model", id, term)
+    :param model_labels: models the response is read from
+    :param compute: function returning the JSON data
+    :return: JsonResponse with ETag, or HttpResponseNotModified
+    """
+    versions = get_versions(_version_name(label) for label in model_labels)
+    generations = tuple(versions[_version_name(label)] for label in model_labels)
+    etag = quote_etag(hashlib.md5(repr((key, generations)).encode("utf-8")).hexdigest())
+
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = HttpResponseNotModified()
+    else:
+        cache_key = "autocomplete:response:%s" % etag.strip('"')
+        data = _cache().get(cache_key)
+        if data is None:
+            data = compute()
+            _cache().set(cache_key, data, CACHE_TIMEOUT)
+        response = JsonResponse(data)
+
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,38 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from individuals.calc import outplanting_recalc_done
+from tools.generated_fields import fields_updated
+from .cache import bump_generation
+
+
+# ----- invalidate the cached autocomplete responses, see ajax/cache.py -----
+
+# changed on most requests, never autocompleted
+IGNORED_APPS = ("sessions", "admin")
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def on_autocomplete_source_change(sender, raw=False, **kwargs):
+    # historical models of data migrations are saved before the token table exists
+    if raw or sender._meta.apps is not apps or sender._meta.app_label in IGNORED_APPS:
+        return
+    label = sender._meta.concrete_model._meta.label
+    # outplanting changes are flushed by individuals.calc, see on_outplanting_recalc()
+    if label != "individuals.Outplanting":
+        transaction.on_commit(lambda: bump_generation(label))
+
+
+@receiver(fields_updated)
+def on_generated_fields_updated(sender, **kwargs):
+    label = sender._meta.concrete_model._meta.label
+    transaction.on_commit(lambda: bump_generation(label))
+
+
+@receiver(outplanting_recalc_done)
+def on_outplanting_recalc(sender, **kwargs):
+    bump_generation("individuals.Outplanting")
+    bump_generation("individuals.Individual")
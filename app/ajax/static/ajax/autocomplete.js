@@ -64,8 +64,8 @@ $(function () {
             var modelid = $elem.attr('data-ac-id');
 
             if (modelid) {
-                $.getJSON(
-                    $elem.attr('data-ac-json-url'),
+                getAutocompleteJSON(
+                    $elem,
                     { term: request.term, id: modelid },
                     function(data) {
                         updateAutocompleteWidgetState($elem, data);
@@ -73,7 +73,10 @@ $(function () {
                             if (data.items)
                                 response(data.items);
                     }
-                );
+                ).fail(function() {
+                    // jquery-ui waits for a response on each request
+                    response([]);
+                });
             }
         },
         // update state on menu-close
@@ -115,9 +118,25 @@ function updateAutocompleteWidgetState($elem, data) {
 
 function verifyAutocompleteField($elem) {
     var modelid = $elem.attr('data-ac-id');
-    $.getJSON(
-        $elem.attr('data-ac-json-url'),
+    getAutocompleteJSON(
+        $elem,
         { term: $elem.val(), id: modelid },
         function(data) { updateAutocompleteWidgetState($elem, data); }
     );
+}
+
+/* $.getJSON that aborts the previous, still running request of the same field,
+   so a late response of an older term never overwrites the current state.
+   The responses carry an ETag, the browser revalidates its cached copy. */
+function getAutocompleteJSON($elem, params, callback) {
+    var previous = $elem.data('ac-request');
+    if (previous)
+        previous.abort();
+    var request = $.getJSON($elem.attr('data-ac-json-url'), params, callback);
+    request.always(function() {
+        if ($elem.data('ac-request') === request)
+            $elem.removeData('ac-request');
+    });
+    $elem.data('ac-request', request);
+    return request;
 }
\ No newline at end of file
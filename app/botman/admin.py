@@ -146,6 +146,30 @@ class OutgoingOrderAdmin(ConfigurableTable):
 admin.site.register(OutgoingOrder, OutgoingOrderAdmin)
 
 
+class PropagationJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "__str__", "model", "fields", "status", "progress_decorator", "started", "finished",
+    )
+    list_filter = ("status", )
+    fields = (
+        ("model", "object_repr"), "fields", "status", "progress_decorator",
+        ("created", "started", "finished"), "error",
+    )
+    readonly_fields = (
+        "model", "object_repr", "fields", "status", "progress_decorator", "created", "started", "finished", "error",
+    )
+    ordering = ("-created", )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(PropagationJob, PropagationJobAdmin)
+
+
 # TODO-3: maybe override AdminSite and use in each app
 #   (https://docs.djangoproject.com/en/3.1/ref/contrib/admin/#customizing-the-adminsite-class)
 admin.site.enable_nav_sidebar = False
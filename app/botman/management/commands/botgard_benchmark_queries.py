@@ -0,0 +1,61 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = 'Record EXPLAIN plans and timings of the changelist, checklist and autocomplete queries, ' \
+           'the queries per autocomplete keystroke and compare the outplanting statistics backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--individuals", type=int, default=0,
+            help="Add a synthetic dataset of this many individuals, it is removed afterwards",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Number of runs of each query")
+        parser.add_argument("--output", type=str, default=None, help="Save the results to this JSON file")
+        parser.add_argument(
+            "--baseline", type=str, default=None,
+            help="Compare with the results of a previous run, fails on new table scans or slower queries",
+        )
+        parser.add_argument(
+            "--tolerance", type=float, default=2.,
+            help="Report queries that are this factor slower than the baseline",
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic dataset")
+
+    def handle(self, *args, **options):
+        from tools.query_benchmark import (
+            create_synthetic_data, run_benchmark, compare, save_results, load_results,
+        )
+
+        starttime = datetime.datetime.now()
+        with transaction.atomic():
+            if options["individuals"]:
+                print("created %s individuals, %s outplantings" % create_synthetic_data(
+                    options["individuals"], verbose=True
+                ))
+            results = run_benchmark(repeat=options["repeat"])
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+        for name, result in results.items():
+            print("%-35s %10sms %6s rows  %s%s" % (
+                name, result["ms"], result["rows"],
+                ("table scan on %s" % ", ".join(result["full_scans"])) if result["full_scans"] else "",
+                ("%s queries" % result["queries"]) if "queries" in result else "",
+            ))
+            if options["verbosity"] > 1:
+                print(result["plan"])
+
+        if options["output"]:
+            save_results(results, options["output"])
+
+        endtime = datetime.datetime.now()
+        print("TOOK %s" % (endtime - starttime))
+
+        if options["baseline"]:
+            messages = compare(results, load_results(options["baseline"]), tolerance=options["tolerance"])
+            if messages:
+                raise CommandError("Regressions:\n%s" % "\n".join(messages))
@@ -6,12 +6,22 @@ from django.core.management.base import BaseCommand, CommandError
 class Command(BaseCommand):
     help = '(Re-)Calculate all Outplanting statistics'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Only compare the Territory and Department statistics with a full recount "
+                 "and repair the ones that differ",
+        )
+
     def handle(self, *args, **options):
-        from tools.data_migration import calc_outplantings, calc_individuals_outplantings
+        from tools.data_migration import calc_outplantings, calc_individuals_outplantings, verify_outplantings
 
         starttime = datetime.datetime.now()
-        calc_outplantings()
-        calc_individuals_outplantings()
+        if options["verify"]:
+            verify_outplantings()
+        else:
+            calc_outplantings()
+            calc_individuals_outplantings()
         endtime = datetime.datetime.now()
 
         print("TOOK %s" % (endtime - starttime))
@@ -0,0 +1,52 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Print the inventory checklists of Territories and Departments as one PDF or a ZIP of PDFs'
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", type=str, help="Filename of the .pdf or .zip file")
+        parser.add_argument(
+            "--territory", type=str, nargs="*", default=None,
+            help="Codes of the territories, all if no code is given",
+        )
+        parser.add_argument(
+            "--department", type=str, nargs="*", default=None,
+            help="Full codes of the departments, all if no code is given",
+        )
+        parser.add_argument(
+            "--processes", type=int, default=None,
+            help="Number of worker processes for the ZIP output, default is settings.CHECKLIST_PDF_PROCESSES",
+        )
+
+    def handle(self, *args, **options):
+        from individuals.models import Territory, Department
+        from individuals.checklists import collect_checklists, build_checklists_pdf, build_checklists_zip
+
+        if options["territory"] is None and options["department"] is None:
+            raise CommandError("Specify --territory and/or --department")
+
+        territories = Territory.objects.none()
+        if options["territory"] is not None:
+            territories = Territory.objects.all()
+            if options["territory"]:
+                territories = territories.filter(code__in=options["territory"])
+        departments = Department.objects.none()
+        if options["department"] is not None:
+            departments = Department.objects.all()
+            if options["department"]:
+                departments = departments.filter(full_code__in=options["department"])
+
+        starttime = datetime.datetime.now()
+        checklists = collect_checklists(territories, departments)
+        if options["output"].lower().endswith(".zip"):
+            data = build_checklists_zip(checklists, processes=options["processes"])
+        else:
+            data = build_checklists_pdf(checklists)
+        with open(options["output"], "wb") as fp:
+            fp.write(data)
+        endtime = datetime.datetime.now()
+
+        print("%s lists, TOOK %s" % (len(checklists), endtime - starttime))
@@ -0,0 +1,32 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Import Individuals and their Outplantings from a CSV or XLS file, see individuals/importer.py'
+
+    def add_arguments(self, parser):
+        parser.add_argument("filename", type=str)
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Check all rows and report the errors without storing anything",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        from individuals.importer import import_individuals, BATCH_SIZE
+
+        starttime = datetime.datetime.now()
+        with open(options["filename"], "rb") as fp:
+            result = import_individuals(
+                fp, options["filename"],
+                dry_run=options["dry_run"],
+                batch_size=options["batch_size"] or BATCH_SIZE,
+            )
+        endtime = datetime.datetime.now()
+
+        for row_number, error in result.errors:
+            print("row %s: %s" % (row_number, error))
+        print(result)
+        print("TOOK %s" % (endtime - starttime))
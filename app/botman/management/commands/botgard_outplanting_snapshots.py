@@ -0,0 +1,48 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the point-in-time statistics of Territories and Departments, or print them for a day'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date", type=str, nargs="*", default=None,
+            help="Print the living outplantings, individuals, species and genera at these days (YYYY-MM-DD)",
+        )
+        parser.add_argument(
+            "--territory", type=str, nargs="*", default=None,
+            help="Codes of the territories to print, all by default",
+        )
+        parser.add_argument("--departments", action="store_true", help="Print the departments as well")
+
+    def handle(self, *args, **options):
+        from individuals.models import Territory, Department
+        from individuals.snapshots import rebuild_all_snapshots
+
+        starttime = datetime.datetime.now()
+        if options["date"] is None:
+            print("wrote %s snapshots" % rebuild_all_snapshots())
+        else:
+            try:
+                dates = [datetime.date.fromisoformat(date) for date in options["date"]]
+            except ValueError as e:
+                raise CommandError(e)
+
+            territories = Territory.objects.order_by("code")
+            if options["territory"]:
+                territories = territories.filter(code__in=options["territory"])
+            locations = list(territories)
+            if options["departments"]:
+                locations += list(Department.objects.filter(territory__in=territories).order_by("full_code"))
+
+            print("%-40s %-10s %12s %12s %12s %12s" % ("", "date", "outplantings", "individuals", "species", "genera"))
+            for location in locations:
+                for date in dates:
+                    print("%-40s %-10s %12s %12s %12s %12s" % (
+                        location, date, *location.get_outplanting_snapshot(date).values()
+                    ))
+        endtime = datetime.datetime.now()
+
+        print("TOOK %s" % (endtime - starttime))
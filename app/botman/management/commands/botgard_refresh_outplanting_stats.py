@@ -0,0 +1,25 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Refresh the materialized view of the Territory and Department statistics (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--blocking", action="store_true",
+            help="Refresh without CONCURRENTLY, faster but blocks readers",
+        )
+
+    def handle(self, *args, **options):
+        from individuals.stats import use_matview, refresh_outplanting_stats
+
+        if not use_matview():
+            raise CommandError("OUTPLANTING_STATS_BACKEND is not 'matview' or the database is not PostgreSQL")
+
+        starttime = datetime.datetime.now()
+        refresh_outplanting_stats(concurrently=not options["blocking"])
+        endtime = datetime.datetime.now()
+
+        print("TOOK %s" % (endtime - starttime))
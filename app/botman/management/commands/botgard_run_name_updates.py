@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Run pending background name updates, e.g. those left over by a restarted server'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--restart-after", type=int, default=None,
+            help="Also restart running jobs that were started more than this number of minutes ago",
+        )
+
+    def handle(self, *args, **options):
+        from botman.models import run_propagation_jobs
+
+        restart_after = None
+        if options["restart_after"] is not None:
+            restart_after = datetime.timedelta(minutes=options["restart_after"])
+
+        starttime = datetime.datetime.now()
+        num_run = run_propagation_jobs(restart_after=restart_after)
+        endtime = datetime.datetime.now()
+
+        print("%s jobs, TOOK %s" % (num_run, endtime - starttime))
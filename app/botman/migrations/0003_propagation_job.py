@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 12:25
+
+import config_tables.admin
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botman', '0002_external_catalogs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropagationJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='model')),
+                ('object_repr', models.CharField(blank=True, max_length=200, verbose_name='changed entry')),
+                ('pks', models.JSONField(default=list)),
+                ('fields', models.JSONField(default=list, verbose_name='changed fields')),
+                ('status', models.CharField(choices=[('p', 'pending'), ('r', 'running'), ('d', 'done'), ('f', 'failed')], default='p', max_length=1, verbose_name='status')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='started')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='finished')),
+                ('num_done', models.IntegerField(default=0, verbose_name='processed entries')),
+                ('num_total', models.IntegerField(default=0, verbose_name='dependent entries')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+            ],
+            options={
+                'verbose_name': 'name update job',
+                'verbose_name_plural': 'name update jobs',
+                'ordering': ('-created',),
+            },
+            bases=(config_tables.admin.Configurable, models.Model),
+        ),
+    ]
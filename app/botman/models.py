@@ -1,4 +1,8 @@
-from django.db import models
+import traceback
+
+from django.db import models, transaction, connection
+from django.conf import settings
+from django.apps import apps
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
 from django.utils.safestring import mark_safe
@@ -11,6 +15,8 @@ from config_tables.admin import Configurable, configurable
 from ajax.autocomplete import AutoCompleteForm
 
 import config_app
+from tools import generated_fields
+from individuals.calc import outplanting_recalc_done
 
 # TODO: replace get_new_number, link methods still needed?, save still needed?
 
@@ -127,6 +133,12 @@ class BotanicGarden(Configurable, models.Model):
         super(BotanicGarden, self).save(*args, **kawrgs)
 
 
+generated_fields.register(
+    BotanicGarden, "full_name_generated", BotanicGarden.get_full_name,
+    depends_on=("number", "code", "name"),
+)
+
+
 class BotanicGardenForm(AutoCompleteForm(BotanicGarden)):
     pass
 
@@ -168,6 +180,7 @@ class ExternalCatalog(Configurable, models.Model):
         return str(_("garden catalog/%(date)s") % {
             "date": self.date_uploaded
         })
+    __str__.select_related = ("garden",)
 
     @configurable
     def delete_link_decorator(self):
@@ -189,6 +202,7 @@ class ExternalCatalog(Configurable, models.Model):
         return self.garden.num_orders_generated
     num_orders_decorator.admin_order_field = "garden__num_orders_generated"
     num_orders_decorator.short_description = _('number of orders')
+    num_orders_decorator.select_related = ("garden",)
 
     @configurable
     def garden_link_decorator(self):
@@ -198,6 +212,7 @@ class ExternalCatalog(Configurable, models.Model):
         return "-"
     garden_link_decorator.admin_order_field = "garden__full_name_generated"
     garden_link_decorator.short_description = _('Botanic garden')
+    garden_link_decorator.select_related = ("garden",)
 
 
 class ExternalCatalogForm(AutoCompleteForm(ExternalCatalog)):
@@ -245,6 +260,7 @@ class OutgoingOrder(Configurable, models.Model):
                 "user": self.user,
             }
         return _("outgoing order")
+    __str__.select_related = ("garden", "user")
 
     @configurable
     def garden_link_decorator(self):
@@ -254,6 +270,7 @@ class OutgoingOrder(Configurable, models.Model):
         return "-"
     garden_link_decorator.admin_order_field = "garden__full_name_generated"
     garden_link_decorator.short_description = _('Botanic garden')
+    garden_link_decorator.select_related = ("garden",)
     garden_link_decorator.exclude_csv = True
 
     @configurable
@@ -264,6 +281,7 @@ class OutgoingOrder(Configurable, models.Model):
             return "-"
     garden_email_decorator.admin_order_field = 'garden__email'
     garden_email_decorator.short_description = _('garden email')
+    garden_email_decorator.select_related = ("garden",)
     garden_email_decorator.as_csv = lambda s: s[s.index('<a href')+16:s.index('"', s.index('<a href')+16)] if "<a href" in s else s
 
     @configurable
@@ -274,6 +292,7 @@ class OutgoingOrder(Configurable, models.Model):
             return "-"
     user_email_decorator.admin_order_field = 'user__email'
     user_email_decorator.short_description = _('user email')
+    user_email_decorator.select_related = ("user",)
     user_email_decorator.as_csv = lambda s: s[s.index('<a href')+16:s.index('"', s.index('<a href')+16)] if "<a href" in s else s
 
 
@@ -283,12 +302,126 @@ class OutgoingOrder(Configurable, models.Model):
             return self.garden.catalog_date_generated
     catalog_date.admin_order_field = 'garden__catalog_date_generated'
     catalog_date.short_description = _('latest catalog date')
+    catalog_date.select_related = ("garden",)
 
 
 class OutgoingOrderForm(AutoCompleteForm(OutgoingOrder)):
     pass
 
 
+class PropagationJob(Configurable, models.Model):
+    """
+    Background update of generated fields after a change of their sources,
+    e.g. the Species and Individual names after a genus was renamed.
+    See tools/generated_fields.py
+    """
+    class Meta:
+        verbose_name = _('name update job')
+        verbose_name_plural = _('name update jobs')
+        ordering = ('-created',)
+
+    STATUS_CHOICES = (
+        ("p", _("pending")),
+        ("r", _("running")),
+        ("d", _("done")),
+        ("f", _("failed")),
+    )
+
+    # "app_label.ModelName" of the changed rows
+    model = models.CharField(verbose_name=_("model"), max_length=100)
+    object_repr = models.CharField(verbose_name=_("changed entry"), max_length=200, blank=True)
+    pks = models.JSONField(default=list)
+    fields = models.JSONField(verbose_name=_("changed fields"), default=list)
+
+    status = models.CharField(verbose_name=_("status"), max_length=1, choices=STATUS_CHOICES, default="p")
+    created = models.DateTimeField(verbose_name=_("created"), auto_now_add=True)
+    started = models.DateTimeField(verbose_name=_("started"), null=True, blank=True)
+    finished = models.DateTimeField(verbose_name=_("finished"), null=True, blank=True)
+    num_done = models.IntegerField(verbose_name=_("processed entries"), default=0)
+    num_total = models.IntegerField(verbose_name=_("dependent entries"), default=0)
+    error = models.TextField(verbose_name=_("error"), blank=True)
+
+    def __str__(self):
+        return "%s: %s" % (self.created.strftime("%Y-%m-%d %H:%M") if self.created else "-", self.object_repr)
+
+    @classmethod
+    def create_for(cls, instance, changed_fields):
+        """
+        Creates a job for the changed model instance,
+        it is started when the current transaction commits
+        """
+        job = cls.objects.create(
+            model=instance._meta.concrete_model._meta.label,
+            object_repr=str(instance)[:200],
+            pks=[instance.pk],
+            fields=sorted(changed_fields),
+        )
+        transaction.on_commit(job.start)
+        return job
+
+    def start(self):
+        if settings.GENERATED_FIELDS_BACKGROUND:
+            from tools.postpone import postpone
+            postpone(_run_propagation_job)(self.pk)
+        else:
+            self.run()
+
+    def run(self):
+        """
+        Runs the job if it is pending
+        :return: True if the job was run
+        """
+        # claim the job, another process might have started it
+        if not PropagationJob.objects.filter(pk=self.pk, status="p").update(status="r", started=timezone.now()):
+            return False
+        try:
+            generated_fields.propagate(
+                apps.get_model(self.model), self.pks, set(self.fields), progress=self._set_progress,
+            )
+        except Exception:
+            PropagationJob.objects.filter(pk=self.pk).update(
+                status="f", finished=timezone.now(), error=traceback.format_exc(),
+            )
+            raise
+        PropagationJob.objects.filter(pk=self.pk).update(status="d", finished=timezone.now())
+        self.refresh_from_db()
+        return True
+
+    def _set_progress(self, num_done, num_total):
+        PropagationJob.objects.filter(pk=self.pk).update(num_done=num_done, num_total=num_total)
+
+    @configurable
+    def progress_decorator(self):
+        if self.status == "d":
+            return "100%"
+        if not self.num_total:
+            return "-"
+        return "%s%% (%s / %s)" % (self.num_done * 100 // self.num_total, self.num_done, self.num_total)
+    progress_decorator.short_description = _('progress')
+
+
+def _run_propagation_job(pk):
+    try:
+        PropagationJob.objects.get(pk=pk).run()
+    finally:
+        # the worker thread has its own connection
+        connection.close()
+
+
+def run_propagation_jobs(restart_after=None):
+    """
+    Runs all pending jobs, e.g. those left over by a restarted server
+    :param restart_after: datetime.timedelta, restart running jobs that were started before that time
+    :return: number of jobs run
+    """
+    if restart_after is not None:
+        PropagationJob.objects.filter(status="r", started__lt=timezone.now() - restart_after).update(status="p")
+    num_run = 0
+    for job in PropagationJob.objects.filter(status="p").order_by("created"):
+        num_run += job.run()
+    return num_run
+
+
 # ----- recalc: BotanicGarden.num_orders_generated and catalog_date -----
 
 @receiver(post_save, sender=OutgoingOrder)
@@ -313,3 +446,24 @@ def on_external_catalog_save(sender, instance, **kwargs):
 def on_external_catalog_delete(sender, instance, **kwargs):
     if instance.garden:
         instance.garden.save()
+
+
+# ----- invalidate the cached statistics dashboard, see botman/statistics.py -----
+
+@receiver(post_save)
+@receiver(post_delete)
+def on_statistics_source_change(sender, raw=False, **kwargs):
+    from .statistics import invalidate_statistics, is_statistics_source
+    label = sender._meta.concrete_model._meta.label
+    # outplanting changes are flushed by individuals.calc, see on_outplanting_recalc(),
+    # historical models of data migrations are saved before the token table exists
+    if not raw and label != "individuals.Outplanting" and is_statistics_source(label) \
+            and sender._meta.apps is apps:
+        transaction.on_commit(lambda: invalidate_statistics(label))
+
+
+@receiver(outplanting_recalc_done)
+def on_outplanting_recalc(sender, **kwargs):
+    from .statistics import invalidate_statistics
+    invalidate_statistics("individuals.Outplanting")
+    invalidate_statistics("individuals.Individual")
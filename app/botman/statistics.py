@@ -0,0 +1,235 @@
+"""
+Collection statistics dashboard
+
+Each chart reads its data with aggregate queries and renders it to SVG
+with pygal. Both the data and the SVG (per language) are cached in the
+fragment cache. The cache keys contain a version token per chart, shared
+by all worker processes (see config_app/versions.py), that is replaced
+when one of the models the chart `depends_on` is saved or deleted
+(see the receivers in botman/models.py), or when the outplanting
+statistics are recalculated.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+from django.db.models.functions import ExtractYear
+from django.utils.translation import gettext_lazy as _, get_language
+
+from config_app.versions import get_version, get_versions, bump_versions
+
+
+# source gardens shown separately in the accessions chart, the others are summed up
+MAX_GARDENS = 8
+
+_charts = []
+
+
+def _cache():
+    return caches[settings.FRAGMENT_CACHE]
+
+
+class StatisticsChart:
+    # unique name, used in the cache keys
+    name = None
+    title = None
+    # model labels, a change of any of them invalidates the chart
+    depends_on = ()
+
+    def aggregate(self):
+        """Returns the plain, cacheable data of the chart"""
+        raise NotImplementedError
+
+    def render(self, data):
+        """Returns the pygal chart of the data"""
+        raise NotImplementedError
+
+    def _version_name(self):
+        return "statistics:%s" % self.name
+
+    def _data_key(self, version):
+        return "statistics:%s:%s:data" % (self.name, version)
+
+    def _svg_key(self, version):
+        return "statistics:%s:%s:svg:%s" % (self.name, version, get_language())
+
+    def invalidate(self):
+        bump_versions((self._version_name(), ))
+
+    def get_version(self):
+        return get_version(self._version_name())
+
+    def get_data(self, version):
+        data = _cache().get(self._data_key(version))
+        if data is None:
+            data = self.aggregate()
+            _cache().set(self._data_key(version), data)
+        return data
+
+    def get_svg(self, version=None):
+        if version is None:
+            version = self.get_version()
+        svg = _cache().get(self._svg_key(version))
+        if svg is None:
+            chart = self.render(self.get_data(version))
+            svg = chart.render(is_unicode=True, disable_xml_declaration=True)
+            _cache().set(self._svg_key(version), svg)
+        return svg
+
+
+def register(chart_class):
+    """Class decorator to add a chart to the dashboard"""
+    _charts.append(chart_class())
+    return chart_class
+
+
+def _pygal_config(chart_class, **kwargs):
+    # no external javascript, the tooltips are plain <title> elements
+    return chart_class(js=(), disable_xml_declaration=True, width=800, height=400, **kwargs)
+
+
+@register
+class AliveTaxaChart(StatisticsChart):
+    name = "alive-taxa"
+    title = _("Living taxa per territory")
+    depends_on = (
+        "individuals.Outplanting", "individuals.Individual", "individuals.Department", "individuals.Territory",
+        "species.Species", "species.Family",
+    )
+
+    def aggregate(self):
+        from individuals.models import Outplanting
+        return list(
+            Outplanting.objects.filter(plant_died=None, department__territory__isnull=False)
+            .values_list("department__territory__code")
+            .annotate(
+                individuals=models.Count("individual", distinct=True),
+                species=models.Count("individual__species", distinct=True),
+                genera=models.Count("individual__species__family__genus", distinct=True),
+            )
+            .order_by("department__territory__code")
+        )
+
+    def render(self, data):
+        import pygal
+        chart = _pygal_config(pygal.Bar, x_label_rotation=45)
+        chart.x_labels = [row[0] for row in data]
+        for i, title in enumerate((_("individuals"), _("species"), _("genera")), 1):
+            chart.add("%s" % title, [row[i] for row in data])
+        return chart
+
+
+@register
+class AccessionsChart(StatisticsChart):
+    name = "accessions"
+    title = _("Accessions per year and source garden")
+    depends_on = ("individuals.Individual", "botman.BotanicGarden")
+
+    def aggregate(self):
+        from individuals.models import Individual
+        rows = list(
+            Individual.objects.filter(source_date__isnull=False)
+            .annotate(year=ExtractYear("source_date"))
+            .values_list("year", "source__name")
+            .annotate(count=models.Count("pk"))
+            .order_by("year")
+        )
+        totals = {}
+        rows = [(year, garden or "", count) for year, garden, count in rows]
+        for year, garden, count in rows:
+            totals[garden] = totals.get(garden, 0) + count
+        gardens = sorted(totals, key=lambda garden: -totals[garden])[:MAX_GARDENS]
+        years = sorted({row[0] for row in rows})
+        counts = {}
+        for year, garden, count in rows:
+            key = garden if garden in gardens else None
+            counts[(year, key)] = counts.get((year, key), 0) + count
+        series = [
+            (garden, [counts.get((year, garden), 0) for year in years])
+            for garden in gardens + ([None] if len(totals) > len(gardens) else [])
+        ]
+        return years, series
+
+    def render(self, data):
+        import pygal
+        years, series = data
+        chart = _pygal_config(pygal.StackedBar, x_label_rotation=45, legend_at_bottom=True)
+        chart.x_labels = ["%s" % year for year in years]
+        for garden, counts in series:
+            chart.add("%s" % (_("other") if garden is None else garden or _("unknown")), counts)
+        return chart
+
+
+@register
+class EndangeredChart(StatisticsChart):
+    name = "endangered"
+    title = _("Species by endangering")
+    depends_on = ("species.Species", "individuals.Individual", "individuals.Outplanting")
+
+    def aggregate(self):
+        from species.models import Species, PROTECTION_OF_SPECIES_CHOICES
+        species = dict(
+            Species.objects.exclude(protection_of_species="")
+            .values_list("protection_of_species").annotate(count=models.Count("pk")).order_by()
+        )
+        alive = dict(
+            Species.objects.exclude(protection_of_species="").filter(individual__is_alive_generated=True)
+            .values_list("protection_of_species").annotate(count=models.Count("pk", distinct=True)).order_by()
+        )
+        return [(code, species.get(code, 0), alive.get(code, 0)) for code, label in PROTECTION_OF_SPECIES_CHOICES]
+
+    def render(self, data):
+        import pygal
+        chart = _pygal_config(pygal.Bar)
+        chart.x_labels = [row[0] for row in data]
+        chart.add("%s" % _("species"), [row[1] for row in data])
+        chart.add("%s" % _("living in the collection"), [row[2] for row in data])
+        return chart
+
+
+@register
+class SeedAvailabilityChart(StatisticsChart):
+    name = "seeds"
+    title = _("Seed availability")
+    depends_on = ("individuals.Individual", )
+
+    def aggregate(self):
+        from individuals.models import Individual
+        return list(
+            Individual.objects.values_list("seed_available", "seed_in_stock")
+            .annotate(count=models.Count("pk")).order_by("-seed_available", "-seed_in_stock")
+        )
+
+    def render(self, data):
+        import pygal
+        labels = {
+            (True, True): _("available, in stock"),
+            (True, False): _("available, not in stock"),
+            (False, True): _("not available, in stock"),
+            (False, False): _("no seed"),
+        }
+        chart = _pygal_config(pygal.Pie, inner_radius=.4)
+        for available, in_stock, count in data:
+            chart.add("%s" % labels[(available, in_stock)], count)
+        return chart
+
+
+def render_dashboard():
+    """Returns a list of (title, svg) of all charts"""
+    versions = get_versions(chart._version_name() for chart in _charts)
+    return [(chart.title, chart.get_svg(versions[chart._version_name()])) for chart in _charts]
+
+
+def invalidate_statistics(model_label=None):
+    """
+    Invalidate the charts that depend on a model
+    :param model_label: e.g. "individuals.Individual", None for all charts
+    """
+    bump_versions(
+        chart._version_name() for chart in _charts
+        if model_label is None or model_label in chart.depends_on
+    )
+
+
+def is_statistics_source(model_label):
+    """True if any chart depends on the model"""
+    return any(model_label in chart.depends_on for chart in _charts)
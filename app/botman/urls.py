@@ -11,4 +11,5 @@ urlpatterns = [
     url(r'^admin/?',                                views.data_admin_view,      name="data_admin"),
 
     url(r'^activity/?$',                            views.activity_view,        name='activity'),
+    url(r'^statistics/?$',                          views.statistics_view,      name='statistics'),
 ]
\ No newline at end of file
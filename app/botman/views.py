@@ -50,7 +50,8 @@ def data_admin_view(request):
             calc_all()
 
         elif "recalc-individuals-outplantings" in request.POST:
-            calc_individuals_outplantings()
+            num_updated = calc_individuals_outplantings()
+            ctx["info"] += " (%s individuals updated)" % num_updated
 
         elif "recalc-outplanting" in request.POST:
             calc_outplantings()
@@ -61,6 +62,16 @@ def data_admin_view(request):
         elif "strip-whitespace" in request.POST:
             strip_whitespace()
 
+        elif "import-individuals" in request.POST:
+            from individuals.importer import import_individuals
+            upload = request.FILES.get("file")
+            if upload is None:
+                ctx["error"] = _("No file selected")
+            else:
+                result = import_individuals(upload, upload.name, dry_run="dry-run" in request.POST)
+                ctx["info"] = "%s" % result
+                ctx["import_errors"] = result.errors
+
         elif "del-table-settings" in request.POST:
             try:
                 pk = int(request.POST.get("pk", 0))
@@ -111,3 +122,13 @@ def activity_view(request):
         "histogram": histogram,
     })
     return render(request, "botman/activity.html", ctx)
+
+
+@login_required
+def statistics_view(request):
+    from individuals.models import Individual
+    from .statistics import render_dashboard
+
+    ctx = minimal_admin_context(request, Individual, _("collection statistics"))
+    ctx["charts"] = render_dashboard()
+    return render(request, "botman/statistics.html", ctx)
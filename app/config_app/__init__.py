@@ -1,8 +1,18 @@
+import copy
 import json
+import threading
 from django.utils.translation import gettext_lazy as _
 
 _defaults = {}
 
+# token of all KeyValues, see config_app/versions.py
+VERSION_NAME = "config_app.KeyValue"
+
+# (version, {key: (KeyValue, parsed json value)}) of all stored keys, replaced as a whole.
+# Text values are read from the KeyValue instances, so they follow the active language.
+_values = None
+_lock = threading.Lock()
+
 
 def register_key(key, default, description=None, validator=None):
     """
@@ -20,19 +30,66 @@ def register_key(key, default, description=None, validator=None):
     _defaults[key] = (default, description, validator)
 
 
-def get_value(key):
+def load_values():
+    """Reads all KeyValues into the process-local cache, e.g. to preload them at startup"""
+    global _values
     from .models import KeyValue
-    try:
-        val = KeyValue.objects.get(key=key)
-        if val.type == 't':
-            return val.value
-        if val.type == 'j':
-            if isinstance(val.value_json, str):
-                return json.loads(val.value_json)
-            return val.value_json
-        raise ValueError('Invalid type \'%s\' in KeyValue \'%s\'' % (val.type, val.key))
-    except KeyValue.DoesNotExist:
+    from .versions import get_version
+    version = get_version(VERSION_NAME)
+    values = {}
+    for val in KeyValue.objects.all():
+        if val.type == 'j' and isinstance(val.value_json, str):
+            values[val.key] = (val, json.loads(val.value_json))
+        else:
+            values[val.key] = (val, val.value_json)
+    cached = (version, values)
+    with _lock:
+        _values = cached
+    return cached
+
+
+def invalidate_values():
+    """Drops the process-local cache, called after a KeyValue of this process was saved or deleted"""
+    global _values
+    with _lock:
+        _values = None
+
+
+def _get_cached_values():
+    """
+    Returns the cached KeyValues. The version is checked with one query,
+    during a request only on the first call.
+    """
+    from .versions import get_version
+    cached = _values
+    if cached is None or cached[0] != get_version(VERSION_NAME):
+        cached = load_values()
+    return cached[1]
+
+
+def _get_cached_value(values, key):
+    if key not in values:
         return _defaults[key][0]
+    val, value_json = values[key]
+    if val.type == 't':
+        return val.value
+    if val.type == 'j':
+        # callers may modify the returned objects
+        return copy.deepcopy(value_json)
+    raise ValueError('Invalid type \'%s\' in KeyValue \'%s\'' % (val.type, val.key))
+
+
+def get_value(key):
+    return _get_cached_value(_get_cached_values(), key)
+
+
+def get_values(*keys):
+    """
+    Returns several values with at most one version check
+    :return: dict of key -> value
+    """
+    values = _get_cached_values()
+    return {key: _get_cached_value(values, key) for key in keys}
 
 
 def get_description(key):
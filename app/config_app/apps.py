@@ -1,7 +1,19 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 from django.utils.translation import gettext_lazy as _
 
 
+def preload_values(**kwargs):
+    """Loads all KeyValues with the first request of the process"""
+    from config_app import load_values
+    request_started.disconnect(preload_values)
+    load_values()
+
+
 class ConfigAppConfig(AppConfig):
     name = 'config_app'
     verbose_name = _("Configuration")
+
+    def ready(self):
+        # the database must not be accessed before the app registry is ready
+        request_started.connect(preload_values)
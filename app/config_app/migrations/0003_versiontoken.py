@@ -0,0 +1,24 @@
+# Generated by Django 3.2 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_app', '0002_configversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.DeleteModel(
+            name='ConfigVersion',
+        ),
+    ]
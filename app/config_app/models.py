@@ -1,6 +1,8 @@
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import mark_safe
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 
 class KeyValue(models.Model):
@@ -47,3 +49,21 @@ class KeyValue(models.Model):
         raise ValueError(_('Invalid type in KeyValue "%s"') % self.type)
     value_decorator.short_description = _("value")
     value_decorator.admin_order_field = "value"
+
+
+class VersionToken(models.Model):
+    """Token of shared data, replaced on every change, see config_app/versions.py"""
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+@receiver(post_save, sender=KeyValue)
+@receiver(post_delete, sender=KeyValue)
+def on_key_value_change(sender, instance, **kwargs):
+    from config_app import invalidate_values, VERSION_NAME
+    from config_app.versions import bump_version
+    bump_version(VERSION_NAME)
+    invalidate_values()
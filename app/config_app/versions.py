@@ -0,0 +1,90 @@
+"""
+Version tokens shared by all worker processes
+
+Process-local caches (the config values, autocomplete responses, statistics
+charts, the species prefix index) keep a token of the data they were built
+from. The tokens are stored in VersionToken rows, so a change handled by one
+worker invalidates the caches of all of them:
+
+    bump_version("statistics:alive-taxa")   # after the data changed
+    get_version("statistics:alive-taxa")    # compared with the cached token
+
+During a request every token is read at most once, all tokens requested
+together with one query. Outside of requests they are read on each call.
+"""
+import time
+
+from django.db import transaction
+
+from tools.global_request import get_current_request
+
+
+def _request_versions():
+    """Returns the dict of tokens read during the current request, or None"""
+    request = get_current_request()
+    if request is None:
+        return None
+    if not hasattr(request, "_version_tokens"):
+        request._version_tokens = {}
+    return request._version_tokens
+
+
+def get_versions(names):
+    """
+    :param names: iterable of token names
+    :return: dict of name -> token, 0 for tokens that were never bumped
+    """
+    from .models import VersionToken
+    names = set(names)
+    known = _request_versions()
+    versions = {name: known[name] for name in names if known and name in known}
+    missing = names - set(versions)
+    if missing:
+        read = dict.fromkeys(missing, 0)
+        read.update(VersionToken.objects.filter(name__in=missing).values_list("name", "version"))
+        if known is not None:
+            known.update(read)
+        versions.update(read)
+    return versions
+
+
+def get_version(name):
+    return get_versions((name, ))[name]
+
+
+def bump_versions(names):
+    """
+    Replaces the tokens, the caches built from the older ones are not used anymore
+    :return: the new token
+    """
+    from .models import VersionToken
+    names = set(names)
+    if not names:
+        return None
+    # a new token instead of a counter, a rolled back change never leaves its version behind
+    version = time.time_ns()
+    # rows of new names, bulk_create sends no post_save for the autocomplete cache
+    VersionToken.objects.bulk_create(
+        [VersionToken(name=name, version=version) for name in names], ignore_conflicts=True,
+    )
+    VersionToken.objects.filter(name__in=names).update(version=version)
+    known = _request_versions()
+    if known is not None:
+        known.update(dict.fromkeys(names, version))
+    return version
+
+
+def bump_version(name):
+    return bump_versions((name, ))
+
+
+def swap_version(name):
+    """
+    Replaces a token like bump_version(), the row is locked while the previous token is read
+    :return: tuple of (previous token, new token)
+    """
+    from .models import VersionToken
+    with transaction.atomic():
+        VersionToken.objects.bulk_create([VersionToken(name=name)], ignore_conflicts=True)
+        previous = VersionToken.objects.select_for_update().filter(name=name).values_list("version", flat=True).get()
+        return previous, bump_version(name)
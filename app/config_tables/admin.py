@@ -14,9 +14,11 @@ from django.urls import reverse
 from operator import itemgetter
 import django.core.exceptions
 from django.contrib.admin.utils import label_for_field
+from django.contrib.admin.views.main import ChangeList
 
 from .forms import TableSettingsForm
 from .models import TableSettings
+from .query_plan import QueryPlan
 from tools.csv_response import csv_response
 
 
@@ -87,10 +89,36 @@ class ForeignKeyFilter(admin.AllValuesFieldListFilter):
         return False
 
 
+class ConfigurableChangeList(ChangeList):
+    """
+    ChangeList that fetches the result page with the QueryPlan of the displayed columns.
+    The plan is only applied to the results, not to the queryset used for admin actions.
+    """
+    def get_results(self, request):
+        queryset = self.queryset
+        plan = self.model_admin.get_list_query_plan(self.list_display)
+        self.queryset = plan.apply(queryset)
+        try:
+            super(ConfigurableChangeList, self).get_results(request)
+        finally:
+            self.queryset = queryset
+        plan.prefetch_results(self.result_list)
+
+
 class ConfigurableTable(admin.ModelAdmin, Configurable):
     change_list_template = 'config_tables/change_list.html'
     configuretable_template = 'config_tables/configuretable.html'
 
+    # wide model fields that are only fetched when shown in the list
+    # or required by a decorator (see config_tables.query_plan)
+    list_deferrable_fields = ()
+
+    def get_changelist(self, request, **kwargs):
+        return ConfigurableChangeList
+
+    def get_list_query_plan(self, list_display):
+        return QueryPlan(self.model, list_display, self, self.list_deferrable_fields)
+
     def _get_actual_tablesettings_object(self, request):
         user = request.user
         modelstring = '%s.%s' % (self.model._meta.app_label, self.model._meta.model_name)
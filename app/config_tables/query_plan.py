@@ -0,0 +1,125 @@
+"""
+Column-aware query planning for ConfigurableTable changelists
+
+Decorator functions declare what they need to render with function attributes,
+the same way they declare `short_description` or `admin_order_field`:
+
+    @configurable
+    def species_link_decorator(self):
+        ...
+    species_link_decorator.select_related = ("species__family",)
+
+Supported attributes:
+    select_related:   tuple of relation paths for QuerySet.select_related()
+    prefetch_related: tuple of lookups, Prefetch objects or callables returning a Prefetch
+    annotate:         dict of name -> expression for QuerySet.annotate()
+    uses_fields:      tuple of model fields the decorator reads that would otherwise be deferred
+    prefetch:         tuple of functions(list of instances) called once with the result page,
+                      e.g. to load values for all rows from a cache
+
+ForeignKey fields in the list follow the `select_related` declaration
+of the related model's __str__ method.
+"""
+from django.db import models
+from django.core.exceptions import FieldDoesNotExist
+
+
+class QueryPlan:
+    """
+    The relations and columns needed to render a set of list columns
+    """
+    def __init__(self, model, list_display, model_admin=None, deferrable_fields=()):
+        """
+        :param model: the Model class of the list
+        :param list_display: list of field names or decorator names
+        :param model_admin: ModelAdmin instance to look up admin decorators
+        :param deferrable_fields: wide model fields that are only fetched when needed
+        """
+        self.model = model
+        self.select_related = []
+        self.prefetch_related = []
+        self.annotate = {}
+        self.used_fields = set()
+        self.prefetch = []
+
+        for name in list_display:
+            self._add_column(name, model_admin)
+
+        self.deferred_fields = [
+            name for name in deferrable_fields
+            if name not in self.used_fields
+        ]
+
+    def _add_column(self, name, model_admin):
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            field = None
+
+        if field is not None:
+            self.used_fields.add(field.name)
+            if isinstance(field, models.ForeignKey):
+                self._add_select_related(field.name)
+                str_func = getattr(field.related_model, "__str__", None)
+                for path in getattr(str_func, "select_related", ()):
+                    self._add_select_related("%s__%s" % (field.name, path))
+            return
+
+        func = get_column_function(self.model, name, model_admin)
+        if func is None:
+            return
+        for path in getattr(func, "select_related", ()):
+            self._add_select_related(path)
+        for lookup in getattr(func, "prefetch_related", ()):
+            if callable(lookup):
+                lookup = lookup()
+            if lookup not in self.prefetch_related:
+                self.prefetch_related.append(lookup)
+        self.annotate.update(getattr(func, "annotate", {}))
+        self.used_fields.update(getattr(func, "uses_fields", ()))
+        for loader in getattr(func, "prefetch", ()):
+            if loader not in self.prefetch:
+                self.prefetch.append(loader)
+
+    def _add_select_related(self, path):
+        if path not in self.select_related:
+            self.select_related.append(path)
+
+    def only_fields(self):
+        """Returns the names of all concrete fields that need to be fetched"""
+        return [
+            field.name for field in self.model._meta.concrete_fields
+            if field.name not in self.deferred_fields
+        ]
+
+    def apply(self, qset):
+        """Returns the QuerySet with all planned optimizations applied"""
+        if self.select_related:
+            qset = qset.select_related(*self.select_related)
+        if self.prefetch_related:
+            qset = qset.prefetch_related(*self.prefetch_related)
+        if self.annotate:
+            qset = qset.annotate(**self.annotate)
+        if self.deferred_fields:
+            qset = qset.only(*self.only_fields())
+        return qset
+
+    def prefetch_results(self, objects):
+        """Calls the `prefetch` functions with the fetched result page"""
+        if self.prefetch:
+            objects = list(objects)
+            for loader in self.prefetch:
+                loader(objects)
+
+
+def get_column_function(model, name, model_admin=None):
+    """
+    Returns the decorator function for a list column name,
+    in the same lookup order as django.contrib.admin.utils.lookup_field
+    """
+    if callable(name):
+        return name
+    if model_admin is not None and name != "__str__" and hasattr(model_admin, name):
+        return getattr(model_admin, name)
+    func = getattr(model, name, None)
+    return func if callable(func) else None
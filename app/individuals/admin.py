@@ -5,19 +5,90 @@ from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.contrib.admin import SimpleListFilter
 from django import forms
+from django.conf import settings
 from django.db import transaction
+from django.http import HttpResponse
 
 from .models import *
+from .models.territory import CalcOutplantingsMixin
+from .stats import use_matview, stats_annotations, apply_stats, ensure_columns_current
 from plantimages.admin import PlantImageInline
 # from seedcatalog.models import SeedCatalog
 
 from tools import readOnlyAdmin
-from config_tables.admin import ConfigurableTable, ForeignKeyFilter
+from tools.search import SearchTextAdminMixin
+from config_tables.admin import ConfigurableTable, ConfigurableChangeList, ForeignKeyFilter
 from ajax.autocomplete import AutoCompleteForm
 from labels.mass_action import add_label_mass_actions
 
 
-class DepartmentAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
+class OutplantingStatsChangeList(ConfigurableChangeList):
+    """
+    Reads the num_* columns from the materialized view
+    when the "matview" statistics backend is active
+    """
+    def get_ordering_field(self, field_name):
+        if use_matview() and field_name in CalcOutplantingsMixin.OUTPLANTING_COUNTER_FIELDS:
+            return "stats_%s" % field_name
+        return super().get_ordering_field(field_name)
+
+    def get_results(self, request):
+        super().get_results(request)
+        apply_stats(self.result_list)
+
+
+class OutplantingStatsAdminMixin:
+    """Territory and Department statistics of the selected backend, see individuals/stats.py"""
+
+    def get_queryset(self, request):
+        qset = super().get_queryset(request)
+        if use_matview():
+            qset = qset.annotate(**stats_annotations(self.model))
+        else:
+            # the columns missed the changes while the view was used
+            ensure_columns_current()
+        return qset
+
+    def get_changelist(self, request, **kwargs):
+        return OutplantingStatsChangeList
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None:
+            apply_stats([obj])
+        return obj
+
+
+class ChecklistActionsMixin:
+    """Admin actions that print the inventory checklists of the selected locations"""
+
+    actions = ("checklists_pdf_action", "checklists_zip_action")
+
+    def _collect_checklists(self, queryset):
+        from .checklists import collect_checklists
+        if self.model is Territory:
+            return collect_checklists(territories=queryset)
+        return collect_checklists(departments=queryset)
+
+    @admin.action(description=_("Print inventory lists (one PDF)"))
+    def checklists_pdf_action(self, request, queryset):
+        from .checklists import build_checklists_pdf
+        response = HttpResponse(build_checklists_pdf(self._collect_checklists(queryset)), content_type="application/pdf")
+        response['Content-Disposition'] = 'attachment; filename="inventory-lists.pdf"'
+        return response
+
+    @admin.action(description=_("Print inventory lists (ZIP of PDFs)"))
+    def checklists_zip_action(self, request, queryset):
+        from .checklists import build_checklists_zip
+        data = build_checklists_zip(
+            self._collect_checklists(queryset), processes=settings.CHECKLIST_PDF_ADMIN_PROCESSES,
+        )
+        response = HttpResponse(data, content_type="application/zip")
+        response['Content-Disposition'] = 'attachment; filename="inventory-lists.zip"'
+        return response
+
+
+class DepartmentAdmin(ChecklistActionsMixin, OutplantingStatsAdminMixin, readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
     form = DepartmentForm
     list_display = ('change_link_decorator', 'territory', 'code', 'name', 'list_link_decorator',
                     'num_individuals_alive', 'num_species_alive',
@@ -37,7 +108,7 @@ class DepartmentAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable)
         css = {"screen": ('individuals/change_form_plant_stats.css',)}
 
 
-class TerritoryAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
+class TerritoryAdmin(ChecklistActionsMixin, OutplantingStatsAdminMixin, readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
     form = TerritoryForm
     list_display = ('change_link_decorator', 'code', 'name', 'list_link_decorator',
                     'num_individuals_alive', 'num_species_alive',
@@ -59,7 +130,7 @@ class OutplantingInline(readOnlyAdmin.ReadOnlyTabularInline):
     min_num = 0
 
 
-class SeedAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
+class SeedAdmin(SearchTextAdminMixin, readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
     form = SeedForm
     save_on_top = True
     actions_on_top = True
@@ -78,15 +149,18 @@ class SeedAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
 
     blacklist = ('id', '__str__', 'ipen_transfer_restricted', 'ipen_garden_code', 'ipen_accession_number',
                  'ipen_country', 'departments_generated', 'territories_generated', 'species',
-                 'alive_outplantings_generated')
+                 'alive_outplantings_generated', 'search_text_generated', 'search_vector_generated',
+                 'links_version_generated', 'first_image_generated')
+    list_deferrable_fields = ('found_text', 'comment')
 
-    search_fields = ['order_number', '@species__species', 'accession_number', '@species__family__genus',
-                     '@species__family__family', 'ipen_generated', '@source__name', '@species__deutscher_name']
+    # numbers, IPEN, source and species names, see tools/search.py
+    search_fields = ['search_text_generated']
     ordering = ('accession_number',)
     list_editable = ('seed_available', 'seed_in_stock')
     fieldsets = (
         (None, {
-            'fields': (('accession_number', 'accession_extension', 'seed_available', 'seed_in_stock',),
+            'fields': (('accession_number', 'accession_extension', 'seed_available', 'seed_in_stock',
+                        'number_token'),
                        ('species', 'species_checked_by', 'came_as_species'),)
         }),
         (_('IPEN'), {
@@ -130,7 +204,7 @@ def get_seed_order_ids(s: str) -> List[str]:
     return re.findall(r"\d+", s)
 
 
-class IndividualAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
+class IndividualAdmin(SearchTextAdminMixin, readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
     form = IndividualForm
     save_on_top = True
     list_display = (
@@ -156,24 +230,19 @@ class IndividualAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable)
 
     blacklist = ('id', '__str__', 'ipen_transfer_restricted', 'ipen_garden_code', 'ipen_accession_number',
                  'ipen_country', 'departments_generated', 'territories_generated', 'species',
-                 'outplantings_generated', 'alive_outplantings_generated', 'is_alive_generated')
+                 'outplantings_generated', 'alive_outplantings_generated', 'is_alive_generated',
+                 'search_text_generated', 'search_vector_generated', 'links_version_generated',
+                 'first_image_generated')
+    list_deferrable_fields = ('found_text', 'comment')
 
     list_display_links = ()
-    search_fields = ('accession_number', 'ipen_generated',
-                     '@species__species',
-                     '@species__subspecies',
-                     '@species__variety',
-                     '@species__form',
-                     '@species__family__genus',
-                     '@species__family__family',
-                     '@species__full_name_generated',
-                     '@species__deutscher_name',
-                     '@source__name',
-                     )
+    # numbers, IPEN, source and species names, see tools/search.py
+    search_fields = ['search_text_generated']
     ordering = ('accession_number',)
     fieldsets = (
         (None, {
-            'fields': (('accession_number', 'accession_extension', 'seed_available', 'seed_in_stock',),
+            'fields': (('accession_number', 'accession_extension', 'seed_available', 'seed_in_stock',
+                        'number_token'),
                        ('species', 'species_checked_by', 'came_as_species'),)
         }),
         ('IPEN', {
@@ -0,0 +1,500 @@
+"""
+Set-based (re-)calculation of the generated outplanting fields of Individual
+
+Instead of calling Individual.calc_outplantings() for each row, all
+outplantings of the requested individuals are read with a single projection
+query over Outplanting joined to Department and Territory and the changed
+rows are written back with chunked bulk_update.
+
+Changes to Outplantings do not recalculate anything right away. The affected
+Departments, Territories and Individuals are collected in a per-thread dirty
+set which is flushed once when the surrounding transaction commits, or when
+the outermost `deferred_outplanting_recalc()` block exits.
+
+The counters of Departments and Territories are maintained incrementally
+through reference-counted OutplantingTally rows per location and
+individual, species or genus, which keeps the distinct counts exact.
+`CalcOutplantingsMixin.rebuild_outplanting_tallies()` recounts a location
+from scratch and is the verification and repair path.
+With the "matview" statistics backend (individuals/stats.py) the tallies
+are skipped and the materialized view is refreshed instead.
+The point-in-time statistics of the changed locations (individuals/snapshots.py)
+are rebuilt by the same flush.
+"""
+import contextlib
+import threading
+from collections import Counter
+
+from django.db import connection, models, transaction
+from django.dispatch import Signal
+
+from .stats import use_matview, schedule_refresh, mark_columns_stale, ensure_columns_current
+
+
+# sent after a flush changed outplanting statistics or Individual fields without model signals
+outplanting_recalc_done = Signal()
+
+# fields of Individual that are derived from its Outplantings
+OUTPLANTING_FIELDS = (
+    "outplantings_generated",
+    "alive_outplantings_generated",
+    "departments_generated",
+    "territories_generated",
+    "is_alive_generated",
+)
+
+
+def _outplanting_rows(individuals=None):
+    """
+    Returns a values_list QuerySet of all Outplantings of the given individuals,
+    ordered by individual and pk.
+    :param individuals: QuerySet or list of pks of Individual, None for all
+    """
+    from .models import Outplanting
+    qset = Outplanting.objects.all()
+    if individuals is not None:
+        if hasattr(individuals, "values"):
+            individuals = individuals.values("pk")
+        qset = qset.filter(individual__in=individuals)
+    return qset.order_by("individual", "pk").values_list(
+        "individual", "pk", "plant_died", "department__full_code", "department__territory__code",
+    )
+
+
+def calc_outplanting_values(rows):
+    """
+    Calculate the generated Individual fields from outplanting rows of ONE individual
+    :param rows: iterable of (outplanting pk, plant_died, department full_code, territory code)
+    :return: dict of OUTPLANTING_FIELDS
+    """
+    outplantings, alive_outplantings = [], []
+    departments, territories = set(), set()
+    for pk, plant_died, full_code, territory_code in rows:
+        outplantings.append(pk)
+        if plant_died is None:
+            alive_outplantings.append(pk)
+        if full_code is not None:
+            departments.add(full_code)
+        if territory_code is not None:
+            territories.add(territory_code)
+
+    return {
+        "outplantings_generated": outplantings,
+        "alive_outplantings_generated": alive_outplantings,
+        "departments_generated": " ".join(sorted(departments)),
+        "territories_generated": " ".join("(%s)" % i for i in sorted(territories)),
+        "is_alive_generated": len(alive_outplantings) > 0,
+    }
+
+
+def calc_individuals_outplantings(individuals=None, chunk_size=1000, verbose=False):
+    """
+    Recalculate the generated outplanting fields for all or a subset of Individuals.
+    Only rows that actually changed are written.
+    :param individuals: QuerySet of Individual, None for all
+    :param chunk_size: number of rows per bulk_update
+    :param verbose: print progress
+    :return: number of updated Individuals
+    """
+    from .models import Individual
+
+    if individuals is None:
+        individuals = Individual.objects.all()
+
+    # individual pk -> list of outplanting rows
+    rows_by_individual = {}
+    for row in _outplanting_rows(individuals).iterator(chunk_size=chunk_size):
+        rows_by_individual.setdefault(row[0], []).append(row[1:])
+
+    current = individuals.order_by("pk").values_list("pk", *OUTPLANTING_FIELDS)
+    count = current.count() if verbose else None
+
+    num_updated = 0
+    changed = []
+    for i, values in enumerate(current.iterator(chunk_size=chunk_size)):
+        if verbose and i % chunk_size == 0:
+            print("%s/%s" % (i, count))
+
+        new_values = calc_outplanting_values(rows_by_individual.get(values[0], []))
+        if any(new_values[name] != value for name, value in zip(OUTPLANTING_FIELDS, values[1:])):
+            # a deferred instance does not trigger the accession/order number defaults
+            individual = Individual.from_db(None, ("id", ), (values[0], ))
+            for name in OUTPLANTING_FIELDS:
+                setattr(individual, name, new_values[name])
+            individual.links_version_generated = models.F("links_version_generated") + 1
+            changed.append(individual)
+
+        if len(changed) >= chunk_size:
+            num_updated += _write(changed)
+            changed = []
+
+    if changed:
+        num_updated += _write(changed)
+
+    return num_updated
+
+
+def _write(individuals):
+    from .models import Individual
+    Individual.objects.bulk_update(individuals, OUTPLANTING_FIELDS + ("links_version_generated", ))
+    return len(individuals)
+
+
+# tally kind -> counter name in CalcOutplantingsMixin
+TALLY_KINDS = {
+    "o": "outplantings",
+    "i": "individuals",
+    "s": "species",
+    "g": "genera",
+}
+
+
+def counter_field(kind, alive):
+    """Name of the CalcOutplantingsMixin counter for a tally kind"""
+    return "num_%s%s" % (TALLY_KINDS[kind], "_alive" if alive else "")
+
+
+def _taxon_keys(individual, species, genus):
+    """Yields the (kind, key) tallies an outplanting of the individual is counted in"""
+    yield "o", ""
+    yield "i", str(individual)
+    yield "s", "" if species is None else str(species)
+    yield "g", genus or ""
+
+
+def count_tallies(rows):
+    """
+    Count the tallies of one location from scratch
+    :param rows: iterable of (individual pk, species pk, genus, plant_died)
+    :return: Counter of (kind, key, alive) -> count
+    """
+    tallies = Counter()
+    for individual, species, genus, plant_died in rows:
+        for kind, key in _taxon_keys(individual, species, genus):
+            tallies[(kind, key, False)] += 1
+            if plant_died is None:
+                tallies[(kind, key, True)] += 1
+    return tallies
+
+
+def tally_counters(tallies):
+    """
+    Derive the CalcOutplantingsMixin counters from the tallies of one location
+    :param tallies: Counter of (kind, key, alive) -> count
+    :return: dict of counter name -> value
+    """
+    counters = {counter_field(kind, alive): 0 for kind in TALLY_KINDS for alive in (False, True)}
+    for (kind, key, alive), count in tallies.items():
+        if count > 0:
+            counters[counter_field(kind, alive)] += count if kind == "o" else 1
+    return counters
+
+
+class _DirtySet(threading.local):
+
+    def __init__(self):
+        # (department pk, individual pk) of changed outplantings
+        self.pairs = set()
+        # Outplanting pk -> stored state before the first change, see snapshots.apply_outplanting_changes()
+        self.outplantings = {}
+        # locations that need a full recount
+        self.departments = set()
+        self.territories = set()
+        self.individuals = set()
+        self.defer_depth = 0
+        # on-commit entry of flush_outplanting_recalc() in the current transaction
+        self.scheduled = None
+
+    def __bool__(self):
+        return bool(self.pairs or self.outplantings or self.departments or self.territories or self.individuals)
+
+    def pop(self):
+        ret = self.pairs, self.outplantings, self.departments, self.territories, self.individuals
+        self.pairs, self.departments, self.territories, self.individuals = set(), set(), set(), set()
+        self.outplantings = {}
+        self.scheduled = None
+        return ret
+
+
+_dirty = _DirtySet()
+
+
+def _flush_pending():
+    # callbacks of rolled back savepoints and transactions are dropped by django
+    return _dirty.scheduled is not None and any(entry is _dirty.scheduled for entry in connection.run_on_commit)
+
+
+def _schedule_flush():
+    """Registers flush_outplanting_recalc() once per transaction, runs it immediately in autocommit mode"""
+    if _dirty.defer_depth:
+        return
+    if not connection.in_atomic_block:
+        flush_outplanting_recalc()
+    elif not _flush_pending():
+        transaction.on_commit(flush_outplanting_recalc)
+        _dirty.scheduled = connection.run_on_commit[-1]
+
+
+def mark_dirty(departments=(), territories=(), individuals=()):
+    """
+    Schedule a full recount of the outplanting statistics of the given objects.
+    :param departments: iterable of Department pks
+    :param territories: iterable of Territory pks
+    :param individuals: iterable of Individual pks
+    """
+    _dirty.departments.update(pk for pk in departments if pk is not None)
+    _dirty.territories.update(pk for pk in territories if pk is not None)
+    _dirty.individuals.update(pk for pk in individuals if pk is not None)
+    _schedule_flush()
+
+
+def mark_outplanting_dirty(outplanting):
+    """
+    Schedule recalculation for the current and the previously stored
+    department and individual of an Outplanting instance
+    """
+    pairs = {(outplanting.department_id, outplanting.individual_id)}
+    loaded = getattr(outplanting, "_loaded_location", None)
+    if loaded:
+        pairs.add(loaded)
+    for department, individual in pairs:
+        if department is not None:
+            _dirty.pairs.add((department, individual))
+        _dirty.individuals.add(individual)
+    if outplanting.pk is not None:
+        _dirty.outplantings.setdefault(outplanting.pk, getattr(outplanting, "_loaded_state", None))
+    _schedule_flush()
+
+
+def _collect_tally_deltas(pairs, skip_departments, skip_territories):
+    """
+    Recount the outplantings of the changed (department, individual) pairs
+    and compare them with the stored individual tallies.
+    Stale pairs, e.g. of a rolled back transaction, simply yield no delta.
+    The Department and Territory rows are locked first, so concurrent flushes of
+    the same locations wait for each other and read the tallies of the other one.
+    Must be called inside a transaction.
+    :return: tuple of (Counter of (location field, location pk, kind, key, alive) -> delta,
+                       set of Department pks that need a full recount)
+    """
+    from .models import Individual, Department, Territory, Outplanting, OutplantingTally
+
+    pairs = {pair for pair in pairs if pair[0] not in skip_departments}
+    if not pairs:
+        return Counter(), set()
+    department_pks = {pair[0] for pair in pairs}
+    individual_pks = {pair[1] for pair in pairs}
+
+    territory_of = dict(
+        Department.objects.select_for_update().filter(pk__in=department_pks).order_by("pk")
+        .values_list("pk", "territory")
+    )
+    list(Territory.objects.select_for_update().filter(
+        pk__in={pk for pk in territory_of.values() if pk is not None}
+    ).order_by("pk").values_list("pk", flat=True))
+    taxa = {
+        pk: (species, genus)
+        for pk, species, genus in Individual.objects.filter(
+            pk__in=individual_pks
+        ).values_list("pk", "species", "species__family__genus")
+    }
+    actual = {
+        (department, individual): (total, alive)
+        for department, individual, total, alive in Outplanting.objects.filter(
+            department__in=department_pks, individual__in=individual_pks,
+        ).values_list("department", "individual").annotate(
+            total=models.Count("pk"), alive=models.Count("pk", filter=models.Q(plant_died=None)),
+        ).order_by()
+    }
+    stored = {
+        (tally.department_id, int(tally.key), tally.alive): tally.count
+        for tally in OutplantingTally.objects.filter(
+            department__in=department_pks, kind="i", key__in=[str(pk) for pk in individual_pks],
+        )
+    }
+
+    deltas = Counter()
+    recount = set()
+    for department, individual in pairs:
+        if department not in territory_of:
+            # deleted departments take their tallies with them
+            continue
+        if individual not in taxa:
+            # the individual is deleted and its species unknown
+            recount.add(department)
+            continue
+        locations = [("department", department)]
+        if territory_of[department] is not None and territory_of[department] not in skip_territories:
+            locations.append(("territory", territory_of[department]))
+        for alive, count in zip((False, True), actual.get((department, individual), (0, 0))):
+            delta = count - stored.get((department, individual, alive), 0)
+            if delta:
+                for location in locations:
+                    for kind, key in _taxon_keys(individual, *taxa[individual]):
+                        deltas[location + (kind, key, alive)] += delta
+
+    return deltas, recount
+
+
+def _apply_tally_deltas(deltas):
+    """
+    Add the deltas to the OutplantingTally rows and update the counters
+    of the locations whose tallies went from zero to non-zero or back.
+    :return: set of (location field, location pk) with inconsistent tallies
+    """
+    from .models import Department, Territory, OutplantingTally
+
+    deltas = {tally: n for tally, n in deltas.items() if n}
+    if not deltas:
+        return set()
+
+    query = models.Q()
+    for field in ("department", "territory"):
+        pks = {tally[1] for tally in deltas if tally[0] == field}
+        if pks:
+            query |= models.Q(**{"%s__in" % field: pks})
+    existing = {}
+    for tally in OutplantingTally.objects.select_for_update().filter(
+            query, key__in={tally[3] for tally in deltas}):
+        if tally.department_id is not None:
+            location = ("department", tally.department_id)
+        else:
+            location = ("territory", tally.territory_id)
+        existing[location + (tally.kind, tally.key, tally.alive)] = tally
+
+    counters = {}
+    inconsistent = set()
+    to_create, to_update, to_delete = [], [], []
+    for (field, pk, kind, key, alive), n in deltas.items():
+        tally = existing.get((field, pk, kind, key, alive))
+        old_count = tally.count if tally else 0
+        new_count = old_count + n
+        if new_count < 0:
+            inconsistent.add((field, pk))
+            continue
+
+        location_counters = counters.setdefault((field, pk), Counter())
+        if kind == "o":
+            location_counters[counter_field(kind, alive)] += n
+        elif not old_count and new_count:
+            location_counters[counter_field(kind, alive)] += 1
+        elif old_count and not new_count:
+            location_counters[counter_field(kind, alive)] -= 1
+
+        if tally is None:
+            to_create.append(OutplantingTally(
+                kind=kind, key=key, alive=alive, count=new_count, **{"%s_id" % field: pk}
+            ))
+        elif new_count:
+            tally.count = new_count
+            to_update.append(tally)
+        else:
+            to_delete.append(tally.pk)
+
+    OutplantingTally.objects.bulk_create(to_create)
+    OutplantingTally.objects.bulk_update(to_update, ("count", ))
+    OutplantingTally.objects.filter(pk__in=to_delete).delete()
+
+    for (field, pk), location_counters in counters.items():
+        if (field, pk) in inconsistent:
+            continue
+        values = {name: models.F(name) + n for name, n in location_counters.items() if n}
+        if values:
+            model = Department if field == "department" else Territory
+            model.objects.filter(pk=pk).update(**values)
+
+    return inconsistent
+
+
+def flush_outplanting_recalc():
+    """
+    Apply all recorded outplanting changes.
+    The counters of Departments and Territories are updated incrementally,
+    locations marked with `mark_dirty()` are recounted, each exactly once.
+    Flushing is idempotent, all values are derived from the database,
+    concurrent flushes are serialized by row locks on the changed locations.
+    :return: tuple of number of (departments recounted, territories recounted, individuals updated)
+    """
+    from .models import Individual, Department, Territory
+
+    if not _dirty:
+        return 0, 0, 0
+    pairs, outplantings, department_pks, territory_pks, individual_pks = _dirty.pop()
+
+    _update_snapshots(outplantings, department_pks, territory_pks)
+
+    num_individuals = 0
+    if individual_pks:
+        num_individuals = calc_individuals_outplantings(Individual.objects.filter(pk__in=individual_pks))
+
+    if use_matview():
+        # the statistics are not stored with the locations
+        mark_columns_stale()
+        schedule_refresh()
+        outplanting_recalc_done.send(sender=None)
+        return 0, 0, num_individuals
+
+    if ensure_columns_current():
+        # all locations are recounted, including the changed ones
+        outplanting_recalc_done.send(sender=None)
+        return Department.objects.count(), Territory.objects.count(), num_individuals
+
+    # territories of recounted departments are recounted as well
+    territory_pks.update(
+        Department.objects.filter(pk__in=department_pks).values_list("territory", flat=True)
+    )
+    with transaction.atomic():
+        deltas, recount = _collect_tally_deltas(pairs, department_pks, territory_pks)
+        for field, pk in _apply_tally_deltas(deltas):
+            (department_pks if field == "department" else territory_pks).add(pk)
+    department_pks.update(recount)
+
+    departments = list(Department.objects.filter(pk__in=department_pks))
+    territory_pks.update(d.territory_id for d in departments if d.territory_id is not None)
+    territories = list(Territory.objects.filter(pk__in=territory_pks))
+    for location in departments + territories:
+        location.rebuild_outplanting_tallies()
+
+    outplanting_recalc_done.send(sender=None)
+    return len(departments), len(territories), num_individuals
+
+
+def _update_snapshots(outplantings, department_pks, territory_pks):
+    """
+    Update the point-in-time statistics, see snapshots.py.
+    The series of the locations of changed outplantings are updated from the changed day on,
+    the locations marked with `mark_dirty()` are rewritten.
+    """
+    from .models import Department
+    from .snapshots import apply_outplanting_changes, rebuild_snapshots
+
+    department_pks = {pk for pk in department_pks if pk is not None}
+    territory_pks = set(territory_pks) | set(
+        Department.objects.filter(pk__in=department_pks).values_list("territory", flat=True)
+    )
+    territory_pks.discard(None)
+    with transaction.atomic():
+        for field, pk in apply_outplanting_changes(outplantings, department_pks, territory_pks):
+            (department_pks if field == "department" else territory_pks).add(pk)
+        rebuild_snapshots(departments=department_pks, territories=territory_pks)
+
+
+@contextlib.contextmanager
+def deferred_outplanting_recalc():
+    """
+    Context manager for bulk scripts.
+    Collects all outplanting changes inside the block and recalculates
+    the affected objects once when the outermost block is left
+    (or when the surrounding transaction commits).
+
+        with deferred_outplanting_recalc():
+            for row in rows:
+                Outplanting.objects.create(...)
+    """
+    _dirty.defer_depth += 1
+    try:
+        yield
+    finally:
+        _dirty.defer_depth -= 1
+        if not _dirty.defer_depth and _dirty:
+            _schedule_flush()
@@ -0,0 +1,235 @@
+"""
+Inventory checklists of Territories and Departments
+
+The rows of all requested locations are read with one values projection
+over Outplanting, grouped per location and rendered with reportlab.
+The rendering only gets plain data, so it can run in a process pool:
+
+    locations = collect_checklists(territories=Territory.objects.all())
+    zip_bytes = build_checklists_zip(locations, processes=4)
+    pdf_bytes = build_checklists_pdf(locations)
+"""
+import io
+import zipfile
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import models
+from django.utils.translation import gettext as _
+
+from .models import Outplanting
+
+
+# columns of the checklist projection
+CHECKLIST_FIELDS = (
+    "department__full_code",
+    "individual",
+    "individual__accession_number",
+    "individual__accession_extension",
+    "individual__species__family__family",
+    "individual__species__full_name_generated",
+    "date",
+    "plant_died",
+)
+
+CHECKLIST_ORDERING = (
+    "individual__species__family__family",
+    "individual__species__family__genus",
+    "individual__species__species",
+)
+
+
+def checklist_outplantings(qset):
+    """
+    The Outplantings of a checklist, the living ones and the ones with seeds available
+    :param qset: QuerySet of Outplanting of one or more locations
+    """
+    qset = qset.filter(models.Q(plant_died=None) | models.Q(individual__seed_available=True))
+    return qset.order_by(*CHECKLIST_ORDERING)
+
+
+def accession_number(number, extension):
+    return "%s" % number + (("-%s" % extension) if extension else "")
+
+
+class Checklist:
+    """Plain data of one location, can be sent to a worker process"""
+
+    def __init__(self, kind, code, name):
+        # "territory" or "department"
+        self.kind = kind
+        self.code = code
+        self.name = name
+        # (full code, accession number, family and species, planted, died)
+        self.rows = []
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def filename(self):
+        return "%s-%s.pdf" % (self.kind, "".join(c if c.isalnum() else "-" for c in self.code))
+
+
+def collect_checklists(territories=(), departments=()):
+    """
+    Reads the rows of all locations with one query
+    :param territories: iterable of Territory
+    :param departments: iterable of Department
+    :return: list of Checklist, territories first
+    """
+    territories = sorted(territories, key=lambda t: t.code)
+    departments = sorted(departments, key=lambda d: d.full_code)
+
+    checklists = {}
+    for territory in territories:
+        checklists[("t", territory.pk)] = Checklist(
+            "territory", territory.code, "%s (%s)" % (territory.name, territory.code)
+        )
+    for department in departments:
+        checklists[("d", department.pk)] = Checklist(
+            "department", department.full_code, "%s (%s)" % (department.name, department.full_code)
+        )
+    if not checklists:
+        return []
+
+    qset = checklist_outplantings(Outplanting.objects.filter(
+        models.Q(department__in=[d.pk for d in departments])
+        | models.Q(department__territory__in=[t.pk for t in territories])
+    ))
+    for values in qset.values_list("department", "department__territory", *CHECKLIST_FIELDS).iterator():
+        department, territory, full_code, pk, number, extension, family, species, date, plant_died = values
+        row = (
+            full_code or "",
+            accession_number(number, extension),
+            "%s %s" % (family, species),
+            "%s" % date if date else "",
+            "%s" % plant_died if plant_died else "",
+        )
+        for key in (("t", territory), ("d", department)):
+            if key in checklists:
+                checklists[key].rows.append(row)
+
+    return list(checklists.values())
+
+
+def _styles():
+    from reportlab.lib.styles import getSampleStyleSheet
+    return getSampleStyleSheet()
+
+
+def _checklist_flowables(checklist, date, heading_style="Heading1"):
+    from reportlab.lib import colors
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Paragraph, Table, TableStyle
+    from xml.sax.saxutils import escape
+
+    styles = _styles()
+    data = [["", _("Nr."), _("Species"), _("Planted"), _("Died?"), _("Comment")]]
+    for full_code, number, species, planted, died in checklist.rows:
+        data.append([
+            full_code, number, Paragraph(escape(species), styles["BodyText"]), planted, "[x]" if died else "[ ]", "",
+        ])
+    table = Table(data, colWidths=(2*cm, 2*cm, 7.5*cm, 2.2*cm, 1.3*cm, 3*cm), repeatRows=1)
+    table.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 8),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+    ]))
+    return [
+        Paragraph(escape("%s %s - %s" % (_("Inventory list"), checklist.name, date)), styles[heading_style]),
+        Paragraph(escape(_("There are %s individuals registered") % len(checklist.rows)), styles["BodyText"]),
+        table,
+    ]
+
+
+def render_checklist_pdf(checklist, date=None):
+    """
+    Renders one Checklist, does not access the database
+    :return: bytes of the PDF
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate
+
+    date = date or datetime.date.today()
+    output = io.BytesIO()
+    doc = SimpleDocTemplate(output, pagesize=A4, title=checklist.name)
+    doc.build(_checklist_flowables(checklist, date))
+    return output.getvalue()
+
+
+def _render_contents_pdf(checklists, date):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Table
+
+    styles = _styles()
+    output = io.BytesIO()
+    doc = SimpleDocTemplate(output, pagesize=A4, title=_("Inventory lists"))
+    doc.build([
+        Paragraph("%s - %s" % (_("Inventory lists"), date), styles["Heading1"]),
+        Table(
+            [[_("File"), _("Location"), _("Individuals")]]
+            + [[c.filename, c.name, len(c.rows)] for c in checklists],
+            hAlign="LEFT",
+        ),
+    ])
+    return output.getvalue()
+
+
+def render_checklists(checklists, processes=None):
+    """
+    Renders each Checklist to a PDF, in a process pool if `processes` > 1
+    :return: list of PDF bytes in the order of `checklists`
+    """
+    if processes is None:
+        processes = settings.CHECKLIST_PDF_PROCESSES
+    date = datetime.date.today()
+    if processes <= 1 or len(checklists) <= 1:
+        return [render_checklist_pdf(c, date) for c in checklists]
+    with ProcessPoolExecutor(max_workers=min(processes, len(checklists))) as pool:
+        return list(pool.map(render_checklist_pdf, checklists, [date] * len(checklists)))
+
+
+def build_checklists_zip(checklists, processes=None):
+    """
+    :return: bytes of a ZIP with one PDF per location and a table of contents
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("00-contents.pdf", _render_contents_pdf(checklists, datetime.date.today()))
+        for checklist, pdf in zip(checklists, render_checklists(checklists, processes)):
+            archive.writestr(checklist.filename, pdf)
+    return output.getvalue()
+
+
+def build_checklists_pdf(checklists):
+    """
+    Renders all locations into one PDF with a table of contents and bookmarks.
+    A single document can not be split across processes.
+    :return: bytes of the PDF
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, PageBreak
+    from reportlab.platypus.tableofcontents import TableOfContents
+
+    class _Document(SimpleDocTemplate):
+        def afterFlowable(self, flowable):
+            if isinstance(flowable, Paragraph) and flowable.style.name == "Heading2":
+                key = "location-%s" % self.seq.nextf("location")
+                self.canv.bookmarkPage(key)
+                self.canv.addOutlineEntry(flowable.getPlainText(), key, 0)
+                self.notify("TOCEntry", (0, flowable.getPlainText(), self.page, key))
+
+    date = datetime.date.today()
+    styles = _styles()
+    contents = TableOfContents()
+    story = [Paragraph("%s - %s" % (_("Inventory lists"), date), styles["Heading1"]), contents]
+    for checklist in checklists:
+        story.append(PageBreak())
+        story.extend(_checklist_flowables(checklist, date, heading_style="Heading2"))
+
+    output = io.BytesIO()
+    _Document(output, pagesize=A4, title=_("Inventory lists")).multiBuild(story)
+    return output.getvalue()
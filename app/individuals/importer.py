@@ -0,0 +1,422 @@
+"""
+Bulk import of Individuals and their Outplantings from CSV or XLS files
+
+The first row holds the column names, which are the Individual field names
+(e.g. "accession_number", "ipen_country", "collector_date") plus:
+
+    species:          full name of the Species, with or without author
+    ipen_garden_code: code, number or name of the BotanicGarden
+    source:           code, number or name of the BotanicGarden
+    department:       full code of the Department of an Outplanting, e.g. "T1-D1"
+    outplanting_date, seeded_date, plant_died: dates of the Outplanting
+
+Dates in CSV files are written as YYYY-MM-DD.
+
+Missing accession and order numbers are allocated in blocks, skipping the
+numbers given explicitly anywhere in the file, which are collected with a
+first pass over the file. Species, gardens and departments are resolved
+through lookup maps that are loaded once, the rows are read one by one and
+written with bulk_create in batches and the outplanting statistics are
+calculated once at the end.
+"""
+import csv
+import io
+
+from django.core.exceptions import ValidationError, FieldDoesNotExist
+from django.db import transaction
+
+from botman.models import BotanicGarden
+from species.models import Species
+from .models import Individual, Outplanting, Department
+from .numbers import allocate_numbers
+from .calc import mark_dirty, flush_outplanting_recalc
+
+
+BATCH_SIZE = 500
+
+# columns that are resolved through lookup maps
+FOREIGN_COLUMNS = ("species", "ipen_garden_code", "source")
+
+# column -> Outplanting field
+OUTPLANTING_COLUMNS = {
+    "department": "department",
+    "outplanting_date": "date",
+    "seeded_date": "seeded_date",
+    "plant_died": "plant_died",
+}
+
+EXCLUDED_COLUMNS = ("id", "pk", "individual_ptr")
+
+_TRUE_VALUES = ("1", "true", "t", "yes", "y", "x", "ja", "j")
+_FALSE_VALUES = ("", "0", "false", "f", "no", "n", "nein")
+
+
+def _normalize_name(name):
+    return " ".join(str(name).split()).lower()
+
+
+def _normalize_column(name):
+    return _normalize_name(name).replace(" ", "_")
+
+
+def read_rows(file, filename=""):
+    """
+    Yields (row number, dict of column -> value) for each data row
+    :param file: binary file object
+    :param filename: the file extension selects the format, .xls or csv
+    """
+    if filename.lower().endswith(".xls"):
+        return _read_xls(file)
+    return _read_csv(file)
+
+
+class RowSource:
+    """
+    The rows of a seekable file, which is read from the start on each iteration
+    """
+    def __init__(self, file, filename=""):
+        self.file = file
+        self.filename = filename
+
+    def __iter__(self):
+        self.file.seek(0)
+        return read_rows(self.file, self.filename)
+
+
+def _read_csv(file):
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+        header = None
+        for row in reader:
+            if header is None:
+                header = [_normalize_column(c) for c in row]
+                continue
+            if not any(c.strip() for c in row):
+                continue
+            yield reader.line_num, dict(zip(header, (c.strip() for c in row)))
+    finally:
+        # keep the file open for the next pass
+        text.detach()
+
+
+def _read_xls(file):
+    import xlrd
+
+    book = xlrd.open_workbook(file_contents=file.read(), on_demand=True)
+    sheet = book.sheet_by_index(0)
+    header = [_normalize_column(c.value) for c in sheet.row(0)] if sheet.nrows else []
+    for y in range(1, sheet.nrows):
+        values = [_xls_value(cell, book.datemode) for cell in sheet.row(y)]
+        if not any(values):
+            continue
+        yield y + 1, dict(zip(header, values))
+
+
+def _xls_value(cell, datemode):
+    import xlrd
+
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        return xlrd.xldate_as_datetime(cell.value, datemode).date()
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    if cell.ctype == xlrd.XL_CELL_NUMBER and cell.value == int(cell.value):
+        return str(int(cell.value))
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+        return ""
+    return str(cell.value).strip()
+
+
+def _ipen_key(individual):
+    return (
+        individual.ipen_country, individual.ipen_transfer_restricted,
+        individual.ipen_accession_number, individual.ipen_garden_code_id,
+    )
+
+
+class ImportResult:
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.num_rows = 0
+        self.num_individuals = 0
+        self.num_outplantings = 0
+        # list of (row number, message)
+        self.errors = []
+
+    def __str__(self):
+        return "%s%s rows, %s individuals, %s outplantings, %s errors" % (
+            "DRY RUN: " if self.dry_run else "",
+            self.num_rows, self.num_individuals, self.num_outplantings, len(self.errors),
+        )
+
+
+class IndividualImporter:
+    """
+    Imports rows as returned by read_rows()
+
+        result = IndividualImporter(dry_run=True).run(RowSource(file, filename))
+    """
+    def __init__(self, dry_run=False, batch_size=BATCH_SIZE):
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.result = ImportResult(dry_run)
+        self._species = None
+        self._gardens = None
+        self._departments = None
+        self._accession_numbers = set()
+        self._order_numbers = set()
+        self._ipen_keys = set()
+        # fieldname -> numbers given in the file, never allocated for other rows
+        self._explicit_numbers = {}
+
+    def run(self, rows):
+        """
+        :param rows: iterable of (row number, dict of column -> value). A re-iterable like RowSource
+                     is read twice, an iterator only once and numbers given explicitly in later
+                     rows may then already be allocated for earlier ones.
+        :return: ImportResult
+        """
+        self._load_maps()
+        self._explicit_numbers = {"accession_number": self._accession_numbers, "order_number": self._order_numbers}
+        if iter(rows) is not rows:
+            self._explicit_numbers = self._collect_numbers(rows)
+        individual_pks, department_pks = set(), set()
+
+        batch = []
+        for row_number, values in rows:
+            self.result.num_rows += 1
+            item = self._build(row_number, values)
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._write(batch, individual_pks, department_pks)
+                batch = []
+        if batch:
+            self._write(batch, individual_pks, department_pks)
+
+        if individual_pks and not self.dry_run:
+            mark_dirty(departments=department_pks, individuals=individual_pks)
+            flush_outplanting_recalc()
+        return self.result
+
+    @staticmethod
+    def _collect_numbers(rows):
+        """Returns dict of fieldname -> set of the numbers given in the rows"""
+        fields = [Individual._meta.get_field(name) for name in ("accession_number", "order_number")]
+        numbers = {field.name: set() for field in fields}
+        for row_number, values in rows:
+            for field in fields:
+                try:
+                    number = field.to_python(values.get(field.name) or None)
+                except ValidationError:
+                    continue
+                if number is not None:
+                    numbers[field.name].add(number)
+        return numbers
+
+    def _load_maps(self):
+        self._species = {}
+        for species in Species.objects.select_related("family"):
+            self._species.setdefault(_normalize_name(species.full_name(with_author=False)), species)
+            self._species[_normalize_name(species.full_name_generated or species.full_name())] = species
+
+        self._gardens = {}
+        for garden in BotanicGarden.objects.all():
+            self._gardens.setdefault(_normalize_name(garden.name), garden)
+            self._gardens[str(garden.number)] = garden
+            if garden.code:
+                self._gardens[_normalize_name(garden.code)] = garden
+
+        self._departments = {
+            _normalize_name(department.full_code): department
+            for department in Department.objects.all()
+        }
+
+    def _lookup(self, mapping, value, errors, column):
+        if value in (None, ""):
+            return None
+        obj = mapping.get(_normalize_name(value))
+        if obj is None:
+            errors.append("%s: '%s' not found" % (column, value))
+        return obj
+
+    def _build(self, row_number, values):
+        """Returns (Individual, Outplanting or None, row number) or records the errors of the row"""
+        errors = []
+        individual = Individual(seed_available=False, seed_in_stock=False)
+        outplanting_values = {}
+
+        for column, value in values.items():
+            if not column or column in EXCLUDED_COLUMNS:
+                continue
+            if column == "species":
+                individual.species = self._lookup(self._species, value, errors, column)
+            elif column in ("ipen_garden_code", "source"):
+                setattr(individual, column, self._lookup(self._gardens, value, errors, column))
+            elif column == "department":
+                outplanting_values["department"] = self._lookup(self._departments, value, errors, column)
+            elif column in OUTPLANTING_COLUMNS:
+                try:
+                    field = Outplanting._meta.get_field(OUTPLANTING_COLUMNS[column])
+                    outplanting_values[field.name] = field.to_python(value or None)
+                except ValidationError as e:
+                    errors.append("%s: %s" % (column, " ".join(e.messages)))
+            else:
+                try:
+                    field = Individual._meta.get_field(column)
+                except FieldDoesNotExist:
+                    errors.append("%s: unknown column" % column)
+                    continue
+                try:
+                    setattr(individual, field.attname, self._to_python(field, value))
+                except ValidationError as e:
+                    errors.append("%s: %s" % (column, " ".join(e.messages)))
+
+        for column in ("species", "ipen_garden_code"):
+            if not values.get(column):
+                errors.append("%s: required" % column)
+
+        exclude = list(FOREIGN_COLUMNS) + [
+            name for name in ("accession_number", "order_number") if getattr(individual, name) is None
+        ]
+        try:
+            individual.full_clean(exclude=exclude, validate_unique=False)
+        except ValidationError as e:
+            errors.extend(
+                "%s: %s" % (name, " ".join(messages))
+                for name, messages in e.message_dict.items()
+            )
+
+        if individual.accession_number is not None:
+            if individual.accession_number in self._accession_numbers:
+                errors.append("accession_number: %s is used twice in the file" % individual.accession_number)
+            self._accession_numbers.add(individual.accession_number)
+        if individual.order_number is not None:
+            if individual.order_number in self._order_numbers:
+                errors.append("order_number: %s is used twice in the file" % individual.order_number)
+            self._order_numbers.add(individual.order_number)
+        if _ipen_key(individual) in self._ipen_keys:
+            errors.append("IPEN %s is used twice in the file" % individual.get_ipen())
+        self._ipen_keys.add(_ipen_key(individual))
+
+        outplanting = None
+        if any(v is not None for v in outplanting_values.values()):
+            if not values.get("department"):
+                errors.append("department: required for an outplanting")
+            elif outplanting_values["department"] is not None:
+                outplanting = Outplanting(**outplanting_values)
+
+        if errors:
+            self.result.errors.extend((row_number, error) for error in errors)
+            return None
+        return individual, outplanting, row_number
+
+    def _to_python(self, field, value):
+        if field.get_internal_type() == "BooleanField" and not isinstance(value, bool):
+            value = _normalize_name(value)
+            if value in _TRUE_VALUES:
+                return True
+            if value in _FALSE_VALUES:
+                return False
+        if value == "":
+            # e.g. None for order_number, which is then allocated
+            return field.get_default()
+        if field.choices:
+            # choice keys are matched case-insensitive, e.g. "DE" for country "de"
+            value = {str(key).lower(): key for key, label in field.flatchoices}.get(str(value).lower(), value)
+        return field.to_python(value)
+
+    def _reject_existing(self, batch):
+        """Removes the rows whose unique values are already used in the database"""
+        individuals = [item[0] for item in batch]
+        accession_numbers = set(Individual.objects.filter(
+            accession_number__in=[i.accession_number for i in individuals if i.accession_number is not None]
+        ).values_list("accession_number", flat=True))
+        order_numbers = set(Individual.objects.filter(
+            order_number__in=[i.order_number for i in individuals if i.order_number is not None]
+        ).values_list("order_number", flat=True))
+        ipen_keys = set(
+            Individual.objects.filter(ipen_accession_number__in={i.ipen_accession_number for i in individuals})
+            .values_list("ipen_country", "ipen_transfer_restricted", "ipen_accession_number", "ipen_garden_code")
+        )
+
+        accepted = []
+        for individual, outplanting, row_number in batch:
+            if individual.accession_number in accession_numbers:
+                self.result.errors.append(
+                    (row_number, "accession_number: %s already exists" % individual.accession_number)
+                )
+            elif individual.order_number in order_numbers:
+                self.result.errors.append((row_number, "order_number: %s already exists" % individual.order_number))
+            elif _ipen_key(individual) in ipen_keys:
+                self.result.errors.append((row_number, "IPEN %s already exists" % individual.get_ipen()))
+            else:
+                accepted.append((individual, outplanting, row_number))
+        return accepted
+
+    def _write(self, batch, individual_pks, department_pks):
+        batch = self._reject_existing(batch)
+
+        with transaction.atomic():
+            self._assign_numbers(batch)
+
+            individuals = []
+            for individual, outplanting, row_number in batch:
+                individual.ipen_generated = individual.get_ipen()
+                individual.id_name_generated = individual.get_id_name()
+                # bulk_create does not call save()
+                individual.search_text_generated = individual.get_search_text()
+                individuals.append(individual)
+            Individual.objects.bulk_create(individuals, batch_size=self.batch_size)
+
+            # databases that do not return the pks of bulk inserts
+            if individuals and individuals[0].pk is None:
+                pks = dict(Individual.objects.filter(
+                    order_number__in=[i.order_number for i in individuals]
+                ).values_list("order_number", "pk"))
+                for individual in individuals:
+                    individual.pk = pks[individual.order_number]
+
+            outplantings = []
+            for individual, outplanting, row_number in batch:
+                if outplanting is not None:
+                    outplanting.individual_id = individual.pk
+                    outplantings.append(outplanting)
+            Outplanting.objects.bulk_create(outplantings, batch_size=self.batch_size)
+
+            self.result.num_individuals += len(individuals)
+            self.result.num_outplantings += len(outplantings)
+            individual_pks.update(i.pk for i in individuals)
+            department_pks.update(o.department_id for o in outplantings)
+
+            if self.dry_run:
+                transaction.set_rollback(True)
+
+    def _assign_numbers(self, batch):
+        individuals = [item[0] for item in batch]
+        for fieldname in ("accession_number", "order_number"):
+            missing = [i for i in individuals if getattr(i, fieldname) is None]
+            # the allocator does not know the numbers of the rows that are not written yet
+            explicit = self._explicit_numbers.get(fieldname, ())
+            numbers = []
+            while len(numbers) < len(missing):
+                numbers.extend(
+                    n for n in allocate_numbers(fieldname, len(missing) - len(numbers)) if n not in explicit
+                )
+            for individual, number in zip(missing, numbers):
+                setattr(individual, fieldname, number)
+
+
+def import_individuals(file, filename="", dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Import a CSV or XLS file
+    :return: ImportResult
+    """
+    return IndividualImporter(dry_run=dry_run, batch_size=batch_size).run(RowSource(file, filename))
@@ -0,0 +1,67 @@
+from django.db import migrations, models
+
+
+def pickled_to_json(apps, schema_editor):
+    """Copy the pickled id lists into the json fields"""
+    Individual = apps.get_model("individuals", "Individual")
+    individuals = []
+    for individual in Individual.objects.only(
+            "pk", "outplantings_generated", "alive_outplantings_generated").iterator(chunk_size=1000):
+        individual.outplantings_json = [int(i) for i in individual.outplantings_generated or []]
+        individual.alive_outplantings_json = [int(i) for i in individual.alive_outplantings_generated or []]
+        individuals.append(individual)
+    Individual.objects.bulk_update(
+        individuals, ("outplantings_json", "alive_outplantings_json"), batch_size=1000
+    )
+
+
+def json_to_pickled(apps, schema_editor):
+    Individual = apps.get_model("individuals", "Individual")
+    individuals = []
+    for individual in Individual.objects.only(
+            "pk", "outplantings_json", "alive_outplantings_json").iterator(chunk_size=1000):
+        individual.outplantings_generated = list(individual.outplantings_json)
+        individual.alive_outplantings_generated = list(individual.alive_outplantings_json)
+        individuals.append(individual)
+    Individual.objects.bulk_update(
+        individuals, ("outplantings_generated", "alive_outplantings_generated"), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='individual',
+            name='alive_outplantings_json',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='alive_outplantings_generated'),
+        ),
+        migrations.AddField(
+            model_name='individual',
+            name='outplantings_json',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='outplantings_generated'),
+        ),
+        migrations.RunPython(pickled_to_json, json_to_pickled),
+        migrations.RemoveField(
+            model_name='individual',
+            name='alive_outplantings_generated',
+        ),
+        migrations.RemoveField(
+            model_name='individual',
+            name='outplantings_generated',
+        ),
+        migrations.RenameField(
+            model_name='individual',
+            old_name='alive_outplantings_json',
+            new_name='alive_outplantings_generated',
+        ),
+        migrations.RenameField(
+            model_name='individual',
+            old_name='outplantings_json',
+            new_name='outplantings_generated',
+        ),
+    ]
@@ -0,0 +1,60 @@
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# a copy of individuals.calc.count_tallies() at the time of this migration
+def count_tallies(rows):
+    tallies = Counter()
+    for individual, species, genus, plant_died in rows:
+        keys = [("o", ""), ("i", str(individual)), ("s", "" if species is None else str(species)), ("g", genus or "")]
+        for kind, key in keys:
+            tallies[(kind, key, False)] += 1
+            if plant_died is None:
+                tallies[(kind, key, True)] += 1
+    return tallies
+
+
+def build_tallies(apps, schema_editor):
+    """Count the tallies of all existing Departments and Territories"""
+    Outplanting = apps.get_model("individuals", "Outplanting")
+    OutplantingTally = apps.get_model("individuals", "OutplantingTally")
+    for field in ("department", "territory"):
+        Location = apps.get_model("individuals", field)
+        outplanting_field = "department" if field == "department" else "department__territory"
+        for pk in Location.objects.values_list("pk", flat=True).iterator():
+            tallies = count_tallies(Outplanting.objects.filter(**{outplanting_field: pk}).values_list(
+                "individual", "individual__species", "individual__species__family__genus", "plant_died"
+            ))
+            OutplantingTally.objects.bulk_create([
+                OutplantingTally(kind=kind, key=key, alive=alive, count=count, **{"%s_id" % field: pk})
+                for (kind, key, alive), count in tallies.items()
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0002_outplanting_id_lists'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutplantingTally',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('o', 'outplantings'), ('i', 'individuals'), ('s', 'species'), ('g', 'genera')], max_length=1)),
+                ('key', models.CharField(blank=True, max_length=50)),
+                ('alive', models.BooleanField(default=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='individuals.department')),
+                ('territory', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='individuals.territory')),
+            ],
+            options={
+                'verbose_name': 'outplanting tally',
+                'verbose_name_plural': 'outplanting tallies',
+            },
+        ),
+        migrations.RunPython(build_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+from django.db import migrations, models
+
+
+# a copy of the view of individuals/stats.py at the time of this migration
+
+_COUNTERS_SQL = """
+    COUNT(*) AS num_outplantings,
+    COUNT(DISTINCT o.individual_id) AS num_individuals,
+    COUNT(DISTINCT i.species_id) AS num_species,
+    COUNT(DISTINCT f.genus) AS num_genera,
+    COUNT(*) FILTER (WHERE o.plant_died IS NULL) AS num_outplantings_alive,
+    COUNT(DISTINCT o.individual_id) FILTER (WHERE o.plant_died IS NULL) AS num_individuals_alive,
+    COUNT(DISTINCT i.species_id) FILTER (WHERE o.plant_died IS NULL) AS num_species_alive,
+    COUNT(DISTINCT f.genus) FILTER (WHERE o.plant_died IS NULL) AS num_genera_alive
+"""
+
+_JOIN_SQL = """
+    FROM individuals_outplanting o
+    INNER JOIN individuals_department d ON d.id = o.department_id
+    INNER JOIN individuals_individual i ON i.id = o.individual_id
+    INNER JOIN species_species s ON s.id = i.species_id
+    INNER JOIN species_family f ON f.id = s.family_id
+"""
+
+CREATE_VIEW_SQL = [
+    """
+    CREATE MATERIALIZED VIEW individuals_outplantingstats AS
+    SELECT 'd' || o.department_id AS id, %(counters)s %(join)s
+    GROUP BY o.department_id
+    UNION ALL
+    SELECT 't' || d.territory_id AS id, %(counters)s %(join)s
+    WHERE d.territory_id IS NOT NULL
+    GROUP BY d.territory_id
+    """ % {"counters": _COUNTERS_SQL, "join": _JOIN_SQL},
+    "CREATE UNIQUE INDEX individuals_outplantingstats_id ON individuals_outplantingstats (id)",
+]
+
+DROP_VIEW_SQL = ["DROP MATERIALIZED VIEW IF EXISTS individuals_outplantingstats"]
+
+
+def create_view(apps, schema_editor):
+    """The materialized view only exists on PostgreSQL"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in CREATE_VIEW_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_view(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in DROP_VIEW_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0003_outplantingtally'),
+        ('species', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutplantingStats',
+            fields=[
+                ('id', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('num_outplantings', models.IntegerField()),
+                ('num_individuals', models.IntegerField()),
+                ('num_species', models.IntegerField()),
+                ('num_genera', models.IntegerField()),
+                ('num_outplantings_alive', models.IntegerField()),
+                ('num_individuals_alive', models.IntegerField()),
+                ('num_species_alive', models.IntegerField()),
+                ('num_genera_alive', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'individuals_outplantingstats',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_view, drop_view),
+    ]
@@ -0,0 +1,48 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0004_outplantingstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('next_number', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'number sequence',
+                'verbose_name_plural': 'number sequences',
+            },
+        ),
+        migrations.AlterField(
+            model_name='individual',
+            name='accession_number',
+            field=models.IntegerField(db_index=True, null=True, unique=True, verbose_name='accession #'),
+        ),
+        migrations.AlterField(
+            model_name='individual',
+            name='order_number',
+            field=models.IntegerField(unique=True, verbose_name='order number'),
+        ),
+        migrations.CreateModel(
+            name='NumberReservation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('number', models.BigIntegerField()),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'number reservation',
+                'verbose_name_plural': 'number reservations',
+                'unique_together': {('name', 'number')},
+            },
+        ),
+    ]
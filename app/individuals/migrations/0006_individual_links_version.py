@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0005_number_allocator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='individual',
+            name='links_version_generated',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
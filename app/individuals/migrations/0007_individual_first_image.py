@@ -0,0 +1,49 @@
+# Generated by Django 3.2 on 2026-10-18 12:35
+
+from django.db import migrations, models
+
+
+def first_image_values(image):
+    """A copy of plantimages.models.first_image_values() at the time of this migration, existing thumbnails only"""
+    from easy_thumbnails.files import get_thumbnailer
+    from easy_thumbnails.alias import aliases
+    from easy_thumbnails.exceptions import InvalidImageFormatError
+
+    values = {"pk": image.pk, "image": image.image.name, "comment": image.comment, "thumbnail": ""}
+    try:
+        thumbnail = get_thumbnailer(image.image).get_thumbnail(aliases.get("preview"), generate=False)
+    except (InvalidImageFormatError, ValueError, OSError):
+        thumbnail = None
+    if thumbnail:
+        values["thumbnail"] = thumbnail.name
+    return values
+
+
+def fill_first_images(apps, schema_editor):
+    """Store the first image of all Individuals, with the thumbnails that already exist"""
+    PlantImage = apps.get_model("plantimages", "PlantImage")
+    Individual = apps.get_model("individuals", "Individual")
+    individual_pk = None
+    for image in PlantImage.objects.exclude(image="").order_by("individual", "pk").iterator():
+        if image.individual_id != individual_pk:
+            individual_pk = image.individual_id
+            Individual.objects.filter(pk=individual_pk).update(
+                first_image_generated=first_image_values(image)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0006_individual_links_version'),
+        ('plantimages', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='individual',
+            name='first_image_generated',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(fill_first_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+
+# a copy of tools.db_indexes.TRIGRAM_INDEXES at the time of this migration
+TRIGRAM_INDEXES = (
+    ("individuals_individual", "id_name_generated"),
+    ("individuals_individual", "ipen_generated"),
+    ("individuals_individual", "departments_generated"),
+    ("species_species", "full_name_generated"),
+    ("species_species", "species"),
+    ("species_family", "family"),
+    ("species_family", "genus"),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Trigram indexes for the icontains filters, PostgreSQL only"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "%s_%s_trgm" ON "%s" USING gin ((UPPER("%s"::text)) gin_trgm_ops)' % (
+                table, column, table, column,
+            )
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS "%s_%s_trgm"' % (table, column))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0007_individual_first_image'),
+        ('species', '0002_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='individual',
+            index=models.Index(condition=models.Q(seed_available=True), fields=['accession_number'], name='individual_seed_accession_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='individual',
+            index=models.Index(fields=['species', 'accession_number'], name='individual_species_acc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outplanting',
+            index=models.Index(condition=models.Q(plant_died=None), fields=['department', 'individual'], name='outplanting_alive_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
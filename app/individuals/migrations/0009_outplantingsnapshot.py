@@ -0,0 +1,94 @@
+# Generated by Django 3.2 on 2026-10-18 12:41
+
+import datetime
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# a copy of individuals.snapshots.snapshot_series() at the time of this migration
+
+SNAPSHOT_COUNTERS = {"o": "num_outplantings", "i": "num_individuals", "s": "num_species", "g": "num_genera"}
+
+SNAPSHOT_ROW_FIELDS = ("individual", "individual__species", "individual__species__family__genus",
+                       "date", "seeded_date", "plant_died")
+
+
+def snapshot_series(rows):
+    events = {}
+    for individual, species, genus, date, seeded_date, plant_died in rows:
+        start = date or seeded_date or datetime.date.min
+        if plant_died is not None and plant_died <= start:
+            continue
+        keys = [("o", ""), ("i", str(individual)), ("s", "" if species is None else str(species)), ("g", genus or "")]
+        events.setdefault(start, []).append((keys, 1))
+        if plant_died is not None:
+            events.setdefault(plant_died, []).append((keys, -1))
+
+    series = []
+    tallies = Counter()
+    previous = None
+    for date in sorted(events):
+        for keys, delta in events[date]:
+            for key in keys:
+                tallies[key] += delta
+        counts = dict.fromkeys(SNAPSHOT_COUNTERS.values(), 0)
+        for (kind, key), count in tallies.items():
+            if count > 0:
+                counts[SNAPSHOT_COUNTERS[kind]] += count if kind == "o" else 1
+        if counts != previous:
+            series.append((date, counts))
+            previous = counts
+    return series
+
+
+def build_snapshots(apps, schema_editor):
+    """Backfill the history of all Departments and Territories from the outplanting dates"""
+    Outplanting = apps.get_model("individuals", "Outplanting")
+    OutplantingSnapshot = apps.get_model("individuals", "OutplantingSnapshot")
+    for field in ("department", "territory"):
+        Location = apps.get_model("individuals", field)
+        outplanting_field = "department" if field == "department" else "department__territory"
+        for pk in Location.objects.values_list("pk", flat=True).iterator():
+            rows = Outplanting.objects.filter(**{outplanting_field: pk}).values_list(*SNAPSHOT_ROW_FIELDS)
+            OutplantingSnapshot.objects.bulk_create([
+                OutplantingSnapshot(date=date, **{"%s_id" % field: pk}, **counts)
+                for date, counts in snapshot_series(rows.iterator())
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0008_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutplantingSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('num_outplantings', models.PositiveIntegerField(default=0)),
+                ('num_individuals', models.PositiveIntegerField(default=0)),
+                ('num_species', models.PositiveIntegerField(default=0)),
+                ('num_genera', models.PositiveIntegerField(default=0)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='individuals.department')),
+                ('territory', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='individuals.territory')),
+            ],
+            options={
+                'verbose_name': 'outplanting snapshot',
+                'verbose_name_plural': 'outplanting snapshots',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outplantingsnapshot',
+            index=models.Index(fields=['department', 'date'], name='snapshot_department_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outplantingsnapshot',
+            index=models.Index(fields=['territory', 'date'], name='snapshot_territory_date_idx'),
+        ),
+        migrations.RunPython(build_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 3.2 on 2026-10-18 12:47
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+# a copy of tools/search.py at the time of this migration
+
+SEARCH_TABLES = ("species_species", "individuals_individual")
+
+
+def _join(*values):
+    return " ".join(str(value) for value in values if value not in (None, ""))
+
+
+def species_search_text(species):
+    family = species.family
+    return _join(
+        family.genus, species.species, species.subspecies, species.variety, species.form, species.cultivar,
+        family.family, family.subfamily, family.tribus, family.subtribus,
+        species.deutscher_name, species.synonyme,
+    )
+
+
+def individual_search_text(individual, species_text, ipen):
+    return _join(
+        individual.accession_number, individual.order_number, ipen,
+        individual.source.name if individual.source_id else None,
+        species_text,
+    )
+
+
+def create_search_triggers(apps, schema_editor):
+    """tsvector triggers and GIN indexes, PostgreSQL only"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("""
+        CREATE OR REPLACE FUNCTION botgard_search_vector() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector_generated := to_tsvector('simple', coalesce(NEW.search_text_generated, ''));
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table in SEARCH_TABLES:
+        schema_editor.execute(
+            'CREATE TRIGGER "%s_search_vector" BEFORE INSERT OR UPDATE OF search_text_generated ON "%s" '
+            'FOR EACH ROW EXECUTE PROCEDURE botgard_search_vector()' % (table, table)
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "%s_search_vector" ON "%s" USING gin (search_vector_generated)' % (
+                table, table,
+            )
+        )
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute('DROP INDEX IF EXISTS "%s_search_vector"' % table)
+        schema_editor.execute('DROP TRIGGER IF EXISTS "%s_search_vector" ON "%s"' % (table, table))
+    schema_editor.execute("DROP FUNCTION IF EXISTS botgard_search_vector()")
+
+
+def fill_search_texts(apps, schema_editor):
+    Species = apps.get_model("species", "Species")
+    Individual = apps.get_model("individuals", "Individual")
+
+    species_texts = {}
+    species_list = []
+    for species in Species.objects.select_related("family").iterator():
+        species.search_text_generated = species_texts[species.pk] = species_search_text(species)
+        species_list.append(species)
+    Species.objects.bulk_update(species_list, ["search_text_generated"], batch_size=1000)
+
+    individuals = []
+    for individual in Individual.objects.select_related("source").iterator():
+        individual.search_text_generated = individual_search_text(
+            individual, species_texts.get(individual.species_id), individual.ipen_generated,
+        )
+        individuals.append(individual)
+    Individual.objects.bulk_update(individuals, ["search_text_generated"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0009_outplantingsnapshot'),
+        ('species', '0003_search_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='individual',
+            name='search_text_generated',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='individual',
+            name='search_vector_generated',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+        migrations.RunPython(fill_search_texts, migrations.RunPython.noop),
+    ]
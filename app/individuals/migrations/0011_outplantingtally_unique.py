@@ -0,0 +1,38 @@
+# Generated by Django 3.2 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """Sum up tallies that concurrent flushes created twice"""
+    OutplantingTally = apps.get_model("individuals", "OutplantingTally")
+    for field in ("department", "territory"):
+        duplicates = OutplantingTally.objects.filter(**{"%s__isnull" % field: False}).values(
+            field, "kind", "key", "alive"
+        ).annotate(num=models.Count("pk"), total=models.Sum("count")).filter(num__gt=1).order_by()
+        for duplicate in duplicates:
+            tallies = OutplantingTally.objects.filter(
+                **{name: duplicate[name] for name in (field, "kind", "key", "alive")}
+            ).order_by("pk")
+            first = tallies[0]
+            tallies.exclude(pk=first.pk).delete()
+            OutplantingTally.objects.filter(pk=first.pk).update(count=duplicate["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0010_search_text'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='outplantingtally',
+            constraint=models.UniqueConstraint(condition=models.Q(department__isnull=False), fields=('department', 'kind', 'key', 'alive'), name='tally_department_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='outplantingtally',
+            constraint=models.UniqueConstraint(condition=models.Q(territory__isnull=False), fields=('territory', 'kind', 'key', 'alive'), name='tally_territory_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('individuals', '0011_outplantingtally_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='numberreservation',
+            name='token',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+    ]
@@ -1,4 +1,8 @@
-from .individual import Individual, IndividualForm, Seed, SeedForm, SeedCatalog
+from .individual import (
+    Individual, IndividualForm, Seed, SeedForm, SeedCatalog, outplantings_prefetch, prefetch_outplantings,
+)
 from .outplanting import Outplanting
 from .territory import Territory, TerritoryForm, Department, DepartmentForm
-from ..numbers import get_new_accession_number, get_new_order_number
+from .tally import OutplantingTally, OutplantingStats, OutplantingSnapshot
+from .number import NumberSequence, NumberReservation
+from ..numbers import get_new_accession_number, get_new_order_number, reserve_numbers, release_numbers
@@ -8,22 +8,28 @@ from django.urls import reverse
 from django.templatetags.static import static
 from django.utils.html import format_html, escape
 from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from django.core.cache import caches
 #from django.db.models.signals import post_save
 #from django.dispatch import receiver
 from django.conf import settings
-
-from picklefield.fields import PickledObjectField
+from django.contrib.postgres.search import SearchVectorField
 
 #from botman.models import BotanicGarden
 from seedcatalog.models import SeedCatalog
 from tools.countries import ISO_COUNTRY_CHOICES
 from tools.global_request import get_current_request
+from tools import generated_fields
+from tools.search import individual_search_text
 from ajax.autocomplete import AutoCompleteForm
 
 from configuration.accession_extensions import ACCESSION_EXTENSION_CHOICES
 from config_tables.admin import configurable, Configurable
 #from geolocation.models import undefined_geolocation, undefined_osmlocation
-from individuals.numbers import get_new_accession_number, get_new_order_number
+from individuals.numbers import (
+    get_new_accession_number, get_new_order_number, suggest_number, use_numbers,
+    reserve_form_numbers, release_form_numbers,
+)
 
 
 IPEN_TRANSFER_RESTRICTIONS = (
@@ -52,6 +58,94 @@ NOTE_CHOICES = (
 )
 
 
+def outplantings_prefetch():
+    """
+    Returns a Prefetch object for QuerySet.prefetch_related() that loads the
+    Outplantings, Departments and Territories of all Individuals in one query.
+    """
+    from .outplanting import Outplanting
+    return models.Prefetch(
+        "outplanting_set",
+        queryset=Outplanting.objects.select_related("department__territory").order_by("pk"),
+        to_attr="_outplantings_cache",
+    )
+
+
+def prefetch_outplantings(individuals):
+    """
+    Batch loader for Individual.get_outplantings()
+    :param individuals: list of Individual instances, e.g. one changelist page
+    """
+    models.prefetch_related_objects(list(individuals), outplantings_prefetch())
+
+
+def _links_cache_key(individual):
+    return "individual-links:%s:%s:%s" % (individual.pk, individual.links_version_generated, get_language())
+
+
+def prefetch_links_html(individuals):
+    """
+    Batch loader for the department and territory link columns.
+    The rendered links are cached per individual and links_version_generated,
+    so a page of cached individuals costs one cache query.
+    :param individuals: list of Individual instances, e.g. one changelist page
+    """
+    keys = {
+        _links_cache_key(individual): individual
+        for individual in individuals
+        if not hasattr(individual, "_links_html")
+    }
+    if not keys:
+        return
+    cache = caches[settings.FRAGMENT_CACHE]
+    cached = cache.get_many(keys)
+
+    missing = []
+    for key, individual in keys.items():
+        if key in cached:
+            individual._links_html = cached[key]
+        else:
+            missing.append(individual)
+    if missing:
+        prefetch_outplantings(missing)
+        for individual in missing:
+            individual._links_html = (individual._render_departments_html(), individual._render_territories_html())
+        cache.set_many({_links_cache_key(individual): individual._links_html for individual in missing})
+
+
+def bump_links_version(individuals):
+    """
+    Invalidate the cached links of the individuals
+    :param individuals: QuerySet of Individual
+    """
+    Individual.objects.filter(pk__in=individuals.values("pk")).update(
+        links_version_generated=models.F("links_version_generated") + 1
+    )
+
+
+def prefetch_catalog_membership(individuals):
+    """
+    Batch loader for the 'add to current catalog' column.
+    Reads the latest SeedCatalog and which of the individuals it contains
+    with two queries for the whole page.
+    :param individuals: list of Individual instances, e.g. one changelist page
+    """
+    catalog = SeedCatalog.objects.order_by("-pk").first()
+    if catalog is None or catalog.is_finalized:
+        members = None
+    else:
+        members = set(SeedCatalog.seed.through.objects.filter(
+            seedcatalog=catalog, individual__in=[individual.pk for individual in individuals]
+        ).values_list("individual", flat=True))
+
+    redirect = ""
+    request = get_current_request()
+    if request is not None:
+        redirect = escape(request.get_full_path())
+
+    for individual in individuals:
+        individual._catalog_membership = (catalog, members, redirect)
+
 
 class Individual(models.Model, Configurable):
 
@@ -59,6 +153,12 @@ class Individual(models.Model, Configurable):
         verbose_name = _("individual")
         verbose_name_plural = _("individuals")
         unique_together = ("ipen_country", "ipen_transfer_restricted", "ipen_accession_number", "ipen_garden_code")
+        indexes = [
+            # seed changelist, see tools/db_indexes.py
+            models.Index(fields=["accession_number"], condition=models.Q(seed_available=True),
+                         name="individual_seed_accession_idx"),
+            models.Index(fields=["species", "accession_number"], name="individual_species_acc_idx"),
+        ]
 
     _id_field = "id_name_generated"
 
@@ -67,7 +167,7 @@ class Individual(models.Model, Configurable):
     #    self.register_generated_field("ipen_generated", ("ipen_garden_code",))
 
     accession_number = models.IntegerField(verbose_name=_("accession #"), blank=False, null=True, db_index=True,
-                                           default=get_new_accession_number, unique=True)
+                                           unique=True)
     accession_extension = models.CharField(max_length=2, verbose_name=_("code of origin"),
                                            choices=ACCESSION_EXTENSION_CHOICES, blank=True, null=True)
     species = models.ForeignKey('species.Species', verbose_name=_("genus & Species"), blank=False,
@@ -105,16 +205,17 @@ class Individual(models.Model, Configurable):
                                       verbose_name="IPEN")  # help field for searching and sorting for ipen
 
     seed_available = models.BooleanField(verbose_name=_("seed available"))
-    order_number = models.IntegerField(verbose_name=_("order number"), unique=True, default=get_new_order_number)
+    # numbers are allocated on first save if not set, see individuals/numbers.py
+    order_number = models.IntegerField(verbose_name=_("order number"), unique=True)
 
     seed_collector_date = models.DateField(verbose_name=_("seed's collection date"), blank=True, null=True)
     seed_in_stock = models.BooleanField(verbose_name=_("seed in stock"))
 
     # list of PKs of Outplanting
-    alive_outplantings_generated = PickledObjectField(verbose_name=_("alive_outplantings_generated"),
-                                                      default=None, blank=True, null=True)
-    outplantings_generated = PickledObjectField(verbose_name=_("outplantings_generated"),
-                                                default=None, blank=True, null=True)
+    alive_outplantings_generated = models.JSONField(verbose_name=_("alive_outplantings_generated"),
+                                                    default=list, blank=True, editable=False)
+    outplantings_generated = models.JSONField(verbose_name=_("outplantings_generated"),
+                                              default=list, blank=True, editable=False)
 
     # department codes as text
     departments_generated = models.CharField(max_length=1000, verbose_name=_("departments"), blank=True)
@@ -123,6 +224,14 @@ class Individual(models.Model, Configurable):
 
     sowing_number = models.CharField(verbose_name=_("sowing number"), max_length=100, blank=True)
     is_alive_generated = models.BooleanField(verbose_name=_("is alive"), editable=False, default=False)
+    # incremented when the department or territory links change, see prefetch_links_html()
+    links_version_generated = models.PositiveIntegerField(editable=False, default=0)
+    # file names and comment of the first PlantImage, see plantimages.models.update_first_image()
+    first_image_generated = models.JSONField(default=dict, blank=True, editable=False)
+    # numbers, IPEN, source and species names for the changelist search, see tools/search.py
+    search_text_generated = models.TextField(default="", blank=True, editable=False)
+    # tsvector of search_text_generated, maintained by a trigger on PostgreSQL
+    search_vector_generated = SearchVectorField(null=True, editable=False)
 
     # geo_location = models.ForeignKey("geolocation.GeoLocation", verbose_name=_("location (geonames)"),
     #                                  default=undefined_geolocation,
@@ -140,36 +249,38 @@ class Individual(models.Model, Configurable):
         - departments_generated
         - territories_generated
         - is_alive_generated
+
+        See individuals.calc.calc_individuals_outplantings() for the bulk version.
         """
-        from .outplanting import Outplanting
-        locations = Outplanting.objects.filter(individual=self.pk)
-        locations_alive = locations.filter(plant_died=None)
-
-        self.outplantings_generated = [t[0] for t in locations.values_list("id")]
-        self.alive_outplantings_generated = [t[0] for t in locations_alive.values_list("id")]
-        self.departments_generated = " ".join(sorted(set(
-            l.department.full_code for l in locations if l.department)))
-        self.territories_generated = " ".join("(%s)" % i for i in
-            sorted(set(l.department.territory.code for l in locations if l.department and l.department.territory)))
-        self.is_alive_generated = locations_alive.count() > 0
+        from ..calc import calc_outplanting_values, _outplanting_rows
+        values = calc_outplanting_values(row[1:] for row in _outplanting_rows([self.pk]))
+        for name, value in values.items():
+            setattr(self, name, value)
         if do_save:
             self.save()
 
     def get_outplantings(self, alive_only=True):
-        """Returns list of belonging Outplanting instances from database-cache"""
-        from .outplanting import Outplanting
+        """Returns list of belonging Outplanting instances from database-cache.
+        Uses the instances loaded by prefetch_outplantings() if present."""
         ids = self.alive_outplantings_generated if alive_only else self.outplantings_generated
         if not ids:
             return []
-        outpl = []
-        for id in ids:
-            try:
-                outpl.append(Outplanting.objects.get(pk=id))
-            except Outplanting.DoesNotExist:
-                pass
-        return outpl
+        if not hasattr(self, "_outplantings_cache"):
+            prefetch_outplantings([self])
+        ids = set(ids)
+        return [o for o in self._outplantings_cache if o.pk in ids]
 
     def _get_departments_html(self):
+        if not hasattr(self, "_links_html"):
+            prefetch_links_html([self])
+        return mark_safe(self._links_html[0])
+
+    def _get_territories_html(self):
+        if not hasattr(self, "_links_html"):
+            prefetch_links_html([self])
+        return mark_safe(self._links_html[1])
+
+    def _render_departments_html(self):
         links = []
         deps = {elem.department.full_code: elem.department
                 for elem in self.get_outplantings(alive_only=False)
@@ -182,7 +293,7 @@ class Individual(models.Model, Configurable):
                 url, department.name, department.full_code.replace(" ", "&nbsp;")))
         return mark_safe("<br/>\n".join(links))
 
-    def _get_territories_html(self):
+    def _render_territories_html(self):
         links = []
         deps = {elem.department.territory.code: elem.department.territory
                 for elem in self.get_outplantings(alive_only=False)
@@ -216,18 +327,21 @@ class Individual(models.Model, Configurable):
     # redirection to field for filter-list
     # can also be a non-foreign field
     species_link_decorator.searchable_field = "species__full_name_generated"
+    species_link_decorator.select_related = ("species__family",)
 
     @configurable
     def family_single(self):
         return self.species.family.family
     family_single.short_description = _('family')
     family_single.admin_order_field = "species__family__family"
+    family_single.select_related = ("species__family",)
 
     @configurable
     def genus_single(self):
         return self.species.family.genus
     genus_single.short_description = _('genus')
     genus_single.admin_order_field = "species__family__genus"
+    genus_single.select_related = ("species__family",)
 
     @configurable
     def endangering_decorator(self):
@@ -236,6 +350,7 @@ class Individual(models.Model, Configurable):
     endangering_decorator.short_description = _("endangering")
     endangering_decorator.admin_order_field = "species__protection_of_species"
     endangering_decorator.searchable_field = "species__protection_of_species"
+    endangering_decorator.select_related = ("species",)
 
     @configurable
     def delete_link_decorator(self):
@@ -260,12 +375,14 @@ class Individual(models.Model, Configurable):
         return self._get_departments_html()
     departments_decorator.short_description = _("departments")
     departments_decorator.admin_order_field = "departments_generated"
+    departments_decorator.prefetch = (prefetch_links_html,)
 
     @configurable
     def territories_decorator(self):
         return self._get_territories_html()
     territories_decorator.short_description = _("territories")
     territories_decorator.admin_order_field = "territories_generated"
+    territories_decorator.prefetch = (prefetch_links_html,)
 
     @configurable
     def nomenclature_checked_decorator(self):
@@ -274,18 +391,21 @@ class Individual(models.Model, Configurable):
         return mark_safe(format_html('<img src="{}" alt="{}" />', icon_url, self.species.nomenclature_checked))
     nomenclature_checked_decorator.short_description = _("nomenclature checked")
     nomenclature_checked_decorator.admin_order_field = "species__nomenclature_checked"
+    nomenclature_checked_decorator.select_related = ("species",)
 
     @configurable
     def etikett_text_decorator(self):
         return self.species.area_of_distribution_etikettxt
     etikett_text_decorator.short_description = _("label text")
     etikett_text_decorator.admin_order_field = "species__area_of_distribution_etikettxt"
+    etikett_text_decorator.select_related = ("species",)
 
     @configurable
     def etikett_detail_decorator(self):
         return self.species.area_of_distribution_background
     etikett_detail_decorator.short_description = _("detailed")
     etikett_detail_decorator.admin_order_field = "species__area_of_distribution_background"
+    etikett_detail_decorator.select_related = ("species",)
 
     @configurable
     def is_alive(self):
@@ -297,21 +417,18 @@ class Individual(models.Model, Configurable):
 
     @configurable
     def image_decorator(self):
-        from plantimages.models import PlantImage
-        from easy_thumbnails.files import get_thumbnailer
-        from easy_thumbnails.exceptions import InvalidImageFormatError
-
-        qset = PlantImage.objects.filter(individual=self)
-        if not qset.exists():
+        image = self.first_image_generated
+        if not image:
             return ""
-        image = qset.order_by("pk")[0]
-        url = "%s%s" % (settings.MEDIA_URL, image.image)
-        try:
-            thumb_url = get_thumbnailer(image.image)['preview'].url
-        except InvalidImageFormatError:
-            return ""
-        alt = image.comment
-        return mark_safe('<a href="%s" title="%s" target="_blank"><img src="%s" alt="%s"/></a>' % (url, alt, thumb_url, alt))
+        url = "%s%s" % (settings.MEDIA_URL, image["image"])
+        if not image.get("thumbnail"):
+            # thumbnail is not generated yet
+            return format_html('<a href="{}" title="{}" target="_blank">{}</a>', url, image["comment"], _("image"))
+        thumb_url = "%s%s" % (settings.MEDIA_URL, image["thumbnail"])
+        return format_html(
+            '<a href="{}" title="{}" target="_blank"><img src="{}" alt="{}"/></a>',
+            url, image["comment"], thumb_url, image["comment"]
+        )
     image_decorator.short_description = _("image")
     image_decorator.exclude_csv = True
 
@@ -358,19 +475,71 @@ class Individual(models.Model, Configurable):
         #    line2 = ""
         return line1, line2
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored species, see the receivers in individuals/models/outplanting.py
+        if "species_id" not in instance.get_deferred_fields():
+            instance._loaded_species = instance.species_id
+        return instance
+
     def save(self, *args, **kwargs):
         # order number: TODO: XXX Do not change order numbers on save !!
         # self.order_number = Individual.objects.all().order_by('-order_number')[0].order_number + 1 | 0
         # self.order_number = Individual.objects.all().aggregate(models.Max('order_number')).values()[0] or 1000
+        if self._state.adding:
+            if self.accession_number is None:
+                self.accession_number = get_new_accession_number(reserve_for=None)
+            if self.order_number is None:
+                self.order_number = get_new_order_number(reserve_for=None)
         # -- update generated fields --
-        self.ipen_generated = str.upper(self.ipen_country) + "-" + str.upper(self.ipen_transfer_restricted) + "-" + str.upper(
-            self.ipen_garden_code.code) + "-" + str(self.ipen_accession_number)
-        # -- update id_name_generated --
-        self.id_name_generated = ("%s (%s)" % (self.accession_number,
-                                               self.species.full_name(with_author=False))
-                                  )[:100]
+        self.ipen_generated = self.get_ipen()
+        self.id_name_generated = self.get_id_name()
+        self.search_text_generated = self.get_search_text()
         # -- save Individual --
+        adding = self._state.adding
         super(Individual, self).save(*args, **kwargs)
+        if adding:
+            use_numbers(self)
+
+    def get_ipen(self):
+        return "-".join((
+            str.upper(self.ipen_country), str.upper(self.ipen_transfer_restricted),
+            str.upper(self.ipen_garden_code.code or ""), str(self.ipen_accession_number),
+        ))
+
+    def get_id_name(self):
+        return ("%s (%s)" % (self.accession_number, self.species.full_name(with_author=False)))[:100]
+
+    def get_search_text(self):
+        return individual_search_text(self, self.species.search_text_generated, self.get_ipen())
+
+
+generated_fields.register(
+    Individual, "ipen_generated", Individual.get_ipen,
+    depends_on=(
+        "ipen_country", "ipen_transfer_restricted", "ipen_accession_number",
+        "ipen_garden_code", "ipen_garden_code__code",
+    ),
+)
+
+generated_fields.register(
+    Individual, "id_name_generated", Individual.get_id_name,
+    depends_on=(
+        "accession_number", "species", "species__species", "species__subspecies", "species__variety",
+        "species__form", "species__cultivar", "species__family", "species__family__genus",
+    ),
+)
+
+generated_fields.register(
+    Individual, "search_text_generated", Individual.get_search_text,
+    depends_on=(
+        "accession_number", "order_number", "source", "source__name",
+        "ipen_country", "ipen_transfer_restricted", "ipen_accession_number",
+        "ipen_garden_code", "ipen_garden_code__code",
+        "species", "species__search_text_generated",
+    ),
+)
 
 
 class IndividualValidateMixin(object):
@@ -378,16 +547,29 @@ class IndividualValidateMixin(object):
     Form validation used for Individual and Seed
     """
     @classmethod
-    def _update_initial(cls, kwargs: dict):
+    def _update_initial(cls, args: tuple, kwargs: dict):
         """
         Adjust the kwargs["initial"] before passing to ModelForm constructor
         """
-        # create same random accession number in two fields when creating a new individual
-        if not kwargs.get("instance"):
+        # reserve the same new accession number for two fields and an order number
+        # when rendering the form for a new individual, once per form token
+        if not kwargs.get("instance") and not args and kwargs.get("data") is None:
             kwargs.setdefault("initial", {})
+            token, numbers = reserve_form_numbers(kwargs["initial"].get("number_token"))
+            kwargs["initial"]["number_token"] = token
             kwargs["initial"]["accession_number"] = kwargs["initial"]["ipen_accession_number"] = (
-                get_new_accession_number()
+                numbers["accession_number"]
             )
+            kwargs["initial"].setdefault("order_number", numbers["order_number"])
+
+    def save(self, commit=True):
+        instance = super().save(commit)
+        # give back the reserved numbers that were replaced in the form,
+        # the used ones are removed when the instance is saved
+        release_form_numbers(self.cleaned_data.get("number_token"), used={
+            "accession_number": instance.accession_number, "order_number": instance.order_number,
+        })
+        return instance
 
     def clean_ipen_garden_code(self):
         '''
@@ -416,7 +598,7 @@ class IndividualValidateMixin(object):
             Model = self.instance.__class__
             qset = Model.objects.filter(order_number=num).exclude(id=self.instance.id)
             if qset.exists():
-                nextnum = get_new_order_number()
+                nextnum = suggest_number("order_number")
                 raise forms.ValidationError(_("Order number already exists, next free number is %s") % nextnum,
                                             code="invalid")
         return num
@@ -428,8 +610,12 @@ class IndividualForm(
         "accession_number": widgets.NumberInput()  # don't need a spinbox for the accession number
     })
 ):
+    # numbers reserved for this form, see numbers.reserve_form_numbers()
+    number_token = forms.CharField(widget=widgets.HiddenInput, required=False)
+    exclude_autocomplete = ("number_token", )
+
     def __init__(self, *args, **kwargs):
-        self._update_initial(kwargs)
+        self._update_initial(args, kwargs)
         super(IndividualForm, self).__init__(*args, **kwargs)
 
 
@@ -445,12 +631,14 @@ class Seed(Individual):
         return self.species.family.family
     family_single.short_description = _('family')
     family_single.admin_order_field = "species__family__family"
+    family_single.select_related = ("species__family",)
 
     @configurable
     def genus_single(self):
         return self.species.family.genus
     genus_single.short_description = _('genus')
     genus_single.admin_order_field = "species__family__genus"
+    genus_single.select_related = ("species__family",)
 
     @configurable
     def seed_etikett_decorator(self):
@@ -468,6 +656,7 @@ class Seed(Individual):
         return mark_safe(format_html('<img src="{}" alt="{}" />', icon_url, self.species.nomenclature_checked))
     nomenclature_checked_decorator.short_description = _("nomenclature checked")
     nomenclature_checked_decorator.admin_order_field = "species__nomenclature_checked"
+    nomenclature_checked_decorator.select_related = ("species",)
     nomenclature_checked_decorator.searchable_field = "species__nomenclature_checked"
 
     @configurable
@@ -475,6 +664,7 @@ class Seed(Individual):
         return self.species.area_of_distribution_background
     etikett_detail_decorator.short_description = _("detailed")
     etikett_detail_decorator.admin_order_field = "species__area_of_distribution_background"
+    etikett_detail_decorator.select_related = ("species",)
     etikett_detail_decorator.searchable_field = "species__area_of_distribution_background"
 
     @configurable
@@ -482,6 +672,7 @@ class Seed(Individual):
         return self.species.area_of_distribution_etikettxt
     etikett_text_decorator.short_description = _("label text")
     etikett_text_decorator.admin_order_field = "species__area_of_distribution_etikettxt"
+    etikett_text_decorator.select_related = ("species",)
     etikett_text_decorator.searchable_field = "species__area_of_distribution_etikettxt"
 
     @configurable
@@ -489,22 +680,18 @@ class Seed(Individual):
         return self.species.area_of_distribution_background
     etikett_detail_decorator.short_description = _("detailed")
     etikett_detail_decorator.admin_order_field = "species__area_of_distribution_background"
+    etikett_detail_decorator.select_related = ("species",)
     etikett_detail_decorator.searchable_field = "species__area_of_distribution_background"
 
     def seed_add_to_latest_catalog_decorator(self):
-        try:
-            catalog = SeedCatalog.objects.latest('pk')
-            assert not catalog.is_finalized
-        except:
+        if not hasattr(self, "_catalog_membership"):
+            prefetch_catalog_membership([self])
+        catalog, members, redirect = self._catalog_membership
+        if members is None:
             url = reverse("admin:seedcatalog_seedcatalog_add")
             return mark_safe('<a href="%s">%s</a>' % (url, _("Create new catalog.")))
 
-        request = get_current_request()
-        redirect = escape(request.path)
-        if request.GET:
-            redirect += "?" + request.GET.urlencode()
-
-        if catalog.seed.filter(pk=self.pk):
+        if self.pk in members:
             url = reverse("seedcatalog:remove_seed", args=(self.pk, catalog.pk,))
             return_string = '<a title="%s: %s" href="%s?_redirect=%s">%s</a>' % (
                 _("catalog"), catalog, url, redirect, _("remove")
@@ -517,6 +704,7 @@ class Seed(Individual):
         return mark_safe(return_string)
     seed_add_to_latest_catalog_decorator.short_description = _('add to current catalog')
     seed_add_to_latest_catalog_decorator.exclude_csv = True
+    seed_add_to_latest_catalog_decorator.prefetch = (prefetch_catalog_membership,)
 
 
 class SeedForm(
@@ -525,8 +713,12 @@ class SeedForm(
         "accession_number": widgets.Input()  # don't need a spinbox for the accession number
     })
 ):
+    # numbers reserved for this form, see numbers.reserve_form_numbers()
+    number_token = forms.CharField(widget=widgets.HiddenInput, required=False)
+    exclude_autocomplete = ("number_token", )
+
     def __init__(self, *args, **kwargs):
-        self._update_initial(kwargs)
+        self._update_initial(args, kwargs)
         super(SeedForm, self).__init__(*args, **kwargs)
 
 
@@ -0,0 +1,53 @@
+from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+
+from .individual import Individual, Seed
+
+
+class NumberSequence(models.Model):
+    """
+    Low watermark of the number allocator, see individuals/numbers.py.
+    All numbers below `next_number` are known to be used or reserved.
+    """
+    class Meta:
+        verbose_name = _("number sequence")
+        verbose_name_plural = _("number sequences")
+
+    # "<fieldname>:<method>:<min>"
+    name = models.CharField(max_length=100, unique=True)
+    next_number = models.BigIntegerField()
+
+    def __str__(self):
+        return "%s: %s" % (self.name, self.next_number)
+
+
+class NumberReservation(models.Model):
+    """A number handed out by the allocator but not yet stored in an Individual"""
+    class Meta:
+        verbose_name = _("number reservation")
+        verbose_name_plural = _("number reservations")
+        unique_together = (("name", "number"), )
+
+    # field name of Individual
+    name = models.CharField(max_length=50)
+    number = models.BigIntegerField()
+    expires = models.DateTimeField(db_index=True)
+    # the add form the number is shown in, see numbers.reserve_form_numbers()
+    token = models.CharField(max_length=32, blank=True, db_index=True)
+
+    def __str__(self):
+        return "%s: %s" % (self.name, self.number)
+
+
+@receiver(post_delete, sender=Individual)
+@receiver(post_delete, sender=Seed)
+def on_individual_delete(sender, instance, **kwargs):
+    # give the numbers back to the gap-filling sequences
+    for fieldname in ("accession_number", "order_number"):
+        number = getattr(instance, fieldname)
+        if number is not None:
+            NumberSequence.objects.filter(
+                name__startswith="%s:incremental_tight:" % fieldname, next_number__gt=number,
+            ).update(next_number=number)
@@ -1,18 +1,45 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
-from django.db.models.signals import post_save, pre_delete, post_init, m2m_changed
+from django.db.models.signals import pre_save, post_save, pre_delete, post_init, m2m_changed
 from django.utils.safestring import mark_safe
 from django.dispatch import receiver
 
+from species.models import Species, Family
 from .individual import Individual
+from ..calc import mark_dirty, mark_outplanting_dirty
 from config_tables.admin import configurable, Configurable
 
 
+# attnames of the values an Outplanting is counted with
+STATE_FIELDS = ("department_id", "individual_id", "date", "seeded_date", "plant_died")
+
+# attribute value of instances that were not loaded from the database
+_NOT_LOADED = object()
+
+
+def _set_stored_state(instance, state):
+    instance._loaded_state = state
+    instance._loaded_location = state[:2] if state is not None else None
+
+
+def _stored_value(instance, attr, field):
+    """The stored value of a field, remembered by from_db() or read for instances that were not loaded"""
+    value = getattr(instance, attr, _NOT_LOADED)
+    if value is _NOT_LOADED:
+        value = type(instance).objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    return value
+
+
 class Outplanting(models.Model, Configurable):
     class Meta:
         verbose_name = _("Outplanting")
         verbose_name_plural = _("Outplantings")
+        indexes = [
+            # living plants of a department or territory, see tools/db_indexes.py
+            models.Index(fields=["department", "individual"], condition=models.Q(plant_died=None),
+                         name="outplanting_alive_idx"),
+        ]
 
     department = models.ForeignKey('individuals.Department', verbose_name=_("department"),
                                    null=True, on_delete=models.SET_DEFAULT, default=None)
@@ -35,6 +62,19 @@ class Outplanting(models.Model, Configurable):
             else:
                 return '%d-%d-%d %s' % (self.date.year, self.date.month, self.date.day, self.department.code)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored values so a move also recalculates the previous location,
+        # see snapshots.apply_outplanting_changes()
+        if not instance.get_deferred_fields() & set(STATE_FIELDS):
+            _set_stored_state(instance, instance.get_state())
+        return instance
+
+    def get_state(self):
+        """The values of STATE_FIELDS"""
+        return tuple(getattr(self, name) for name in STATE_FIELDS)
+
     def is_alive(self, strong=False):
         """Runtime (non-DB) check for 'aliveness'"""
         if not strong:
@@ -46,12 +86,14 @@ class Outplanting(models.Model, Configurable):
         return "%s" % self.department
     department_decorator.short_description = _("department")
     department_decorator.admin_order_field = "department__code"
+    department_decorator.select_related = ("department",)
 
     @configurable
     def territory_decorator(self):
         return "%s" % self.department.territory
     territory_decorator.short_description = _("territory")
     territory_decorator.admin_order_field = "department__territory__code"
+    territory_decorator.select_related = ("department__territory",)
 
     @configurable
     def individual_link_decorator(self):
@@ -59,41 +101,88 @@ class Outplanting(models.Model, Configurable):
         return mark_safe('<a href="%s">%s</a>' % (url, self.individual.ipen_generated))
     individual_link_decorator.short_description = _("individual")
     individual_link_decorator.admin_order_field = "individual__ipen_generated"
+    individual_link_decorator.select_related = ("individual",)
 
     @configurable
     def family_single(self):
         return self.individual.species.family.family
     family_single.short_description = _('family')
     family_single.admin_order_field = "individual__species__family__family"
+    family_single.select_related = ("individual__species__family",)
 
     @configurable
     def genus_single(self):
         return self.individual.species.family.genus
     genus_single.short_description = _('genus')
     genus_single.admin_order_field = "individual__species__family__genus"
+    genus_single.select_related = ("individual__species__family",)
+
+
+def _load_stored_state(instance):
+    """Reads the stored values of an instance that was not loaded from the database"""
+    if getattr(instance, "_loaded_state", _NOT_LOADED) is not _NOT_LOADED:
+        return
+    state = None
+    if instance.pk is not None:
+        state = Outplanting.objects.filter(pk=instance.pk).values_list(*STATE_FIELDS).first()
+    _set_stored_state(instance, state)
 
 
-def _recalc_outplanting_fields(outplanting, exclude_outplanting=None):
-    """
-    Recalculate statistics for all Territories and Departments
-    use `exclude_outplanting` to exclude an Outplanting instance from being counted
-    """
-    if outplanting.department:
-        outplanting.department.calc_outplanting_fields(exclude_outplanting=exclude_outplanting)
-        if outplanting.department.territory:
-            outplanting.department.territory.calc_outplanting_fields(exclude_outplanting=exclude_outplanting)
-    if outplanting.individual:
-        outplanting.individual.calc_outplantings()
+@receiver(pre_save, sender=Outplanting)
+def on_outplanting_pre_save(sender, instance, **kwargs):
+    _load_stored_state(instance)
 
 
 @receiver(post_save, sender=Outplanting)
 def on_outplanting_save(sender, instance, **kwargs):
-    #print("OUTPLANTING POSTSAVE %s %s %s" % (sender, instance, kwargs))
-    _recalc_outplanting_fields(instance)
+    mark_outplanting_dirty(instance)
+    _set_stored_state(instance, instance.get_state())
 
 
 @receiver(pre_delete, sender=Outplanting)
 def on_outplanting_delete(sender, instance, **kwargs):
-    #print("DELETE %s %s %s" % (sender, instance, kwargs))
-    _recalc_outplanting_fields(instance, exclude_outplanting=instance)
+    # recalculation runs after the delete, no need to exclude the instance
+    _load_stored_state(instance)
+    mark_outplanting_dirty(instance)
+
+
+@receiver(pre_save, sender=Individual)
+def on_individual_pre_save(sender, instance, **kwargs):
+    # a changed species moves the species and genus tallies of all outplantings
+    if instance.pk is not None:
+        species = _stored_value(instance, "_loaded_species", "species")
+        if species is not None and species != instance.species_id:
+            mark_dirty(departments=instance.outplanting_set.values_list("department", flat=True))
+
+
+@receiver(post_save, sender=Individual)
+def on_individual_save(sender, instance, **kwargs):
+    instance._loaded_species = instance.species_id
+
+
+@receiver(pre_save, sender=Species)
+def on_species_pre_save(sender, instance, **kwargs):
+    if instance.pk is not None:
+        family = _stored_value(instance, "_loaded_family", "family")
+        if family is not None and family != instance.family_id:
+            mark_dirty(departments=Outplanting.objects.filter(
+                individual__species=instance.pk).values_list("department", flat=True).distinct())
+
+
+@receiver(post_save, sender=Species)
+def on_species_save(sender, instance, **kwargs):
+    instance._loaded_family = instance.family_id
+
+
+@receiver(pre_save, sender=Family)
+def on_family_pre_save(sender, instance, **kwargs):
+    if instance.pk is not None:
+        genus = _stored_value(instance, "_loaded_genus", "genus")
+        if genus is not None and genus != instance.genus:
+            mark_dirty(departments=Outplanting.objects.filter(
+                individual__species__family=instance.pk).values_list("department", flat=True).distinct())
+
 
+@receiver(post_save, sender=Family)
+def on_family_save(sender, instance, **kwargs):
+    instance._loaded_genus = instance.genus
@@ -0,0 +1,107 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class OutplantingTally(models.Model):
+    """
+    Reference count of Outplantings per location and individual, species or genus.
+
+    The distinct counters of Department and Territory (CalcOutplantingsMixin)
+    are maintained incrementally: a counter only changes when a tally
+    goes from zero to non-zero or back.
+    """
+    class Meta:
+        verbose_name = _("outplanting tally")
+        verbose_name_plural = _("outplanting tallies")
+        # NULLs are distinct in unique constraints, so one per location field
+        constraints = [
+            models.UniqueConstraint(
+                fields=["department", "kind", "key", "alive"], condition=models.Q(department__isnull=False),
+                name="tally_department_unique",
+            ),
+            models.UniqueConstraint(
+                fields=["territory", "kind", "key", "alive"], condition=models.Q(territory__isnull=False),
+                name="tally_territory_unique",
+            ),
+        ]
+
+    KIND_CHOICES = (
+        ("o", _("outplantings")),
+        ("i", _("individuals")),
+        ("s", _("species")),
+        ("g", _("genera")),
+    )
+
+    department = models.ForeignKey(
+        'individuals.Department', null=True, blank=True, on_delete=models.CASCADE, related_name="+",
+    )
+    territory = models.ForeignKey(
+        'individuals.Territory', null=True, blank=True, on_delete=models.CASCADE, related_name="+",
+    )
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    # pk of individual or species, genus name
+    key = models.CharField(max_length=50, blank=True)
+    # False counts all outplantings, True only the living ones
+    alive = models.BooleanField(default=False)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "%s %s %s%s: %s" % (
+            self.department_id or self.territory_id, self.kind, self.key, " alive" if self.alive else "", self.count
+        )
+
+
+class OutplantingStats(models.Model):
+    """
+    Read-only access to the PostgreSQL materialized view of the
+    Territory and Department statistics, see individuals/stats.py
+    """
+    class Meta:
+        managed = False
+        db_table = "individuals_outplantingstats"
+
+    # "d<department pk>" or "t<territory pk>"
+    id = models.CharField(max_length=20, primary_key=True)
+
+    num_outplantings = models.IntegerField()
+    num_individuals = models.IntegerField()
+    num_species = models.IntegerField()
+    num_genera = models.IntegerField()
+
+    num_outplantings_alive = models.IntegerField()
+    num_individuals_alive = models.IntegerField()
+    num_species_alive = models.IntegerField()
+    num_genera_alive = models.IntegerField()
+
+
+class OutplantingSnapshot(models.Model):
+    """
+    Living outplantings of a location from `date` on until the next
+    snapshot of the location, see individuals/snapshots.py
+    """
+    class Meta:
+        verbose_name = _("outplanting snapshot")
+        verbose_name_plural = _("outplanting snapshots")
+        indexes = [
+            models.Index(fields=["department", "date"], name="snapshot_department_date_idx"),
+            models.Index(fields=["territory", "date"], name="snapshot_territory_date_idx"),
+        ]
+
+    department = models.ForeignKey(
+        'individuals.Department', null=True, blank=True, on_delete=models.CASCADE, related_name="+",
+    )
+    territory = models.ForeignKey(
+        'individuals.Territory', null=True, blank=True, on_delete=models.CASCADE, related_name="+",
+    )
+    date = models.DateField()
+
+    num_outplantings = models.PositiveIntegerField(default=0)
+    num_individuals = models.PositiveIntegerField(default=0)
+    num_species = models.PositiveIntegerField(default=0)
+    num_genera = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "%s %s: %s/%s/%s/%s" % (
+            self.department_id or self.territory_id, self.date,
+            self.num_outplantings, self.num_individuals, self.num_species, self.num_genera,
+        )
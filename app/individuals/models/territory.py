@@ -1,14 +1,24 @@
-from django.db import models, OperationalError
+import copy
+
+from django.db import models, transaction, OperationalError
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import ungettext_lazy as __
 from django.utils.safestring import mark_safe
 from django.urls import reverse
+from django.db.models.functions import Coalesce, Concat
+from django.db.models.signals import pre_delete, post_save, post_delete
+from django.dispatch import receiver
 from django import forms
 from picklefield.fields import PickledObjectField
 
 from ajax.autocomplete import AutoCompleteForm
 from config_tables.admin import configurable, Configurable
 import config_app
+from config_app.models import KeyValue
+from tools import generated_fields
+
+from ..calc import mark_dirty, count_tallies, tally_counters
+from .individual import Individual, bump_links_version
 
 
 
@@ -23,6 +33,11 @@ class CalcOutplantingsMixin(models.Model):
     class Meta:
         abstract = True
 
+    OUTPLANTING_COUNTER_FIELDS = (
+        "num_outplantings", "num_individuals", "num_species", "num_genera",
+        "num_outplantings_alive", "num_individuals_alive", "num_species_alive", "num_genera_alive",
+    )
+
     num_outplantings = models.IntegerField(verbose_name=_("# outplantings"), default=0, editable=False)
     num_individuals = models.IntegerField(verbose_name=_("# individuals"), default=0, editable=False)
     num_species = models.IntegerField(verbose_name=_("# species"), default=0, editable=False)
@@ -33,6 +48,9 @@ class CalcOutplantingsMixin(models.Model):
     num_species_alive = models.IntegerField(verbose_name=_("# species alive"), default=0, editable=False)
     num_genera_alive = models.IntegerField(verbose_name=_("# genera alive"), default=0, editable=False)
 
+    # name of the OutplantingTally foreign key, to be set by derived class
+    _tally_location = None
+
     def _get_outplanting_filter(self):
         """Get Django DB query for Outplanting objects.
         To be implemented by derived class"""
@@ -66,7 +84,42 @@ class CalcOutplantingsMixin(models.Model):
             self.num_genera_alive = locations_alive.values_list("individual__species__family__genus").distinct().count()
         if do_save:
             self.save()
-    
+
+    def rebuild_outplanting_tallies(self):
+        """Recounts the OutplantingTally rows and the counters from scratch"""
+        from .tally import OutplantingTally
+        with transaction.atomic():
+            # the same lock as the incremental updates, see calc._collect_tally_deltas()
+            list(type(self).objects.select_for_update().filter(pk=self.pk).values_list("pk", flat=True))
+            tallies = count_tallies(self.get_outplantings().values_list(
+                "individual", "individual__species", "individual__species__family__genus", "plant_died"
+            ))
+            location = {self._tally_location: self}
+            OutplantingTally.objects.filter(**location).delete()
+            OutplantingTally.objects.bulk_create([
+                OutplantingTally(kind=kind, key=key, alive=alive, count=count, **location)
+                for (kind, key, alive), count in tallies.items()
+            ])
+            counters = tally_counters(tallies)
+            type(self).objects.filter(pk=self.pk).update(**counters)
+        for name, value in counters.items():
+            setattr(self, name, value)
+
+    def verify_outplanting_fields(self):
+        """Returns a dict of counter name -> (stored, recounted) for all counters that are wrong"""
+        recounted = copy.copy(self)
+        recounted.calc_outplanting_fields(do_save=False)
+        return {
+            name: (getattr(self, name), getattr(recounted, name))
+            for name in self.OUTPLANTING_COUNTER_FIELDS
+            if getattr(self, name) != getattr(recounted, name)
+        }
+
+    def get_outplanting_snapshot(self, date):
+        """The living outplantings, individuals, species and genera at a day, see individuals/snapshots.py"""
+        from ..snapshots import get_snapshot
+        return get_snapshot(self, date)
+
     def num_outplantings_alive_percent(self):
         return _to_percent_deco(self.num_outplantings_alive, self.num_outplantings)
 
@@ -101,6 +154,7 @@ class Territory(CalcOutplantingsMixin, models.Model, Configurable):
     name_generated = models.CharField(max_length=70, verbose_name=_("display name"), default="", editable=False)
 
     _id_field = "name_generated"
+    _tally_location = "territory"
 
     def __str__(self):
         return self.name_generated
@@ -133,26 +187,20 @@ class Territory(CalcOutplantingsMixin, models.Model, Configurable):
     def save(self, *args, **kwargs):
         # update name_generated
         if hasattr(self, "name_generated"):
-            self.name_generated = "%s (%s)" % (self.code, self.name)
-
-        has_changed = False
-        if self.id:
-            try:
-                prev = Territory.objects.get(id=self.id)
-                if prev.code != self.code:
-                    has_changed = True
-            except Territory.DoesNotExist:
-                pass
-
+            self.name_generated = self.get_name()
+        # Department.full_code is updated through tools.generated_fields
         super(Territory, self).save(*args, **kwargs)
 
-        # update Department.full_code
-        if has_changed:
-            for d in Department.objects.filter(territory=self):
-                d.save()
+    def get_name(self):
+        return "%s (%s)" % (self.code, self.name)
 
+    @configurable
     def num_departments(self):
+        if hasattr(self, "num_departments_annotated"):
+            return self.num_departments_annotated
         return Department.objects.filter(territory=self).count()
+    num_departments.short_description = _("# departments")
+    num_departments.annotate = {"num_departments_annotated": models.Count("department")}
 
 
 class TerritoryForm(AutoCompleteForm(Territory)):
@@ -178,8 +226,7 @@ config_app.register_key(
     <dt>department</dt><dd>for the department code.</dd>
     </dl> 
     Any other string will be concatenated into the full code.<br> 
-    Note that changes affect only newly created departments. To change existing departments run<br> 
-    <b>./manage.py botgard_data_all</b>"""),
+    Existing departments are updated when the value is saved."""),
     _department_full_code_validator
 )
 
@@ -199,6 +246,8 @@ class Department(CalcOutplantingsMixin, models.Model, Configurable):
 
     full_code = models.CharField(max_length=30, default="", editable=False)
 
+    _tally_location = "department"
+
     def _get_outplanting_filter(self):
         return dict(department=self.pk)
 
@@ -227,14 +276,6 @@ class Department(CalcOutplantingsMixin, models.Model, Configurable):
     delete_link_decorator.short_description = _("delete")
     delete_link_decorator.exclude_csv = True
 
-    def _get_individuals(self):
-        """Returns all individuals that live in this Department"""
-        locations = self.get_outplantings()
-        indi_set = set()
-        for i in locations:
-            indi_set.add(i.individual)
-        return indi_set
-
     def _get_full_code(self):
         """Helper function to generate the full code for a department.
         The value is stored in DB in full_code field."""
@@ -250,6 +291,24 @@ class Department(CalcOutplantingsMixin, models.Model, Configurable):
                 ret += "%s" % v
         return ret
 
+    @staticmethod
+    def full_code_expression():
+        """The query expression of _get_full_code(), to update many departments at once"""
+        parts = []
+        for v in config_app.get_value("department_full_code"):
+            if v == "territory":
+                parts.append(Coalesce(
+                    models.Subquery(Territory.objects.filter(pk=models.OuterRef("territory")).order_by().values("code")),
+                    models.Value(""),
+                ))
+            elif v == "department":
+                parts.append(models.F("code"))
+            else:
+                parts.append(models.Value("%s" % v))
+        if len(parts) == 1:
+            return parts[0]
+        return Concat(*parts, output_field=models.CharField())
+
     def save(self, *args, **kwargs):
         # set full code
         self.full_code = self._get_full_code()
@@ -269,13 +328,74 @@ class Department(CalcOutplantingsMixin, models.Model, Configurable):
 
         # when department moved to another territory
         if prev_territory is not None and prev_territory != self.territory:
-            prev_territory.calc_outplanting_fields()
-            self.territory.calc_outplanting_fields()
+            mark_dirty(territories=(prev_territory.pk, self.territory_id))
 
-        # update Individual.living_outplantings
+        # update Individual.departments_generated
         if has_changed:
-            for i in self._get_individuals():
-                i.calc_outplantings()
+            mark_dirty(individuals=self.get_outplantings().values_list("individual", flat=True))
+
+
+@receiver(pre_delete, sender=Department)
+def on_department_delete(sender, instance, **kwargs):
+    # Outplanting.department is set to NULL without sending signals
+    mark_dirty(
+        territories=(instance.territory_id, ),
+        individuals=instance.get_outplantings().values_list("individual", flat=True),
+    )
+
+
+@receiver(post_save, sender=Department)
+def on_department_save(sender, instance, created, **kwargs):
+    # name and code are shown in the cached department links
+    if not created:
+        bump_links_version(Individual.objects.filter(outplanting__department=instance.pk))
+
+
+@receiver(post_save, sender=Territory)
+def on_territory_save(sender, instance, created, **kwargs):
+    if not created:
+        bump_links_version(Individual.objects.filter(outplanting__department__territory=instance.pk))
+
+
+@receiver(pre_delete, sender=Territory)
+def on_territory_delete(sender, instance, **kwargs):
+    # Department.territory is reset without sending signals
+    bump_links_version(Individual.objects.filter(outplanting__department__territory=instance.pk))
+
+
+def _on_full_code_change(department_pks):
+    from .outplanting import Outplanting
+    mark_dirty(individuals=Outplanting.objects.filter(
+        department__in=department_pks).values_list("individual", flat=True))
+
+
+generated_fields.register(
+    Territory, "name_generated", Territory.get_name,
+    depends_on=("code", "name"),
+)
+
+full_code_field = generated_fields.register(
+    Department, "full_code", Department._get_full_code,
+    depends_on=("code", "territory", "territory__code"),
+    on_change=_on_full_code_change,
+    expression=Department.full_code_expression,
+)
+
+
+def update_full_codes():
+    """
+    Regenerate Department.full_code of all departments with one UPDATE
+    and the departments of their individuals
+    :return: number of changed departments
+    """
+    return len(full_code_field.update(Department.objects.all()))
+
+
+@receiver(post_save, sender=KeyValue)
+@receiver(post_delete, sender=KeyValue)
+def on_full_code_config_change(sender, instance, raw=False, **kwargs):
+    if instance.key == "department_full_code" and not raw:
+        update_full_codes()
 
 
 class DepartmentForm(AutoCompleteForm(Department)):
@@ -1,6 +1,20 @@
+"""
+Allocation of accession and order numbers
+
+The "incremental" methods keep a low watermark per field in NumberSequence,
+so finding the next free number only looks at the numbers above it.
+Numbers handed out for imports and add forms are kept in NumberReservation
+until they are used, released or expire. The numbers of an add form are
+reserved per form token (`reserve_form_numbers()`), a form shown again with
+the same token keeps its numbers. Reserved numbers that are given back free
+the watermark again, so abandoned forms leave no gaps.
+"""
 import datetime
 import random
+import uuid
 
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 import config_app
@@ -41,72 +55,279 @@ config_app.register_key(
 )
 
 
-def _get_new_number(Model, fieldname, method):
+# numbers of reservations handed out by get_new_accession_number() and get_new_order_number()
+RESERVATION_TIMEOUT = datetime.timedelta(hours=2)
+
+# reservations of the numbers shown in an add form, see reserve_form_numbers()
+FORM_RESERVATION_TIMEOUT = datetime.timedelta(minutes=30)
+
+# number of used numbers fetched per query when looking for free ones
+_WINDOW_SIZE = 500
+
+_METHOD_KEYS = {
+    "accession_number": "accession_generation",
+    "order_number": "order_number_generation",
+}
+
+
+def _sequence_name(fieldname, method):
+    return "%s:%s:%s" % (fieldname, method["method"], method["min"])
+
+
+def _sequence_start(fieldname, method):
+    """The watermark of a new sequence"""
+    from individuals.models import Individual
+
+    start = method["min"]
+    if method["method"] == "incremental":
+        highest = Individual.objects.aggregate(highest=models.Max(fieldname))["highest"]
+        if highest is not None:
+            start = highest + 1
+    return start
+
+
+def _lock_sequence(fieldname, method):
+    """
+    Returns the NumberSequence of the field and method, locked until the end of the transaction.
+    A new sequence starts at the lowest candidate, free numbers are searched from there.
+    """
+    from individuals.models import NumberSequence
+
+    name = _sequence_name(fieldname, method)
+    sequence = NumberSequence.objects.select_for_update().filter(name=name).first()
+    if sequence is not None:
+        return sequence
+
+    try:
+        with transaction.atomic():
+            NumberSequence.objects.create(name=name, next_number=_sequence_start(fieldname, method))
+    except IntegrityError:
+        # created by a concurrent request
+        pass
+    return NumberSequence.objects.select_for_update().get(name=name)
+
+
+def _get_taken(fieldname, **lookup):
+    """Returns the set of numbers used by Individuals or reserved"""
+    from individuals.models import Individual, NumberReservation
+
+    taken = set(Individual.objects.filter(
+        **{"%s__%s" % (fieldname, key): value for key, value in lookup.items()}
+    ).values_list(fieldname, flat=True))
+    taken.update(NumberReservation.objects.filter(
+        name=fieldname, **{"number__%s" % key: value for key, value in lookup.items()}
+    ).values_list("number", flat=True))
+    return taken
+
+
+def _released_watermark(fieldname, method_name, numbers):
+    """
+    Returns the lowest of the given numbers that an incremental sequence may hand out
+    again after they were given back, None if there is none.
+    The "incremental" method only takes back numbers above all used ones.
+    """
+    from individuals.models import Individual
+
+    if not numbers or method_name not in ("incremental", "incremental_tight"):
+        return None
+    lowest = min(numbers)
+    if method_name == "incremental":
+        highest = Individual.objects.aggregate(highest=models.Max(fieldname))["highest"]
+        if highest is not None and highest > lowest:
+            return None
+    return lowest
+
+
+def _get_sequential_numbers(fieldname, method, start, count):
+    """
+    Take the next `count` free numbers from `start` on, the watermark of the sequence.
+    Every used number is skipped only once, then the watermark is past it.
+    """
+    numbers = []
+    candidate = max(start, method["min"])
+    while len(numbers) < count:
+        window = range(candidate, candidate + _WINDOW_SIZE)
+        taken = _get_taken(fieldname, gte=window.start, lt=window.stop)
+        for number in window:
+            if number not in taken:
+                numbers.append(number)
+                if len(numbers) == count:
+                    break
+        candidate = window.stop
+    return numbers
+
+
+def _get_random_numbers(fieldname, method, count):
+    """Draw `count` free numbers from the range, testing candidates in batches"""
+    start_time = datetime.datetime.now()
+    numbers = set()
+    while len(numbers) < count:
+        candidates = {
+            random.randint(method["min"], method["max"])
+            for i in range(min(_WINDOW_SIZE, max(32, 2 * (count - len(numbers)))))
+        } - numbers
+        free = sorted(candidates - _get_taken(fieldname, **{"in": candidates}))
+        numbers.update(free[:count - len(numbers)])
+
+        if len(numbers) < count and (datetime.datetime.now() - start_time).total_seconds() > 5:
+            raise RuntimeError(_('Could not find a free %s in time, sorry') % fieldname)
+
+    return sorted(numbers)
+
+
+def allocate_numbers(fieldname, count=1, reserve_for=None, token=""):
+    """
+    Returns a list of `count` free numbers for an Individual field.
+
+    Allocations are serialized by a row lock on the NumberSequence, so
+    concurrent requests never get the same number.
+
+    :param fieldname: "accession_number" or "order_number"
+    :param count: number of numbers, e.g. a whole block for an import
+    :param reserve_for: timedelta, store NumberReservations so the numbers are not handed out again
+                        before they expire. None if the numbers are saved in the same transaction.
+    :param token: stored with the reservations, see reserve_form_numbers()
+    """
+    from individuals.models import NumberReservation
+
+    method = config_app.get_value(_METHOD_KEYS[fieldname])
+    if method["method"] not in ("random_range", "incremental", "incremental_tight"):
+        raise ValueError("Unknown number generation method '%s'" % method["method"])
+
+    now = timezone.now()
+    with transaction.atomic():
+        sequence = _lock_sequence(fieldname, method)
+
+        # expired reservations are free again
+        expired = NumberReservation.objects.filter(name=fieldname, expires__lte=now)
+        lowest = _released_watermark(
+            fieldname, method["method"], list(expired.values_list("number", flat=True))
+        )
+        if lowest is not None and lowest < sequence.next_number:
+            sequence.next_number = lowest
+        expired.delete()
+
+        if method["method"] == "random_range":
+            numbers = _get_random_numbers(fieldname, method, count)
+        else:
+            numbers = _get_sequential_numbers(fieldname, method, sequence.next_number, count)
+            sequence.next_number = numbers[-1] + 1
+        sequence.save(update_fields=["next_number"])
+
+        if reserve_for is not None:
+            NumberReservation.objects.bulk_create([
+                NumberReservation(name=fieldname, number=number, expires=now + reserve_for, token=token)
+                for number in numbers
+            ])
+
+    return numbers
+
+
+def suggest_number(fieldname):
+    """
+    Returns a free number, without reserving it or moving the watermark,
+    e.g. for the message of a form with a used number
+
+    :param fieldname: "accession_number" or "order_number"
+    """
+    from individuals.models import NumberSequence
+
+    method = config_app.get_value(_METHOD_KEYS[fieldname])
     if method["method"] == "random_range":
-        start_time = datetime.datetime.now()
+        return _get_random_numbers(fieldname, method, 1)[0]
+
+    start = NumberSequence.objects.filter(
+        name=_sequence_name(fieldname, method)
+    ).values_list("next_number", flat=True).first()
+    if start is None:
+        start = _sequence_start(fieldname, method)
+    return _get_sequential_numbers(fieldname, method, start, 1)[0]
 
-        while True:
-            # let's get a candidate for a new accession number
-            candidate = random.randint(method["min"], method["max"])
 
-            # make sure there is no individual with that accession number
-            if not Model.objects.filter(**{fieldname: candidate}).exists():
-                return candidate
+def reserve_numbers(fieldname, count, reserve_for=datetime.timedelta(days=1)):
+    """
+    Atomically reserve a block of numbers, e.g. for an import
+    :return: list of numbers
+    """
+    return allocate_numbers(fieldname, count, reserve_for=reserve_for)
 
-            if (datetime.datetime.now() - start_time).total_seconds() > 5:
-                return None
 
-    # fast version - will pick the highest + 1
-    elif method["method"] == "incremental":
+def release_numbers(fieldname, numbers):
+    """Give unused reserved numbers back"""
+    from individuals.models import NumberSequence, NumberReservation
+    numbers = list(numbers)
+    NumberReservation.objects.filter(name=fieldname, number__in=numbers).delete()
+    for method_name in ("incremental", "incremental_tight"):
+        lowest = _released_watermark(fieldname, method_name, numbers)
+        if lowest is not None:
+            NumberSequence.objects.filter(
+                name__startswith="%s:%s:" % (fieldname, method_name), next_number__gt=lowest,
+            ).update(next_number=lowest)
 
-        qset = Model.objects.all()
-        if not qset.exists():
-            return method["min"]
 
-        return getattr(qset.order_by("-%s" % fieldname)[0], fieldname) + 1
+def reserve_form_numbers(token=None, reserve_for=FORM_RESERVATION_TIMEOUT):
+    """
+    Reserves an accession and an order number for an add form, concurrent forms
+    get different numbers. A form shown again with the same token keeps its
+    numbers and extends the reservations. They are removed when the Individual
+    is saved (`release_form_numbers()`) or handed out again after they expired.
+    :param token: of a form shown before, None for a new form
+    :return: tuple of (token, dict of fieldname -> number)
+    """
+    from individuals.models import NumberReservation
 
-    # slow version - will also pick free numbers in between
-    elif method["method"] == "incremental_tight":
+    now = timezone.now()
+    if token:
+        reserved = NumberReservation.objects.filter(token=token, expires__gt=now)
+        numbers = dict(reserved.values_list("name", "number"))
+        if set(numbers) == set(_METHOD_KEYS):
+            reserved.update(expires=now + reserve_for)
+            return token, numbers
+        release_form_numbers(token)
 
-        qset = Model.objects.all()
-        if not qset.exists():
-            return method["min"]
+    token = uuid.uuid4().hex
+    numbers = {
+        fieldname: allocate_numbers(fieldname, reserve_for=reserve_for, token=token)[0]
+        for fieldname in _METHOD_KEYS
+    }
+    return token, numbers
 
-        qset = qset.filter(**{"%s__gte" % fieldname: method["min"]})
-        if not qset.exists():
-            return method["min"]
-        nums = sorted(qset.values_list(fieldname, flat=True))
-        prev = nums[0]
-        for n in nums:
-            if n > prev+1:
-                return prev+1
-            prev = n
-        return nums[-1] + 1
 
+def release_form_numbers(token, used=None):
+    """
+    Gives the numbers reserved for a form back
+    :param used: dict of fieldname -> number, kept until the Individual is saved, see use_numbers()
+    """
+    from individuals.models import NumberReservation
 
-    raise ValueError("Unknown number generation method '%s'" % method["method"])
+    if not token:
+        return
+    used = used or {}
+    reserved = list(NumberReservation.objects.filter(token=token).values_list("name", "number"))
+    for fieldname in _METHOD_KEYS:
+        numbers = [number for name, number in reserved if name == fieldname and used.get(name) != number]
+        if numbers:
+            release_numbers(fieldname, numbers)
 
 
-def get_new_accession_number():
+def use_numbers(individual):
+    """Removes the reservations of the numbers of a saved Individual"""
+    from individuals.models import NumberReservation
+    NumberReservation.objects.filter(
+        models.Q(name="accession_number", number=individual.accession_number)
+        | models.Q(name="order_number", number=individual.order_number)
+    ).delete()
+
+
+def get_new_accession_number(reserve_for=RESERVATION_TIMEOUT):
     '''
     get an available accession_number for new individuals
     '''
-    from individuals.models import Individual
-    method = config_app.get_value('accession_generation')
-    num = _get_new_number(Individual, "accession_number", method)
-    if num is None:
-        raise RuntimeError(_('Could not find a free accession_number in time, sorry'))
-    return num
+    return allocate_numbers("accession_number", reserve_for=reserve_for)[0]
 
 
-def get_new_order_number():
+def get_new_order_number(reserve_for=RESERVATION_TIMEOUT):
     '''
     get an available order_number for seeds of new individuals
     '''
-    from individuals.models import Individual
-    method = config_app.get_value('order_number_generation')
-    num = _get_new_number(Individual, "order_number", method)
-    if num is None:
-        raise RuntimeError(_('Could not find a free order_number in time, sorry'))
-    return num
-
+    return allocate_numbers("order_number", reserve_for=reserve_for)[0]
@@ -0,0 +1,276 @@
+"""
+Point-in-time statistics of Departments and Territories
+
+For each location, an OutplantingSnapshot row stores the living outplantings,
+individuals, species and genera from its date on. A row is only written
+on days when one of these counts changes. The counts of any day are then
+read from the latest row on or before that day with an index lookup:
+
+    get_snapshot(territory, datetime.date(2020, 1, 1))
+
+An outplanting lives from its bed out date (or sowing date) until the day
+before `plant_died`. Outplantings without dates count from the start.
+
+When outplantings change, the difference they make is added to the stored
+series of their locations from the first changed day on, see
+apply_outplanting_changes(). Only the outplantings of the same genera are
+read for that, the counts of the other genera stay the same. Locations
+whose taxa or territory changed are rebuilt from all their outplantings,
+see calc.flush_outplanting_recalc(). Run
+
+    ./manage.py botgard_outplanting_snapshots
+
+for a full rebuild.
+"""
+import bisect
+import datetime
+from collections import Counter
+
+from django.db import models, transaction
+
+from .calc import _taxon_keys
+
+
+# date of the counts of outplantings without bed out and sowing date
+START_DATE = datetime.date.min
+
+# tally kind -> counter name
+SNAPSHOT_COUNTERS = {"o": "num_outplantings", "i": "num_individuals", "s": "num_species", "g": "num_genera"}
+
+# values_list of Outplanting for snapshot_series()
+SNAPSHOT_ROW_FIELDS = ("individual", "individual__species", "individual__species__family__genus",
+                       "date", "seeded_date", "plant_died")
+
+
+def snapshot_series(rows):
+    """
+    Sweeps over the planting and dying dates of one location
+    :param rows: iterable of (individual pk, species pk, genus, date, seeded_date, plant_died)
+    :return: list of (date, dict of counter name -> value), one entry per change
+    """
+    events = {}
+    for individual, species, genus, date, seeded_date, plant_died in rows:
+        start = date or seeded_date or START_DATE
+        if plant_died is not None and plant_died <= start:
+            continue
+        keys = list(_taxon_keys(individual, species, genus))
+        events.setdefault(start, []).append((keys, 1))
+        if plant_died is not None:
+            events.setdefault(plant_died, []).append((keys, -1))
+
+    series = []
+    tallies = Counter()
+    previous = None
+    for date in sorted(events):
+        for keys, delta in events[date]:
+            for key in keys:
+                tallies[key] += delta
+        counts = dict.fromkeys(SNAPSHOT_COUNTERS.values(), 0)
+        for (kind, key), count in tallies.items():
+            if count > 0:
+                counts[SNAPSHOT_COUNTERS[kind]] += count if kind == "o" else 1
+        if counts != previous:
+            series.append((date, counts))
+            previous = counts
+    return series
+
+
+def _series_at(series, dates, date, default=None):
+    """The counts of a series on a day, `dates` are the dates of the series"""
+    i = bisect.bisect_right(dates, date) - 1
+    if i >= 0:
+        return series[i][1]
+    return default or dict.fromkeys(SNAPSHOT_COUNTERS.values(), 0)
+
+
+def _update_series(field, pk, old_rows, new_rows):
+    """
+    Adds the difference between the series of `new_rows` and `old_rows` to the stored series of a location
+    :return: number of written rows, None if the stored series does not match and must be rebuilt
+    """
+    from .models import OutplantingSnapshot
+
+    old, new = snapshot_series(old_rows), snapshot_series(new_rows)
+    old_dates, new_dates = [date for date, counts in old], [date for date, counts in new]
+    changes = sorted(set(old_dates) | set(new_dates))
+    changed = [
+        date for date in changes
+        if _series_at(old, old_dates, date) != _series_at(new, new_dates, date)
+    ]
+    if not changed:
+        return 0
+    start = changed[0]
+
+    counters = list(SNAPSHOT_COUNTERS.values())
+    location = {field: pk}
+    previous = OutplantingSnapshot.objects.filter(**location, date__lt=start).order_by("-date").values(
+        *counters).first() or dict.fromkeys(counters, 0)
+    stored = [
+        (row.pop("date"), row)
+        for row in OutplantingSnapshot.objects.filter(**location, date__gte=start).order_by("date").values(
+            "date", *counters)
+    ]
+    stored_dates = [date for date, counts in stored]
+
+    series = []
+    for date in sorted(set(stored_dates) | {date for date in changes if date >= start}):
+        stored_counts = _series_at(stored, stored_dates, date, previous)
+        old_counts, new_counts = _series_at(old, old_dates, date), _series_at(new, new_dates, date)
+        counts = {name: stored_counts[name] + new_counts[name] - old_counts[name] for name in counters}
+        if any(value < 0 for value in counts.values()):
+            return None
+        if counts != (series[-1][1] if series else previous):
+            series.append((date, counts))
+
+    with transaction.atomic():
+        OutplantingSnapshot.objects.filter(**location, date__gte=start).delete()
+        OutplantingSnapshot.objects.bulk_create([
+            OutplantingSnapshot(date=date, **{"%s_id" % field: pk}, **counts) for date, counts in series
+        ])
+    return len(series)
+
+
+def apply_outplanting_changes(changes, skip_departments=(), skip_territories=()):
+    """
+    Updates the snapshot series of the locations of changed outplantings
+    from the first changed day on
+    :param changes: dict of Outplanting pk -> its stored (department, individual, date, seeded_date, plant_died)
+                    before the change, None for new outplantings
+    :param skip_departments: Department pks that are rebuilt anyway
+    :param skip_territories: Territory pks that are rebuilt anyway
+    :return: set of (location field, pk) whose series must be rebuilt
+    """
+    from .models import Individual, Department, Outplanting
+
+    current = {
+        row[0]: row[1:] for row in Outplanting.objects.filter(pk__in=list(changes)).values_list(
+            "pk", "department", "individual", "date", "seeded_date", "plant_died",
+        )
+    }
+    # pk -> (old state, new state), the unchanged ones of rolled back transactions are dropped
+    states = {
+        pk: (old, current.get(pk)) for pk, old in changes.items()
+        if old != current.get(pk)
+    }
+    if not states:
+        return set()
+    department_pks = {state[0] for pair in states.values() for state in pair if state}
+    territory_of = dict(Department.objects.filter(pk__in=department_pks).values_list("pk", "territory"))
+    taxa = {
+        pk: (species, genus) for pk, species, genus in Individual.objects.filter(
+            pk__in={state[1] for pair in states.values() for state in pair if state}
+        ).values_list("pk", "species", "species__family__genus")
+    }
+
+    def locations(state):
+        if state is None or state[0] not in territory_of or state[1] not in taxa:
+            return []
+        ret = [("department", state[0])]
+        if territory_of[state[0]] is not None:
+            ret.append(("territory", territory_of[state[0]]))
+        return [location for location in ret if location[1] not in (
+            skip_departments if location[0] == "department" else skip_territories
+        )]
+
+    def row(state):
+        department, individual, date, seeded_date, plant_died = state
+        return (individual, ) + taxa[individual] + (date, seeded_date, plant_died)
+
+    # location -> changed genera, old rows of the changed outplantings
+    genera, old_rows = {}, {}
+    for pk, (old, new) in states.items():
+        for state in (old, new):
+            for location in locations(state):
+                genera.setdefault(location, set()).add(taxa[state[1]][1])
+        for location in locations(old):
+            old_rows.setdefault(location, []).append(row(old))
+    if not genera:
+        return set()
+
+    # the current outplantings of the changed genera
+    all_genera = set().union(*genera.values())
+    genus_filter = models.Q(individual__species__family__genus__in=all_genera - {None})
+    if None in all_genera:
+        genus_filter |= models.Q(individual__species__family__genus__isnull=True)
+    qset = Outplanting.objects.filter(
+        models.Q(department__in=[pk for field, pk in genera if field == "department"])
+        | models.Q(department__territory__in=[pk for field, pk in genera if field == "territory"])
+    ).filter(genus_filter).values_list("pk", "department", "department__territory", *SNAPSHOT_ROW_FIELDS)
+    new_rows = {location: [] for location in genera}
+    for pk, department, territory, *row_values in qset.iterator():
+        for location in (("department", department), ("territory", territory)):
+            if location in genera and row_values[2] in genera[location]:
+                new_rows[location].append((pk, tuple(row_values)))
+
+    rebuild = set()
+    for location in genera:
+        rows = [row_values for pk, row_values in new_rows[location]]
+        # the location before the changes
+        unchanged = [row_values for pk, row_values in new_rows[location] if pk not in states]
+        if _update_series(*location, unchanged + old_rows.get(location, []), rows) is None:
+            rebuild.add(location)
+    return rebuild
+
+
+def rebuild_snapshots(departments=(), territories=()):
+    """
+    Rewrites the snapshot series of the given locations,
+    their outplantings are read with one query
+    :param departments: iterable of Department pks
+    :param territories: iterable of Territory pks
+    :return: number of written rows
+    """
+    from .models import Outplanting, OutplantingSnapshot
+
+    departments = {pk for pk in departments if pk is not None}
+    territories = {pk for pk in territories if pk is not None}
+    if not departments and not territories:
+        return 0
+
+    rows = {("department", pk): [] for pk in departments}
+    rows.update({("territory", pk): [] for pk in territories})
+    qset = Outplanting.objects.filter(
+        models.Q(department__in=departments) | models.Q(department__territory__in=territories)
+    ).values_list("department", "department__territory", *SNAPSHOT_ROW_FIELDS)
+    for department, territory, *row in qset.iterator():
+        for location in (("department", department), ("territory", territory)):
+            if location in rows:
+                rows[location].append(row)
+
+    snapshots = [
+        OutplantingSnapshot(date=date, **{"%s_id" % field: pk}, **counts)
+        for (field, pk), location_rows in rows.items()
+        for date, counts in snapshot_series(location_rows)
+    ]
+    with transaction.atomic():
+        OutplantingSnapshot.objects.filter(
+            models.Q(department__in=departments) | models.Q(territory__in=territories)
+        ).delete()
+        OutplantingSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
+
+
+def rebuild_all_snapshots():
+    """Rewrites the snapshots of all locations, returns the number of written rows"""
+    from .models import Department, Territory, OutplantingSnapshot
+
+    OutplantingSnapshot.objects.all().delete()
+    return rebuild_snapshots(
+        departments=Department.objects.values_list("pk", flat=True),
+        territories=Territory.objects.values_list("pk", flat=True),
+    )
+
+
+def get_snapshot(location, date):
+    """
+    The living outplantings, individuals, species and genera of a location at a day
+    :param location: Department or Territory instance
+    :return: dict of counter name -> value
+    """
+    from .models import Territory, OutplantingSnapshot
+
+    field = "territory" if isinstance(location, Territory) else "department"
+    snapshot = OutplantingSnapshot.objects.filter(
+        **{field: location.pk, "date__lte": date}
+    ).order_by("-date").values(*SNAPSHOT_COUNTERS.values()).first()
+    return snapshot or dict.fromkeys(SNAPSHOT_COUNTERS.values(), 0)
@@ -0,0 +1,184 @@
+"""
+Backends for the outplanting statistics of Territory and Department
+
+"columns"
+    The num_* columns of CalcOutplantingsMixin, maintained incrementally
+    through OutplantingTally (see individuals/calc.py). Works on all databases.
+
+"matview"
+    A PostgreSQL materialized view with all counters per department and
+    territory, refreshed with REFRESH MATERIALIZED VIEW CONCURRENTLY
+    (settings.OUTPLANTING_STATS_REFRESH):
+
+        "debounce"  in a background thread, at most once per
+                    OUTPLANTING_STATS_REFRESH_DELAY seconds and process
+        "commit"    after each commit, in the request
+        "schedule"  only by ./manage.py botgard_refresh_outplanting_stats
+
+    The num_* columns are not maintained, changes made meanwhile are recorded
+    with a shared version token. After switching back to "columns" the
+    columns and tallies of all locations are rebuilt once, with the first
+    outplanting change or statistics changelist.
+    Falls back to "columns" on other databases.
+
+Select the backend with settings.OUTPLANTING_STATS_BACKEND.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models.functions import Cast, Coalesce, Concat
+
+from config_app.versions import get_versions, bump_version
+
+
+VIEW_NAME = "individuals_outplantingstats"
+
+_COUNTERS_SQL = """
+    COUNT(*) AS num_outplantings,
+    COUNT(DISTINCT o.individual_id) AS num_individuals,
+    COUNT(DISTINCT i.species_id) AS num_species,
+    COUNT(DISTINCT f.genus) AS num_genera,
+    COUNT(*) FILTER (WHERE o.plant_died IS NULL) AS num_outplantings_alive,
+    COUNT(DISTINCT o.individual_id) FILTER (WHERE o.plant_died IS NULL) AS num_individuals_alive,
+    COUNT(DISTINCT i.species_id) FILTER (WHERE o.plant_died IS NULL) AS num_species_alive,
+    COUNT(DISTINCT f.genus) FILTER (WHERE o.plant_died IS NULL) AS num_genera_alive
+"""
+
+_JOIN_SQL = """
+    FROM individuals_outplanting o
+    INNER JOIN individuals_department d ON d.id = o.department_id
+    INNER JOIN individuals_individual i ON i.id = o.individual_id
+    INNER JOIN species_species s ON s.id = i.species_id
+    INNER JOIN species_family f ON f.id = s.family_id
+"""
+
+CREATE_VIEW_SQL = [
+    """
+    CREATE MATERIALIZED VIEW %(view)s AS
+    SELECT 'd' || o.department_id AS id, %(counters)s %(join)s
+    GROUP BY o.department_id
+    UNION ALL
+    SELECT 't' || d.territory_id AS id, %(counters)s %(join)s
+    WHERE d.territory_id IS NOT NULL
+    GROUP BY d.territory_id
+    """ % {"view": VIEW_NAME, "counters": _COUNTERS_SQL, "join": _JOIN_SQL},
+    # a unique index is required for REFRESH ... CONCURRENTLY
+    "CREATE UNIQUE INDEX %(view)s_id ON %(view)s (id)" % {"view": VIEW_NAME},
+]
+
+DROP_VIEW_SQL = ["DROP MATERIALIZED VIEW IF EXISTS %s" % VIEW_NAME]
+
+# tokens of the last outplanting change the num_* columns missed and of their last rebuild
+COLUMNS_STALE_VERSION = "outplanting-stats:columns-stale"
+COLUMNS_REBUILT_VERSION = "outplanting-stats:columns-rebuilt"
+
+_refresh_lock = threading.Lock()
+_refresh_timer = None
+
+
+def use_matview():
+    """True if the statistics are read from the materialized view"""
+    return (
+        getattr(settings, "OUTPLANTING_STATS_BACKEND", "columns") == "matview"
+        and connection.vendor == "postgresql"
+    )
+
+
+def refresh_outplanting_stats(concurrently=True):
+    """Refresh the materialized view, does not block readers when `concurrently`"""
+    with connection.cursor() as cursor:
+        cursor.execute("REFRESH MATERIALIZED VIEW %s%s" % ("CONCURRENTLY " if concurrently else "", VIEW_NAME))
+
+
+def _delayed_refresh():
+    global _refresh_timer
+    with _refresh_lock:
+        _refresh_timer = None
+    try:
+        refresh_outplanting_stats()
+    finally:
+        # the connection of the timer thread
+        connection.close()
+
+
+def schedule_refresh():
+    """Refresh the materialized view after outplanting changes, see settings.OUTPLANTING_STATS_REFRESH"""
+    global _refresh_timer
+    mode = getattr(settings, "OUTPLANTING_STATS_REFRESH", "debounce")
+    if mode == "commit":
+        refresh_outplanting_stats()
+    elif mode == "debounce":
+        with _refresh_lock:
+            # the pending refresh includes all changes committed until it runs
+            if _refresh_timer is None:
+                _refresh_timer = threading.Timer(settings.OUTPLANTING_STATS_REFRESH_DELAY, _delayed_refresh)
+                _refresh_timer.daemon = True
+                _refresh_timer.start()
+
+
+def mark_columns_stale():
+    """Record that outplantings changed while the num_* columns were not maintained"""
+    bump_version(COLUMNS_STALE_VERSION)
+
+
+def mark_columns_rebuilt():
+    bump_version(COLUMNS_REBUILT_VERSION)
+
+
+def columns_stale():
+    """True if outplantings changed with the "matview" backend since the num_* columns were rebuilt"""
+    versions = get_versions((COLUMNS_STALE_VERSION, COLUMNS_REBUILT_VERSION))
+    return versions[COLUMNS_STALE_VERSION] > versions[COLUMNS_REBUILT_VERSION]
+
+
+def rebuild_columns():
+    """Recount the tallies and num_* columns of all Territories and Departments"""
+    from .models import Territory, Department
+    for model in (Territory, Department):
+        for location in model.objects.all():
+            location.rebuild_outplanting_tallies()
+    mark_columns_rebuilt()
+
+
+def ensure_columns_current():
+    """
+    Rebuild the num_* columns once after switching back from the "matview" backend
+    :return: True if they were rebuilt
+    """
+    if use_matview() or not columns_stale():
+        return False
+    rebuild_columns()
+    return True
+
+
+def _view_id(model):
+    return "d" if model._tally_location == "department" else "t"
+
+
+def stats_annotations(model):
+    """
+    Returns the QuerySet.annotate() kwargs that read the counters of
+    each Territory or Department row from the view as `stats_<counter>`
+    """
+    from .models import OutplantingStats
+    from .models.territory import CalcOutplantingsMixin
+    stats = OutplantingStats.objects.filter(
+        pk=Concat(models.Value(_view_id(model)), Cast(models.OuterRef("pk"), models.CharField()))
+    )
+    return {
+        "stats_%s" % name: Coalesce(models.Subquery(stats.values(name)[:1]), 0)
+        for name in CalcOutplantingsMixin.OUTPLANTING_COUNTER_FIELDS
+    }
+
+
+def apply_stats(locations):
+    """
+    Replace the num_* values of Territory or Department instances
+    by the annotated view values. Does nothing for the "columns" backend.
+    """
+    from .models.territory import CalcOutplantingsMixin
+    for location in locations:
+        for name in CalcOutplantingsMixin.OUTPLANTING_COUNTER_FIELDS:
+            if hasattr(location, "stats_%s" % name):
+                setattr(location, name, getattr(location, "stats_%s" % name))
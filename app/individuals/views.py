@@ -1,4 +1,6 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import loader
+from django.utils.html import escape
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.shortcuts import render
@@ -9,7 +11,9 @@ from tools.permissions import *
 # from tools.countries import get_iso_country_by_id
 from tools.pdf import create_pdf_response
 from tools.admin_extensions import minimal_admin_context
-from tools.csv_response import csv_response
+from tools.csv_response import csv_streaming_response
+
+from .checklists import CHECKLIST_FIELDS, checklist_outplantings, accession_number
 
 
 def unescape(x):
@@ -29,30 +33,37 @@ def _table_row(row):
     return '<tr>%s</tr>' % markup
 
 
+# number of rows fetched and sent at once
+_CHECKLIST_CHUNK_SIZE = 500
+
+_CHECKLIST_ROWS_MARKER = "<!-- checklist rows -->"
+
+
+def _checklist_rows(outplantings_list):
+    """Yields the values of CHECKLIST_FIELDS, without loading model instances"""
+    return outplantings_list.values_list(*CHECKLIST_FIELDS).iterator(chunk_size=_CHECKLIST_CHUNK_SIZE)
+
+
 def _checklist_view(request, Model, forId, outplantings_list):
     """
-    Unified individuals checklist view for Departments and Territories
+    Unified individuals checklist view for Departments and Territories.
+    The rows are read from a values projection and streamed to the client,
+    so the memory use does not grow with the size of the list.
     :param request: Django request object
     :param Model: Department | Territory
     :param forId: pk of Department or Territory
     :param outplantings_list: Django QuerySet of corresponsing Outplantings
-    :return: HttpResponse
+    :return: StreamingHttpResponse
     """
 
-    outplantings_list = outplantings_list.order_by(
-        "individual__species__family__family",
-        "individual__species__family__genus",
-        "individual__species__species",
-    )
-
-    result_len = outplantings_list.count()
+    outplantings_list = checklist_outplantings(outplantings_list)
 
     if Model is Department:
-        department = Model.objects.get(id=forId)
+        department = Model.objects.select_related("territory").get(id=forId)
         territory = department.territory
         instance = department
         location_name = "%(terr)s-%(dep)s (%(code)s)" % {
-            "terr": territory.name,
+            "terr": territory.name if territory else "-",
             "dep": department.name,
             "code": department.code,
         }
@@ -76,56 +87,69 @@ def _checklist_view(request, Model, forId, outplantings_list):
             _("Planted"),
             _("Died?"),
         )
-        rows = [("%s" % o.department.full_code,
-                 "%s" % o.individual.accession_number + (("-%s" % o.individual.accession_extension) if o.individual.accession_extension else ""),
-                 "%s %s" % (o.individual.species.family.family, o.individual.species.full_name()),
-                 "%s" % o.date if o.date else "",
-                 "%s" % o.plant_died if o.plant_died else "",
-                ) for o in outplantings_list]
+        rows = (
+            (
+                "%s" % full_code,
+                accession_number(number, extension),
+                "%s %s" % (family, species),
+                "%s" % date if date else "",
+                "%s" % plant_died if plant_died else "",
+            )
+            for full_code, pk, number, extension, family, species, date, plant_died
+            in _checklist_rows(outplantings_list)
+        )
         import re
         code_part = re.sub(r" |_|\(|\)", "-", location_code)
-        return csv_response("%s-%s.csv" % (Model._meta.verbose_name, code_part), headers, rows)
+        return csv_streaming_response("%s-%s.csv" % (Model._meta.verbose_name, code_part), headers, rows)
+
+    result_len = outplantings_list.count()
 
     headers = _table_row(["", _("Nr."), _("Species"), _("Planted"), _("Died?"), _("Comment")])
-    rows = []
-    for i, outpl in enumerate(outplantings_list):
-        rows.append(_table_row([
-            outpl.department.full_code,
-            "%s" % outpl.individual.accession_number + (("-%s" % outpl.individual.accession_extension) if outpl.individual.accession_extension else ""),
-            '<a href="%s">%s</a>' % (
-                reverse("admin:individuals_individual_change", args=(outpl.individual.pk,)),
-                '%s %s' %(outpl.individual.species.family.family, outpl.individual.species.full_name())
-            ),
-            "%s" % outpl.date if outpl.date else "",
-            '<div class="checkbox %s"></div>' % ("checkbox_checked" if outpl.plant_died else ""),
-            '',
-        ]))
 
     ctx = minimal_admin_context(request, Model,
         title=_("Inventory list") + " %s - %s" % (location_name, timezone.now().date()),
         extra={
             "headers": headers,
-            "rows": "\n".join(rows),
+            "rows": _CHECKLIST_ROWS_MARKER,
             'territory': instance,
             'result_len': result_len,
         }
     )
-    return render(request, 'individuals/checklist.html', ctx)
+    # the page is rendered once with a marker where the rows are streamed in
+    head, tail = loader.render_to_string('individuals/checklist.html', ctx, request).split(_CHECKLIST_ROWS_MARKER)
+
+    def _html():
+        # reverse() once, the admin change url only differs in the pk
+        url_prefix, url_suffix = reverse("admin:individuals_individual_change", args=("__pk__",)).split("__pk__")
+        yield head
+        chunk = []
+        for full_code, pk, number, extension, family, species, date, plant_died in _checklist_rows(outplantings_list):
+            chunk.append(_table_row([
+                escape(full_code or ""),
+                escape(accession_number(number, extension)),
+                '<a href="%s">%s %s</a>' % (url_prefix + str(pk) + url_suffix, escape(family), escape(species)),
+                "%s" % date if date else "",
+                '<div class="checkbox %s"></div>' % ("checkbox_checked" if plant_died else ""),
+                '',
+            ]))
+            if len(chunk) >= _CHECKLIST_CHUNK_SIZE:
+                yield "\n".join(chunk)
+                chunk = []
+        yield "\n".join(chunk)
+        yield tail
+
+    return StreamingHttpResponse(_html())
 
 
 @login_required
 def checklist_territory(request, forId):
     qset = Outplanting.objects.filter(department__territory=forId)
-    qset = qset.filter(plant_died=None) | qset.filter(individual__seed_available=True)
-
     return _checklist_view(request, Territory, forId, qset)
 
 
 @login_required
 def checklist_department(request, forId):
     qset = Outplanting.objects.filter(department=forId)
-    qset = qset.filter(plant_died=None) | qset.filter(individual__seed_available=True)
-
     return _checklist_view(request, Department, forId, qset)
 
 
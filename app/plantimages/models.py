@@ -1,7 +1,12 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction, connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import ugettext  as __
 
+from tools.postpone import postpone
+
 
 class PlantImage(models.Model):
     class Meta:
@@ -15,3 +20,74 @@ class PlantImage(models.Model):
         if self.image:
             return self.image.name.split('/')[-1]
         return __('no image')
+
+
+def first_image_values(image, generate=True):
+    """
+    The values of Individual.first_image_generated for a PlantImage
+    :param generate: create the 'preview' thumbnail if it does not exist,
+        otherwise only an existing thumbnail is used
+    """
+    from easy_thumbnails.files import get_thumbnailer
+    from easy_thumbnails.alias import aliases
+    from easy_thumbnails.exceptions import InvalidImageFormatError
+
+    values = {"pk": image.pk, "image": image.image.name, "comment": image.comment, "thumbnail": ""}
+    try:
+        thumbnail = get_thumbnailer(image.image).get_thumbnail(aliases.get("preview"), generate=generate)
+    except (InvalidImageFormatError, ValueError, OSError):
+        thumbnail = None
+    if thumbnail:
+        values["thumbnail"] = thumbnail.name
+    return values
+
+
+def update_first_image(individual_pk, generate=False):
+    """
+    Store the first image of an Individual in Individual.first_image_generated
+    :param generate: decode the image and create the thumbnail, see first_image_values()
+    """
+    from individuals.models import Individual
+
+    image = PlantImage.objects.filter(individual=individual_pk).exclude(image="").order_by("pk").first()
+    values = first_image_values(image, generate) if image else {}
+    Individual.objects.filter(pk=individual_pk).update(first_image_generated=values)
+    return values
+
+
+def calc_first_images(generate=True):
+    """Update Individual.first_image_generated of all Individuals with images"""
+    from individuals.models import Individual
+
+    individuals = set(PlantImage.objects.values_list("individual", flat=True).distinct())
+    individuals |= set(Individual.objects.exclude(first_image_generated={}).values_list("pk", flat=True))
+    for pk in individuals:
+        update_first_image(pk, generate)
+    return len(individuals)
+
+
+@postpone
+def _generate_thumbnail(individual_pk):
+    try:
+        update_first_image(individual_pk, generate=True)
+    finally:
+        connection.close()
+
+
+def _image_changed(individual_pk):
+    # a quick update in the request, then the thumbnail in a worker thread
+    values = update_first_image(individual_pk)
+    if values and not values["thumbnail"]:
+        if settings.THUMBNAILS_BACKGROUND:
+            _generate_thumbnail(individual_pk)
+        else:
+            update_first_image(individual_pk, generate=True)
+
+
+@receiver(post_save, sender=PlantImage)
+@receiver(post_delete, sender=PlantImage)
+def _update_first_image(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    individual_pk = instance.individual_id
+    transaction.on_commit(lambda: _image_changed(individual_pk))
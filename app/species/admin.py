@@ -1,12 +1,33 @@
 from .models import *
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.urls import reverse
+from django.utils.html import format_html
 from config_tables.admin import ConfigurableTable, configurable, ForeignKeyFilter
 from django.utils.translation import gettext_lazy as _
 
 from tools import readOnlyAdmin
+from tools.search import SearchTextAdminMixin
 
 
-class FamilyAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
+class PropagationJobMessageMixin:
+    """Tells the user when the names of dependent entries are updated in the background"""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        job = obj.__dict__.pop("_generated_job", None)
+        if job is not None:
+            self.message_user(
+                request,
+                format_html(
+                    _('The names of dependent entries are updated in the background, see <a href="{}">{}</a>'),
+                    reverse("admin:botman_propagationjob_change", args=(job.pk,)),
+                    _("progress"),
+                ),
+                messages.INFO,
+            )
+
+
+class FamilyAdmin(PropagationJobMessageMixin, readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
     form = FamilyForm
     list_display = ('change_link_decorator', 'family', 'genus', 'genus_author', 'subfamily', 'tribus', 'subtribus',
                     'delete_link_decorator')
@@ -29,7 +50,7 @@ class FamilyAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
 
 
 
-class SpeciesAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
+class SpeciesAdmin(SearchTextAdminMixin, PropagationJobMessageMixin, readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
     form = SpeciesForm
     list_display = (
     'change_link_decorator', #'full_name_generated', '__str__',
@@ -39,14 +60,14 @@ class SpeciesAdmin(readOnlyAdmin.ReadPermissionModelAdmin, ConfigurableTable):
     'area_of_distribution_etikettxt',
     'search_individuals_link_decorator', 'search_seeds_link_decorator', 'availability_decorator',
     'delete_link_decorator')
-    blacklist = ("id", "__str__")
+    blacklist = ("id", "__str__", "search_text_generated", "search_vector_generated")
     list_filter = (#'nomenclature_checked', 'poisonous_plant',
                    ('family__full_name_generated', ForeignKeyFilter),
                    ('family__family', ForeignKeyFilter),
                    ('family__genus', ForeignKeyFilter),
                    )
-    search_fields = ['@family__family', '@family__genus', '@species', '@variety', 'synonyme', '@family__subfamily',
-                     '@family__tribus', '@family__subtribus', 'deutscher_name', 'cultivar', ]
+    # taxon names, german name and synonyms, see tools/search.py
+    search_fields = ['search_text_generated']
     save_on_top = True
 
     fieldsets = (
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('species', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='family',
+            index=models.Index(fields=['genus', 'family'], name='family_genus_family_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2 on 2026-10-18 12:47
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('species', '0002_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='species',
+            name='search_text_generated',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='species',
+            name='search_vector_generated',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+    ]
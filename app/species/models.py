@@ -1,13 +1,18 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import ungettext_lazy
 from django.utils.safestring import mark_safe
 from django.urls import reverse
 from django import forms
+from django.contrib.postgres.search import SearchVectorField
 
 from config_tables.admin import Configurable, configurable
 from ajax.autocomplete import AutoCompleteForm
-from tools import global_request
+from tools import global_request, generated_fields
+from tools.search import species_search_text
+from .prefix_index import species_index
 
 PROTECTION_OF_SPECIES_CHOICES = (
     ('LC', 'LC (Least Concern)'),
@@ -34,6 +39,8 @@ class Family(models.Model, Configurable):
         verbose_name_plural = _('genera')
         ordering = ('genus', 'family',)
         unique_together = ('family', 'subfamily', 'tribus', 'subtribus', 'genus', 'genus_author')
+        # filter by genus, see tools/db_indexes.py
+        indexes = [models.Index(fields=["genus", "family"], name="family_genus_family_idx")]
 
     _id_field = "full_name_generated"
 
@@ -70,14 +77,18 @@ class Family(models.Model, Configurable):
     delete_link_decorator.short_description = _('delete')
     delete_link_decorator.exclude_csv = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored genus, see the receivers in individuals/models/outplanting.py
+        if "genus" not in instance.get_deferred_fields():
+            instance._loaded_genus = instance.genus
+        return instance
+
     def save(self, *args, **kwargs):
         if hasattr(self, "full_name_generated"):
             self.full_name_generated = self.get_full_name()
         super(Family, self).save(*args, **kwargs)
-        # update coresponding Species.full_name_generated
-        if hasattr(Species, "full_name_generated"):
-            for i in Species.objects.filter(family=self):
-                i.save()
 
 
 class FamilyForm(AutoCompleteForm(Family)):
@@ -122,6 +133,10 @@ class Species(models.Model, Configurable):
                                                    null=True)
     comment = models.TextField(verbose_name=_('comment'), max_length=10000, blank=True, null=True)
     picture = models.ImageField(verbose_name=_('picture'), upload_to="pictures", blank=True)
+    # names of the species and its family for the changelist search, see tools/search.py
+    search_text_generated = models.TextField(default="", blank=True, editable=False)
+    # tsvector of search_text_generated, maintained by a trigger on PostgreSQL
+    search_vector_generated = SearchVectorField(null=True, editable=False)
 
     @configurable
     def get_author_name(self):
@@ -138,6 +153,7 @@ class Species(models.Model, Configurable):
     @configurable
     def __str__(self):
         return self.full_name()
+    __str__.select_related = ("family",)
 
     def full_name(self, with_author=True):
         return_string = '%s %s' % (self.family.genus, self.species)
@@ -186,12 +202,14 @@ class Species(models.Model, Configurable):
         return self.family.family
     family_single.short_description = _('family')
     family_single.admin_order_field = "family__family"
+    family_single.select_related = ("family",)
 
     @configurable
     def genus_single(self):
         return self.family.genus
     genus_single.short_description = _('genus')
     genus_single.admin_order_field = "family__genus"
+    genus_single.select_related = ("family",)
 
     @configurable
     def change_link_decorator(self):
@@ -223,6 +241,7 @@ class Species(models.Model, Configurable):
         ))
     search_individuals_link_decorator.short_description = _('individuals')
     search_individuals_link_decorator.exclude_csv = True
+    search_individuals_link_decorator.select_related = ("family",)
 
     @configurable
     def search_seeds_link_decorator(self):
@@ -233,16 +252,66 @@ class Species(models.Model, Configurable):
         ))
     search_seeds_link_decorator.short_description = _('seeds')
     search_seeds_link_decorator.exclude_csv = True
+    search_seeds_link_decorator.select_related = ("family",)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored family, see the receivers in individuals/models/outplanting.py
+        if "family_id" not in instance.get_deferred_fields():
+            instance._loaded_family = instance.family_id
+        return instance
 
     def save(self, *args, **kawrgs):
         if hasattr(self, "full_name_generated"):
             self.full_name_generated = self.full_name()
+        if hasattr(self, "search_text_generated"):
+            self.search_text_generated = self.get_search_text()
         super(Species, self).save(*args, **kawrgs)
 
-        from individuals.models import Individual
-        if hasattr(Individual, "id_name_generated"):
-            for i in Individual.objects.filter(species=self):
-                i.save()
+    def get_search_text(self):
+        return species_search_text(self)
+
+
+generated_fields.register(
+    Family, "full_name_generated", Family.get_full_name,
+    depends_on=("family", "subfamily", "tribus", "subtribus", "genus", "genus_author"),
+)
+
+generated_fields.register(
+    Species, "full_name_generated", Species.full_name,
+    depends_on=(
+        "species", "subspecies", "variety", "form", "cultivar",
+        "species_author", "subspecies_author", "variety_author", "form_author",
+        "family", "family__genus",
+    ),
+)
+
+generated_fields.register(
+    Species, "search_text_generated", Species.get_search_text,
+    depends_on=(
+        "species", "subspecies", "variety", "form", "cultivar", "deutscher_name", "synonyme",
+        "family", "family__family", "family__subfamily", "family__tribus", "family__subtribus", "family__genus",
+    ),
+)
+
+# renaming a genus or species can touch thousands of individuals
+generated_fields.propagate_in_background(Family, Species)
+
+
+@receiver(post_save, sender=Species)
+@receiver(post_delete, sender=Species)
+def species_index_species_changed(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: species_index.refresh(species=(pk, )))
+
+
+@receiver(post_save, sender=Family)
+def species_index_family_changed(sender, instance, created, **kwargs):
+    # a new family has no species, deleted species are handled above
+    if not created:
+        pk = instance.pk
+        transaction.on_commit(lambda: species_index.refresh(families=(pk, )))
 
 
 class SpeciesForm(AutoCompleteForm(Species)):
@@ -0,0 +1,129 @@
+"""
+In-memory prefix index of the species names for the autocompletes
+
+All species are kept as "genus species subsp. .. var. .. f. .. 'cultivar'"
+in a sorted list. A query like "abi al" matches the names whose first
+words start with "abi" and "al", it is answered with a bisection, the
+database is only asked for the version token, once per request:
+
+    species_index.search("abi al", limit=10)  # -> [(pk, full name), ...]
+
+The index is loaded on the first search. Species and Family changes
+update the affected entries after the commit (see the receivers in
+species/models.py) and replace a version token shared by all worker
+processes (see config_app/versions.py), so the other processes reload
+their index with their next search.
+"""
+import bisect
+import threading
+
+from config_app.versions import get_version, swap_version
+
+
+VERSION_NAME = "species-prefix-index"
+
+# values_list of Species for _entry()
+ROW_FIELDS = (
+    "pk", "family", "family__genus", "species", "subspecies", "variety", "form", "cultivar",
+    "species_author", "subspecies_author", "variety_author", "form_author",
+)
+
+
+def _entry(row):
+    """Returns (lower-case name words, pk, family pk, full name) of a Species row, see Species.full_name()"""
+    (pk, family, genus, species, subspecies, variety, form, cultivar,
+     species_author, subspecies_author, variety_author, form_author) = row
+    name = "%s %s" % (genus, species)
+    if subspecies:
+        name += " subsp. " + subspecies
+    if variety:
+        name += " var. " + variety
+    if form:
+        name += " f. " + form
+    if cultivar:
+        name += " '" + cultivar + "'"
+    full_name = name
+    author = variety_author or subspecies_author or form_author or species_author
+    if author:
+        full_name += " %s" % author
+    return tuple(name.lower().split()), pk, family, full_name
+
+
+class SpeciesPrefixIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (sorted list of entries, list of their first words for bisect, version),
+        # replaced as a whole and never modified, so searches need no lock
+        self._data = None
+
+    def clear(self):
+        with self._lock:
+            self._data = None
+
+    def _set_entries(self, entries, version):
+        entries = sorted(entries)
+        self._data = (entries, [entry[0][0] for entry in entries], version)
+
+    def build(self):
+        from .models import Species
+        version = self.get_version()
+        entries = [_entry(row) for row in Species.objects.values_list(*ROW_FIELDS).iterator()]
+        with self._lock:
+            self._set_entries(entries, version)
+
+    def get_version(self):
+        return get_version(VERSION_NAME)
+
+    def refresh(self, species=(), families=()):
+        """
+        Reloads the entries of the given Species and of all species of the given Families
+        :param species: iterable of Species pks, deleted species are removed
+        :param families: iterable of Family pks
+        """
+        from django.db.models import Q
+        from .models import Species
+        species, families = set(species), set(families)
+        previous, version = swap_version(VERSION_NAME)
+        data = self._data
+        if data is None:
+            return
+        if data[2] != previous:
+            # missed the changes of another process, reloaded with the next search
+            self.clear()
+            return
+        rows = Species.objects.filter(Q(pk__in=species) | Q(family__in=families)).values_list(*ROW_FIELDS)
+        changed = [_entry(row) for row in rows]
+        with self._lock:
+            if self._data is not data:
+                self._data = None
+                return
+            entries = [
+                entry for entry in self._data[0]
+                if entry[1] not in species and entry[2] not in families
+            ]
+            self._set_entries(entries + changed, version)
+
+    def search(self, term, limit=10):
+        """
+        :param term: words, each one a prefix of the same word of the name
+        :return: list of (pk, full name) in name order
+        """
+        words = term.lower().split()
+        if not words:
+            return []
+        if self._data is None or self._data[2] != self.get_version():
+            self.build()
+        entries, first_words, version = self._data
+
+        result = []
+        i = bisect.bisect_left(first_words, words[0])
+        while i < len(entries) and len(result) < limit and first_words[i].startswith(words[0]):
+            name, pk, family, full_name = entries[i]
+            if len(name) >= len(words) and all(map(str.startswith, name[1:], words[1:])):
+                result.append((pk, full_name))
+            i += 1
+        return result
+
+
+species_index = SpeciesPrefixIndex()
@@ -2,6 +2,9 @@ from django.template import loader
 from species.models import Species
 from django.db import connection
 from django.http import HttpResponse
+from django.utils.html import format_html, format_html_join
+
+from species.prefix_index import species_index
 
 from individuals.models import *
 from tools.permissions import *
@@ -65,24 +68,14 @@ def ajax_autocomplete_individual_species(request, limit_by):
     if (search_for == None):
         return HttpResponse(status=406)  # return 406 if no post parameter
 
-    search_for_splits = search_for.split(' ')
-    search_genus = search_for_splits[0]
-
-    if len(search_for_splits) > 1:
-        search_species = search_for_splits[1]
-        result_list = Species.objects.filter(family__genus__istartswith=search_genus).filter(
-            species__istartswith=search_species)  # [:limit_by];
-    else:
-        result_list = Species.objects.filter(family__genus__istartswith=search_genus)  # [:limit_by];
-
-    return_value = ''
-    if len(result_list) > 0:  # check if there are any results
-        for elem in result_list:
-            return_value += '<li title="' + str(elem.pk) + '">' + str(elem) + '</li>'
-        return HttpResponse('<ul>' + return_value + '</ul>')
-    else:
+    result_list = species_index.search(search_for, limit=int(limit_by))
+    if not result_list:
         return HttpResponse(status=204)  # return no content code if no results
 
+    return HttpResponse(format_html(
+        '<ul>{}</ul>', format_html_join('', '<li title="{}">{}</li>', result_list)
+    ))
+
 
 @login_required
 def ajax_autocomplete_species(request, search_item, limit_by):
@@ -1,15 +1,11 @@
 import csv
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 
 
-def csv_response(filename, headers, rows):
-
-    response = HttpResponse(content_type="text/csv")
-    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
-
-    csv_writer = csv.writer(
-        response,
+def _csv_writer(file):
+    return csv.writer(
+        file,
         delimiter=",",
         doublequote='"',
         escapechar='\\',
@@ -18,8 +14,39 @@ def csv_response(filename, headers, rows):
         quoting=csv.QUOTE_ALL,
     )
 
+
+class _Echo:
+    """File-like object that returns what is written to it"""
+    def write(self, value):
+        return value
+
+
+def csv_response(filename, headers, rows):
+
+    response = HttpResponse(content_type="text/csv")
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+
+    csv_writer = _csv_writer(response)
+
     csv_writer.writerow(headers)
     csv_writer.writerows(rows)
 
     return response
 
+
+
+def csv_streaming_response(filename, headers, rows):
+    """
+    Same as csv_response() but writes the rows while they are sent,
+    `rows` can be an iterator over a large QuerySet
+    """
+    csv_writer = _csv_writer(_Echo())
+
+    def _lines():
+        yield csv_writer.writerow(headers)
+        for row in rows:
+            yield csv_writer.writerow(row)
+
+    response = StreamingHttpResponse(_lines(), content_type="text/csv")
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
@@ -6,49 +6,32 @@ from species.models import Species, Family
 from individuals.models import Individual, Seed, Outplanting, Territory, Department
 from species.models import Species, Family
 from tickets.models import LaserGravurTicket
+from tools import generated_fields
 
 """
 
-Please add ALL dependencies here so we can arrange for re-generating the 
-fields on changes to their source
-
-    botman:
-        BotanicGarden.full_name_generated -> self
-       
-    individuals:
-        Territory.name_generated -> self
-        Territory.num_xxx -> Outplanting
-        
-        Department.num_xxx -> Outplanting
-        Department.full_code -> self, Territory.code
-        
-        Outplanting.department -> Department
-        
-        Individual.ipen_generated -> self
-        Individual.is_alive_generated -> [Outplanting,].department
-        Individual.location_generated -> [Outplanting,].department
-        Individual.name_generated -> Species.family.genus
-
-    species:
-        Family.full_name_generated -> self
-        Species.full_name_generated -> Family.genus
-
-
-Things a user can change - which needs recalculation 
-
-- on Territory.save()
-  - update Territory.name_generated
-  - when code changed:
-      - update all belonging Departments.full_code via Department.save()
-        - call all belonging Individual.calc_outplantings()
-
-- on Department.save()
-  - update full_code
-  - when changed: 
-    - call all belonging Individual.calc_outplantings()
-  - when Territory changed (Department moved to another Territory): 
-    - call old and new Territory.calc_outplanting_fields()
-    
+The dependencies of generated fields are declared next to the models
+with tools.generated_fields.register(), print them with
+
+    from tools import generated_fields
+    print("\n".join(generated_fields.describe()))
+
+Changes to a source row are propagated to the dependent rows in
+bulk passes, e.g.
+
+- Territory.code -> Department.full_code -> Individual.departments_generated
+- Family.genus -> Species.full_name_generated, Individual.id_name_generated
+- BotanicGarden.code -> Individual.ipen_generated
+
+The outplanting statistics are maintained by individuals/calc.py:
+
+- Outplanting -> Territory.num_xxx, Department.num_xxx
+- Outplanting -> Individual.departments_generated, territories_generated, is_alive_generated
+- Outplanting -> OutplantingSnapshot (statistics at any past day)
+
+The first PlantImage and its thumbnail are stored by plantimages/models.py:
+
+- PlantImage -> Individual.first_image_generated
 
 """
 
@@ -60,35 +43,71 @@ def calc_all():
     calc_botanic_gardens()
     calc_species()
     calc_outplantings()
+    calc_snapshots()
     fix_country_code()
     calc_individuals()
+    calc_images()
 
 
 def calc_outplantings():
+    from individuals.stats import use_matview, refresh_outplanting_stats, mark_columns_rebuilt
+    if use_matview():
+        print("refresh statistics view")
+        refresh_outplanting_stats()
+        return
     with transaction.atomic():
         print("calc territories")
         count = Territory.objects.all().count()
         for i, self in enumerate(Territory.objects.all()):
             if i % 10 == 0:
                 print("%s/%s" % (i, count))
-            self.calc_outplanting_fields()
+            self.rebuild_outplanting_tallies()
     with transaction.atomic():
         print("calc departments")
         count = Department.objects.all().count()
         for i, self in enumerate(Department.objects.all()):
             if i % 100 == 0:
                 print("%s/%s" % (i, count))
-            self.calc_outplanting_fields()
-
-
-def calc_individuals_outplantings():
-    with transaction.atomic():
-        print("calc individuals")
-        count = Individual.objects.all().count()
-        for i, self in enumerate(Individual.objects.all()):
-            if i % 1000 == 0:
-                print("%s/%s" % (i, count))
-            self.calc_outplantings()
+            self.rebuild_outplanting_tallies()
+    mark_columns_rebuilt()
+
+
+def calc_snapshots():
+    from individuals.snapshots import rebuild_all_snapshots
+    print("calc snapshots, wrote %s" % rebuild_all_snapshots())
+
+
+def verify_outplantings():
+    """
+    Compare the incrementally maintained counters with a full recount
+    and rebuild every Territory and Department that is wrong.
+    Returns the number of repaired objects
+    """
+    from individuals.stats import use_matview
+    if use_matview():
+        print("statistics are read from the materialized view, nothing to verify")
+        return 0
+    num_repaired = 0
+    for model in (Territory, Department):
+        for self in model.objects.all():
+            errors = self.verify_outplanting_fields()
+            if errors:
+                print("%s %s: %s" % (model._meta.verbose_name, self, ", ".join(
+                    "%s %s != %s" % (name, stored, recounted)
+                    for name, (stored, recounted) in errors.items()
+                )))
+                self.rebuild_outplanting_tallies()
+                num_repaired += 1
+    print("repaired %s territories/departments" % num_repaired)
+    return num_repaired
+
+
+def calc_individuals_outplantings(individuals=None):
+    from individuals.calc import calc_individuals_outplantings as bulk_calc
+    print("calc individuals")
+    num_updated = bulk_calc(individuals, verbose=True)
+    print("updated %s individuals" % num_updated)
+    return num_updated
 
 
 def calc_botanic_gardens():
@@ -99,20 +118,22 @@ def calc_botanic_gardens():
 
 def calc_species():
     with transaction.atomic():
-        for self in Family.objects.all():
-            self.save()
-    with transaction.atomic():
-        for self in Species.objects.all():
-            self.save()
+        print("calc species, updated %s" % (
+            generated_fields.update_all(Family) + generated_fields.update_all(Species)
+        ))
 
 
 def calc_individuals():
     with transaction.atomic():
-        for self in Territory.objects.all():
-            self.save()
-    with transaction.atomic():
-        for self in Individual.objects.all():
-            self.calc_outplantings(do_save=True)
+        print("calc individuals, updated %s" % sum(
+            generated_fields.update_all(model) for model in (Territory, Department, Individual)
+        ))
+    calc_individuals_outplantings()
+
+
+def calc_images():
+    from plantimages.models import calc_first_images
+    print("calc images, updated %s individuals" % calc_first_images())
 
 
 def fix_country_code():
@@ -0,0 +1,55 @@
+"""
+Indexes for the hot filters of the changelists, checklists and autocompletes
+
+Portable indexes are declared in the Meta of the models:
+
+- Outplanting (department, individual) WHERE plant_died IS NULL
+    living plants of a Department or Territory, checklists
+- Individual (accession_number) WHERE seed_available
+    seed changelist, ordered by accession number
+- Individual (species, accession_number)
+    changelists filtered by species, genus or family
+- Family (genus, family)
+    genus filters, the unique key starts with family
+
+The header search widgets and autocompletes filter with `icontains`,
+which PostgreSQL runs as `UPPER(column::text) LIKE UPPER(...)`.
+Trigram indexes on that expression are created by a migration on
+PostgreSQL only. Check the plans with
+
+    ./manage.py botgard_benchmark_queries --individuals 50000
+"""
+
+# (table, column) of the trigram indexes
+TRIGRAM_INDEXES = (
+    ("individuals_individual", "id_name_generated"),
+    ("individuals_individual", "ipen_generated"),
+    ("individuals_individual", "departments_generated"),
+    ("species_species", "full_name_generated"),
+    ("species_species", "species"),
+    ("species_family", "family"),
+    ("species_family", "genus"),
+)
+
+
+def trigram_index_name(table, column):
+    return "%s_%s_trgm" % (table, column)
+
+
+def create_trigram_indexes(schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "%s" ON "%s" USING gin ((UPPER("%s"::text)) gin_trgm_ops)' % (
+                trigram_index_name(table, column), table, column,
+            )
+        )
+
+
+def drop_trigram_indexes(schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS "%s"' % trigram_index_name(table, column))
@@ -0,0 +1,261 @@
+"""
+Registry of generated (denormalized) model fields and their sources
+
+Each `*_generated` field declares how it is computed and which fields it
+depends on, as lookup paths from the model that holds it:
+
+    generated_fields.register(
+        Species, "full_name_generated", Species.full_name,
+        depends_on=("species", "subspecies", "family__genus", ...),
+    )
+
+A model still computes its own generated fields in save(). When a row
+changes in a field that other models depend on (e.g. Family.genus), the
+dependent rows (Species and Individuals of that genus) are recomputed in
+chunked bulk_update passes instead of calling save() on each of them.
+Changed generated fields propagate further in the same way.
+
+A field that can be expressed in SQL passes `expression`, a function
+returning a query expression. Its dependents are then updated with
+UPDATE statements instead of being loaded, e.g. Department.full_code
+after a territory code or the full code template changed.
+
+Changes of models registered with propagate_in_background() (e.g. a genus
+rename that touches thousands of Individuals) are handed to a
+botman.PropagationJob that runs after the commit in a worker thread.
+"""
+from django.apps import apps
+from django.db import models
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver, Signal
+
+
+CHUNK_SIZE = 1000
+
+_registry = []
+# source models whose changes are propagated by a PropagationJob
+_background_models = set()
+# source model -> {field name: attname}, built on first use
+_tracked_fields = None
+
+# sent with the GeneratedField and the list of pks after rows were updated,
+# save() and the post_save signal are bypassed by the bulk updates
+fields_updated = Signal()
+
+
+class GeneratedField:
+
+    def __init__(self, model, name, compute, depends_on, on_change=None, expression=None):
+        """
+        :param model: Model class holding the field
+        :param name: name of the generated field
+        :param compute: function(instance) returning the value
+        :param depends_on: lookup paths of all fields used by `compute`
+        :param on_change: optional function(list of pks) called after rows were updated
+        :param expression: optional function() returning a query expression that
+            computes the same value as `compute` in the database
+        """
+        self.model = model
+        self.name = name
+        self.compute = compute
+        self.depends_on = tuple(depends_on)
+        self.on_change = on_change
+        self.expression = expression
+        self._sources = None
+
+    def __str__(self):
+        return "%s.%s" % (self.model.__name__, self.name)
+
+    @property
+    def sources(self):
+        """dict of source model -> list of (relation path, field name)"""
+        if self._sources is None:
+            sources = {}
+            for path in self.depends_on:
+                *relations, field = path.split("__")
+                model = self.model
+                for name in relations:
+                    model = model._meta.get_field(name).related_model
+                sources.setdefault(model._meta.concrete_model, []).append(("__".join(relations), field))
+            self._sources = sources
+        return self._sources
+
+    def get_select_related(self):
+        return sorted({relation for relations in self.sources.values() for relation, field in relations if relation})
+
+    def get_dependents(self, source_model, pks, changed_fields=None):
+        """
+        Returns a QuerySet of the rows that depend on the source rows,
+        None if the field does not depend on the changed fields
+        """
+        query = None
+        for relation, field in self.sources.get(source_model, ()):
+            if relation and (changed_fields is None or field in changed_fields):
+                condition = models.Q(**{"%s__in" % relation: pks})
+                query = condition if query is None else query | condition
+        if query is None:
+            return None
+        return self.model._base_manager.filter(query)
+
+    def update(self, qset, chunk_size=CHUNK_SIZE):
+        """
+        Recompute the field for all rows of the QuerySet, write the changed ones
+        :return: list of pks of the changed rows
+        """
+        if self.expression is not None:
+            changed = self._update_expression(qset, chunk_size)
+            self._changed(changed)
+            return changed
+
+        changed = []
+        batch = []
+        qset = qset.select_related(*self.get_select_related()).order_by("pk")
+        for obj in qset.iterator(chunk_size=chunk_size):
+            value = self.compute(obj)
+            if value != getattr(obj, self.name):
+                setattr(obj, self.name, value)
+                batch.append(obj)
+            if len(batch) >= chunk_size:
+                self._write(batch, changed)
+                batch = []
+        if batch:
+            self._write(batch, changed)
+
+        self._changed(changed)
+        return changed
+
+    def _changed(self, changed):
+        if changed:
+            if self.on_change is not None:
+                self.on_change(changed)
+            fields_updated.send(sender=self.model, field=self, pks=changed)
+
+    def _write(self, batch, changed):
+        self.model._base_manager.bulk_update(batch, [self.name])
+        changed.extend(obj.pk for obj in batch)
+
+    def _update_expression(self, qset, chunk_size):
+        expression = self.expression()
+        changed = list(
+            qset.annotate(_generated_value=expression)
+            .exclude(**{self.name: models.F("_generated_value")})
+            .order_by("pk").values_list("pk", flat=True)
+        )
+        for i in range(0, len(changed), chunk_size):
+            self.model._base_manager.filter(pk__in=changed[i:i + chunk_size]).update(**{self.name: expression})
+        return changed
+
+
+def register(model, name, compute, depends_on, on_change=None, expression=None):
+    """Declare a generated field, see GeneratedField"""
+    global _tracked_fields
+    field = GeneratedField(model, name, compute, depends_on, on_change, expression)
+    _registry.append(field)
+    _tracked_fields = None
+    return field
+
+
+def get_registered(model=None):
+    """Returns all GeneratedFields, or those held by `model`"""
+    if model is None:
+        return list(_registry)
+    model = model._meta.concrete_model
+    return [field for field in _registry if field.model._meta.concrete_model is model]
+
+
+def propagate_in_background(*models):
+    """Propagate changes of the given source models with a background job"""
+    for model in models:
+        _background_models.add(model._meta.concrete_model)
+
+
+def propagate(source_model, pks, changed_fields=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Update all generated fields of other rows that depend on the given rows.
+    :param source_model: Model class of the changed rows
+    :param pks: list of pks of the changed rows
+    :param changed_fields: set of changed field names, None for all
+    :param progress: optional function(num_done, num_total) called after each chunk,
+        num_total grows while dependents of dependents are found
+    :return: number of updated rows
+    """
+    num_updated = 0
+    num_done = num_total = 0
+    work = [(source_model._meta.concrete_model, list(pks), changed_fields)]
+    while work:
+        model, pks, fields = work.pop(0)
+        for field in _registry:
+            changed = []
+            for i in range(0, len(pks), chunk_size):
+                qset = field.get_dependents(model, pks[i:i + chunk_size], fields)
+                if qset is not None:
+                    if progress is None:
+                        changed += field.update(qset, chunk_size)
+                    else:
+                        num_rows = qset.count()
+                        num_total += num_rows
+                        changed += field.update(qset, chunk_size)
+                        num_done += num_rows
+                        progress(num_done, num_total)
+            if changed:
+                num_updated += len(changed)
+                work.append((field.model._meta.concrete_model, changed, {field.name}))
+    return num_updated
+
+
+def update_all(model, chunk_size=CHUNK_SIZE):
+    """
+    Recompute all generated fields of a model and propagate the changes
+    :return: number of updated rows
+    """
+    num_updated = 0
+    for field in get_registered(model):
+        changed = field.update(field.model._base_manager.all(), chunk_size)
+        num_updated += len(changed) + propagate(field.model, changed, {field.name}, chunk_size)
+    return num_updated
+
+
+def describe():
+    """Returns the dependency graph as list of strings"""
+    return [
+        "%s -> %s" % (field, ", ".join(field.depends_on))
+        for field in _registry
+    ]
+
+
+def _get_tracked_fields():
+    global _tracked_fields
+    if _tracked_fields is None:
+        _tracked_fields = {}
+        for field in _registry:
+            for model, relations in field.sources.items():
+                for relation, name in relations:
+                    if relation:
+                        _tracked_fields.setdefault(model, {})[name] = model._meta.get_field(name).attname
+    return _tracked_fields
+
+
+@receiver(pre_save)
+def _remember_source_values(sender, instance, raw=False, **kwargs):
+    fields = _get_tracked_fields().get(sender._meta.concrete_model)
+    if not fields or raw or instance.pk is None:
+        return
+    instance._generated_sources = sender._base_manager.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(post_save)
+def _propagate_source_changes(sender, instance, raw=False, **kwargs):
+    previous = instance.__dict__.pop("_generated_sources", None)
+    if not previous:
+        return
+    fields = _get_tracked_fields()[sender._meta.concrete_model]
+    changed = {
+        name for name, value in previous.items()
+        if getattr(instance, fields[name]) != value
+    }
+    if not changed:
+        return
+    if sender._meta.concrete_model in _background_models:
+        instance._generated_job = apps.get_model("botman", "PropagationJob").create_for(instance, changed)
+    else:
+        propagate(sender, [instance.pk], changed)
@@ -1,5 +1,4 @@
 """
-Currently unused!
 Generic code to start a worker-thread and html-respond immidiately
 
 TAKEN FROM:
@@ -0,0 +1,292 @@
+"""
+Benchmark of the canonical changelist, checklist and autocomplete queries
+
+Records the EXPLAIN plan and the timing of each query, so a lost index
+shows up before a deploy. The model autocomplete is also typed keystroke
+by keystroke to record the number of queries per keystroke, and the
+outplanting statistics backends (individuals/stats.py) are compared by
+reading the territory statistics and by applying one outplanting change:
+
+    results = run_benchmark()
+    save_results(results, "benchmark.json")
+    for message in compare(results, load_results("baseline.json")):
+        print(message)
+
+create_synthetic_data() fills the database with a large random
+collection, see ./manage.py botgard_benchmark_queries
+"""
+import re
+import json
+import time
+import random
+import datetime
+import statistics
+
+from django.db import models, connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from botman.models import BotanicGarden
+from species.models import Family, Species
+from individuals.models import Individual, Seed, Outplanting, Territory, Department
+from individuals.checklists import CHECKLIST_FIELDS, checklist_outplantings
+from individuals.calc import flush_outplanting_recalc
+from individuals.stats import use_matview, stats_annotations
+from tools.search import search_queryset
+from ajax.views import fieldvalues_queryset, get_model_fieldvalues
+
+
+PAGE_SIZE = 100
+
+
+def _bulk_create(model, objects, batch_size=1000):
+    """bulk_create that returns the stored objects on all databases"""
+    max_pk = model.objects.aggregate(max_pk=models.Max("pk"))["max_pk"] or 0
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    return list(model.objects.filter(pk__gt=max_pk).order_by("pk"))
+
+
+def create_synthetic_data(num_individuals, seed=0, verbose=False):
+    """
+    Creates random Families, Species, Territories, Departments, Individuals
+    and one or two Outplantings per Individual. No signals are sent,
+    the statistics of the locations are not updated.
+    """
+    rnd = random.Random(seed)
+    log = print if verbose else (lambda *args: None)
+
+    garden, created = BotanicGarden.objects.get_or_create(name="Benchmark garden", defaults={"code": "BENCH"})
+
+    log("creating Family")
+    families = _bulk_create(Family, [
+        Family(family="Benchfamily%s" % (i // 5), genus="Benchgenus%s" % i, full_name_generated="Benchgenus%s" % i)
+        for i in range(max(2, num_individuals // 100))
+    ])
+    log("creating Species")
+    species = _bulk_create(Species, [
+        Species(family=family, species="bench%s" % i, full_name_generated="%s bench%s" % (family.genus, i),
+                search_text_generated="%s bench%s %s" % (family.genus, i, family.family))
+        for i, family in enumerate(rnd.choice(families) for i in range(max(2, num_individuals // 10)))
+    ])
+    log("creating Territory")
+    first = Territory.objects.count()
+    territories = _bulk_create(Territory, [
+        Territory(code="B%s" % (first + i), name="Bench territory %s" % (first + i), name_generated="B%s" % (first + i))
+        for i in range(10)
+    ])
+    log("creating Department")
+    departments = _bulk_create(Department, [
+        Department(territory=territory, code="D%s" % i, name="Bench department %s %s" % (territory.code, i),
+                   full_code="%s-D%s" % (territory.code, i))
+        for territory in territories for i in range(10)
+    ])
+
+    log("creating Individual")
+    numbers = Individual.objects.aggregate(
+        accession=models.Max("accession_number"), order=models.Max("order_number"),
+    )
+    accession = (numbers["accession"] or 0) + 1
+    order = (numbers["order"] or 0) + 1
+    individuals = []
+    for i in range(num_individuals):
+        s = rnd.choice(species)
+        individuals.append(Individual(
+            accession_number=accession + i, order_number=order + i, species=s,
+            id_name_generated="%s %s" % (accession + i, s.full_name_generated),
+            ipen_country="de", ipen_transfer_restricted="0", ipen_garden_code=garden,
+            ipen_accession_number="bench-%s" % (accession + i), ipen_generated="XX-0-BENCH-%s" % (accession + i),
+            search_text_generated="%s %s XX-0-BENCH-%s %s" % (
+                accession + i, order + i, accession + i, s.search_text_generated,
+            ),
+            found_country="de", seed_available=rnd.random() < 0.2, seed_in_stock=False,
+        ))
+    individuals = _bulk_create(Individual, individuals)
+
+    log("creating Outplanting")
+    today = datetime.date.today()
+    outplantings = []
+    for individual in individuals:
+        for i in range(rnd.choice((1, 1, 2))):
+            outplantings.append(Outplanting(
+                individual=individual, department=rnd.choice(departments), date=today,
+                plant_died=today if rnd.random() < 0.3 else None,
+            ))
+    Outplanting.objects.bulk_create(outplantings, batch_size=1000)
+    return len(individuals), len(outplantings)
+
+
+def canonical_queries():
+    """
+    Returns a list of (name, QuerySet) of the queries behind the hot screens,
+    the filter values are taken from the current data
+    """
+    territory = Territory.objects.order_by("-pk").first()
+    family = Family.objects.order_by("-pk").first()
+    species = Species.objects.order_by("-pk").first()
+    genus = family.genus if family else ""
+    term = species.species if species else ""
+
+    individuals = Individual.objects.select_related("species").order_by("accession_number")
+    alive = Outplanting.objects.filter(plant_died=None, department__territory=territory)
+    return [
+        ("individual changelist", individuals[:PAGE_SIZE]),
+        ("individual header search", individuals.filter(id_name_generated__icontains=term)[:PAGE_SIZE]),
+        ("individual changelist search", search_queryset(individuals, "%s %s" % (genus, term))[:PAGE_SIZE]),
+        ("species changelist search", search_queryset(Species.objects.all(), genus)[:PAGE_SIZE]),
+        ("seed changelist", Seed.objects.filter(seed_available=True).order_by("accession_number")[:PAGE_SIZE]),
+        ("genus filter", individuals.filter(species__family__genus=genus)[:PAGE_SIZE]),
+        ("family filter", individuals.filter(species__family__family=family.family if family else "")[:PAGE_SIZE]),
+        ("alive outplantings of territory", alive.values("individual").distinct()),
+        ("territory checklist", checklist_outplantings(
+            Outplanting.objects.filter(department__territory=territory)).values_list(*CHECKLIST_FIELDS)),
+        ("species autocomplete", fieldvalues_queryset(Species, "full_name_generated", term)),
+        ("genus autocomplete", fieldvalues_queryset(Family, "genus", genus[:4] or "a")),
+    ]
+
+
+def autocomplete_keystrokes():
+    """
+    Types the name of a species into the model autocomplete
+    :return: list of (term, number of queries, ms)
+    """
+    species = Species.objects.order_by("-pk").first()
+    name = species.full_name_generated if species else "a"
+    keystrokes = []
+    for i in range(1, len(name) + 1):
+        if name[i - 1] == " ":
+            continue
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            get_model_fieldvalues(Species, "full_name_generated", name[:i])
+            ms = (time.perf_counter() - start) * 1000
+        keystrokes.append((name[:i], len(queries), ms))
+    return keystrokes
+
+
+def stats_backend_benchmark(repeat=5):
+    """
+    Reads the territory statistics and applies one outplanting change
+    with each statistics backend, "matview" only on PostgreSQL
+    :return: dict of name -> dict like run_benchmark()
+    """
+    results = {}
+    department = Department.objects.order_by("-pk").first()
+    individual = Individual.objects.order_by("-pk").first()
+    backends = ["columns"] + (["matview"] if connection.vendor == "postgresql" else [])
+    # columns first, the matview run marks the columns stale
+    for backend in backends:
+        with override_settings(OUTPLANTING_STATS_BACKEND=backend, OUTPLANTING_STATS_REFRESH="commit"):
+            qset = Territory.objects.order_by("-num_individuals")
+            if use_matview():
+                qset = qset.annotate(**stats_annotations(Territory)).order_by("-stats_num_individuals")
+            plan = qset.explain()
+            timings = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                rows = len(qset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            results["territory statistics (%s)" % backend] = {
+                "sql": str(qset.query),
+                "plan": plan,
+                "full_scans": sorted(full_scans(plan)),
+                "rows": rows,
+                "ms": round(statistics.median(timings), 3),
+            }
+
+            if department is None or individual is None:
+                continue
+            timings, num_queries = [], 0
+            for i in range(repeat):
+                sid = transaction.savepoint()
+                Outplanting.objects.create(department=department, individual=individual)
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    flush_outplanting_recalc()
+                    timings.append((time.perf_counter() - start) * 1000)
+                num_queries = max(num_queries, len(queries))
+                transaction.savepoint_rollback(sid)
+            results["outplanting change (%s)" % backend] = {
+                "sql": "",
+                "plan": "%s queries per flush" % num_queries,
+                "full_scans": [],
+                "rows": 1,
+                "ms": round(statistics.median(timings), 3),
+                "queries": num_queries,
+            }
+    return results
+
+
+def full_scans(plan):
+    """Returns the set of tables read without an index in an EXPLAIN plan"""
+    tables = set(re.findall(r"Seq Scan on (\w+)", plan))
+    for line in plan.splitlines():
+        match = re.search(r"\bSCAN (?:TABLE )?(\w+)(.*)", line)
+        if match and "USING" not in match.group(2):
+            tables.add(match.group(1))
+    return tables
+
+
+def run_benchmark(repeat=5):
+    """
+    :param repeat: number of runs of each query, the median is reported
+    :return: dict of name -> dict of plan, full_scans, rows and ms
+    """
+    results = {}
+    for name, qset in canonical_queries():
+        plan = qset.explain()
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            rows = len(qset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            "sql": str(qset.query),
+            "plan": plan,
+            "full_scans": sorted(full_scans(plan)),
+            "rows": rows,
+            "ms": round(statistics.median(timings), 3),
+        }
+
+    keystrokes = autocomplete_keystrokes()
+    results["species autocomplete keystrokes"] = {
+        "sql": "",
+        "plan": "\n".join("%s: %s queries" % (term, num_queries) for term, num_queries, ms in keystrokes),
+        "full_scans": [],
+        "rows": len(keystrokes),
+        "ms": round(statistics.median(ms for term, num_queries, ms in keystrokes), 3),
+        "queries": max(num_queries for term, num_queries, ms in keystrokes),
+    }
+
+    with transaction.atomic():
+        results.update(stats_backend_benchmark(repeat=repeat))
+    return results
+
+
+def compare(results, baseline, tolerance=2., min_ms=1.):
+    """
+    :param tolerance: a query is reported when it is this factor slower than the baseline
+    :param min_ms: timings below are never reported
+    :return: list of messages, one per regression
+    """
+    messages = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        scans = set(result["full_scans"]) - set(base["full_scans"])
+        if scans:
+            messages.append("%s: table scan on %s" % (name, ", ".join(sorted(scans))))
+        if result.get("queries", 0) > base.get("queries", 0):
+            messages.append("%s: %s queries, was %s" % (name, result["queries"], base["queries"]))
+        if result["ms"] > min_ms and result["ms"] > base["ms"] * tolerance:
+            messages.append("%s: %sms, was %sms" % (name, result["ms"], base["ms"]))
+    return messages
+
+
+def save_results(results, filename):
+    with open(filename, "w") as fp:
+        json.dump(results, fp, indent=2)
+
+
+def load_results(filename):
+    with open(filename) as fp:
+        return json.load(fp)
@@ -0,0 +1,122 @@
+"""
+Full-text search of the Species and Individual changelists
+
+The searchable names of a row, including the names of its related rows,
+are joined into the generated `search_text_generated` column:
+
+- Species: taxon names of the species and its family, german name and synonyms
+- Individual: accession and order number, IPEN, source garden
+  and the search text of its species
+
+The columns are kept up to date by `save()` and tools.generated_fields.
+
+On PostgreSQL a trigger converts the text into the `search_vector_generated`
+tsvector column, which has a GIN index. A search of "abies alb" finds
+the rows that contain words starting with "abies" and "alb". Other
+databases search the text column with `icontains` for each word.
+"""
+import re
+
+from django.db import connections
+from django.utils.text import smart_split, unescape_string_literal
+
+
+# tables with search_text_generated and search_vector_generated
+SEARCH_TABLES = ("species_species", "individuals_individual")
+
+SEARCH_CONFIG = "simple"
+
+
+def _join(*values):
+    return " ".join(str(value) for value in values if value not in (None, ""))
+
+
+def species_search_text(species):
+    """Search text of a Species, reads species.family"""
+    family = species.family
+    return _join(
+        family.genus, species.species, species.subspecies, species.variety, species.form, species.cultivar,
+        family.family, family.subfamily, family.tribus, family.subtribus,
+        species.deutscher_name, species.synonyme,
+    )
+
+
+def individual_search_text(individual, species_text, ipen):
+    """Search text of an Individual, reads individual.source"""
+    return _join(
+        individual.accession_number, individual.order_number, ipen,
+        individual.source.name if individual.source_id else None,
+        species_text,
+    )
+
+
+def create_search_triggers(schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("""
+        CREATE OR REPLACE FUNCTION botgard_search_vector() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector_generated := to_tsvector('%s', coalesce(NEW.search_text_generated, ''));
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """ % SEARCH_CONFIG)
+    for table in SEARCH_TABLES:
+        schema_editor.execute(
+            'CREATE TRIGGER "%s_search_vector" BEFORE INSERT OR UPDATE OF search_text_generated ON "%s" '
+            'FOR EACH ROW EXECUTE PROCEDURE botgard_search_vector()' % (table, table)
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "%s_search_vector" ON "%s" USING gin (search_vector_generated)' % (
+                table, table,
+            )
+        )
+
+
+def drop_search_triggers(schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute('DROP INDEX IF EXISTS "%s_search_vector"' % table)
+        schema_editor.execute('DROP TRIGGER IF EXISTS "%s_search_vector" ON "%s"' % (table, table))
+    schema_editor.execute("DROP FUNCTION IF EXISTS botgard_search_vector()")
+
+
+def search_words(search_term):
+    """Splits a search term like the admin does, quoted phrases are kept together"""
+    words = []
+    for bit in smart_split(search_term):
+        if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+            bit = unescape_string_literal(bit)
+        if bit.strip():
+            words.append(bit.strip())
+    return words
+
+
+def search_queryset(queryset, search_term):
+    """
+    Filters a Species or Individual queryset by all words of the search term
+    """
+    words = search_words(search_term)
+    if connections[queryset.db].vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery
+        # the words are split like to_tsvector does, every part is a prefix
+        parts = [part for word in words for part in re.split(r"[\W_]+", word.lower()) if part]
+        if not parts:
+            return queryset
+        query = " & ".join("%s:*" % part for part in parts)
+        return queryset.filter(search_vector_generated=SearchQuery(query, config=SEARCH_CONFIG, search_type="raw"))
+    for word in words:
+        queryset = queryset.filter(search_text_generated__icontains=word)
+    return queryset
+
+
+class SearchTextAdminMixin:
+    """
+    ModelAdmin mixin that searches the `search_text_generated` column instead of
+    the `search_fields`, which are still needed to show the search box
+    """
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search_queryset(queryset, search_term), False